@@ -4,11 +4,13 @@ Program for applying curve fitting/filtering of time series data and
 printing results.
 
 Takes an input file containing two columns of data, a decimal date and value.
+An input file ending in .npy is read as a numpy array with two columns.
 Applies curve fitting algorithm to the data, and depending on options,
 prints results to stdout (default) or to files if specified.
 
 General python requirements:
 	numpy, scipy, dateutil
+	pandas and pyarrow for parquet output, xarray for netcdf output (optional)
 
 ccgg python requirements:
 	ccgfilt - curve fitting/filtering
@@ -20,11 +22,11 @@ from __future__ import print_function
 import sys
 import optparse
 
+import numpy
 from dateutil.parser import parse
-from dateutil.rrule import rrule, DAILY
 
 import ccgfilt
-from ccgdates import calendarDate, decimalDateFromDatetime, datetimeFromDecimalDate
+from ccgdates import calendarDate, calendarDateArray, decimalDateFromDatetime64, datetimeFromDecimalDate
 
 ##########################################################################
 def check_export(options):
@@ -52,58 +54,55 @@ def export_data(options, filt):
 	""" print out the curve data """
 
 	if options.sample:
-		if options.samplefile:
-			try:
-				fp = open(options.samplefile, "w")
-			except IOError as e:
-				sys.exit("Can't open file for writing. %s" % e)
-
-		else:
-			fp = sys.stdout
-
-		export_dates(options, fp, filt, filt.xp)
+		export_dates(options, options.samplefile, filt, filt.xp, sample=True)
 
 	if options.equal or options.user:
-		if options.file:
-			try:
-				fp = open(options.file, "w")
-			except IOError as e:
-				sys.exit("Can't open file for writing. %s" % e)
-
-		else:
-			fp = sys.stdout
-
 		if options.equal:
 			# Create a new list of dates at sample interval to give to export_dates().
 			# Not quite the same as filt.xinterp because it takes into account leap years
-			dates = rrule(DAILY, interval=int(filt.sampleinterval), dtstart=options.startdate, until=options.lastdate)
-			xdates = [decimalDateFromDatetime(dt) for dt in dates]
+			start = numpy.datetime64(options.startdate, 's')
+			stop = numpy.datetime64(options.lastdate, 's') + numpy.timedelta64(1, 's')	# include last date
+			dates = numpy.arange(start, stop, numpy.timedelta64(int(filt.sampleinterval), 'D'))
+			xdates = decimalDateFromDatetime64(dates)
 			if xdates[-1] > filt.xp[-1]:
 				xdates[-1] = filt.xp[-1]  # avoid problems with rounding and interpolation in ccgfilt
 			if xdates[0] < filt.xp[0]:
 				xdates[0] = filt.xp[0]  # avoid problems with rounding and interpolation in ccgfilt
 
 		else:
-			f = open(options.user)
-			xdates = [float(line.split()[0]) for line in f]
-			f.close()
+			try:
+				xdates = numpy.loadtxt(options.user, usecols=0, ndmin=1)
+			except (IOError, ValueError) as e:
+				sys.exit("Cannot read user dates file. %s" % e)
 
 
-		export_dates(options, fp, filt, xdates)
+		export_dates(options, options.file, filt, xdates)
 
 
 ##########################################################################
-def export_dates(options, fp, filt, x):
-	""" Export (print) data to file pointer fp at dates given by x.
-	The values to print are given as boolean flags in the export class.
-	Some values can only be printed at sample dates, i.e. original data and residuals
-	"""
+def export_columns(options, filt, x, sample=False):
+	""" Get the columns of data to export at dates given by x.
+	The values to include are given as boolean flags in options.
+	Some values can only be included at sample dates, i.e. original data and residuals
 
-	if options.showheader:
-		export_header(options, fp)
+	Returns a list of (name, format, values) tuples, date columns first.
+	"""
 
 	frmt = "%13.6e"
 
+	x = numpy.asarray(x, dtype=float)
+
+	columns = []
+	if options.cal:
+		(yr, mon, dy, hr, mn, sec) = calendarDateArray(x)
+		columns.append(("year", "%4d", yr))
+		columns.append(("month", " %02d", mon))
+		columns.append(("day", " %02d", dy))
+		if options.hour:
+			columns.append(("hour", " %2d", hr))
+	else:
+		columns.append(("date", "%13.8f", x))
+
 	h = filt.getHarmonicValue(x)	# harmonics
 	p = filt.getPolyValue(x)	# poly
 	s = filt.getSmoothValue(x)	# function + short term smoothing
@@ -111,35 +110,119 @@ def export_dates(options, fp, filt, x):
 	g = filt.getGrowthRateValue(x)	# growth rate, derivative of trend
 	f = filt.getFunctionValue(x)    # function, poly + harmonics
 
-	for i, xp in enumerate(x):
-		if options.cal:
-			(yr, mon, dy, hr, mn, sec) = calendarDate(xp)
-			if options.hour:
-				print("%4d %02d %02d %2d" % (yr, mon, dy, hr), end='', file=fp)
-			else:
-				print("%4d %02d %02d" % (yr, mon, dy), end='', file=fp)
-		else:
-			print("%13.8f" % xp, end='', file=fp)
+	# make sure the names are the same as in export_header()
+	if sample and options.orig:    columns.append(("value", frmt, filt.yp))
+	if options.func:               columns.append(("function", frmt, f))
+	if options.poly:               columns.append(("polynomial", frmt, p))
+	if options.smooth:             columns.append(("smooth", frmt, s))
+	if options.trend:              columns.append(("trend", frmt, t))
+	if sample and options.detrend: columns.append(("detrended", frmt, filt.yp - t))
+	if options.smcycle:            columns.append(("smooth_cycle", frmt, s - t))
+	if options.harm:               columns.append(("harmonics", frmt, h))
+	if sample and options.res:     columns.append(("residuals", frmt, filt.yp - f))
+	if options.smres:              columns.append(("smooth_resid", frmt, s - f))
+	if options.trres:              columns.append(("trend_resid", frmt, t - p))
+	if sample and options.ressm:   columns.append(("resid_smooth", frmt, filt.yp - s))
+	if options.gr:                 columns.append(("growth_rate", frmt, g))
+
+	return columns
+
+
+##########################################################################
+def export_dates(options, filename, filt, x, sample=False):
+	""" Export data to filename (stdout if None) at dates given by x.
+	The values to export are given as boolean flags in options.
+	Values that are only available at sample dates, i.e. original data and
+	residuals, are included only if sample is True.
+
+	The output format is set by options.outformat.
+	"""
 
-		if options.sample and options.orig:    print(frmt % filt.yp[i], end='', file=fp)
-		if options.func:                       print(frmt % f[i], end='', file=fp)
-		if options.poly:                       print(frmt % p[i], end='', file=fp)
-		if options.smooth:                     print(frmt % s[i], end='', file=fp)
-		if options.trend:                      print(frmt % (t[i]), end='', file=fp)
-		if options.sample and options.detrend: print(frmt % (filt.yp[i] - t[i]), end='', file=fp)
-		if options.smcycle:                    print(frmt % (s[i] - t[i]), end='', file=fp)
-		if options.harm:                       print(frmt % (h[i]), end='', file=fp)
-		if options.sample and options.res:     print(frmt % (filt.yp[i] - f[i]), end='', file=fp)
-		if options.smres:                      print(frmt % (s[i] - f[i]), end='', file=fp)
-		if options.trres:                      print(frmt % (t[i] - p[i]), end='', file=fp)
-		if options.sample and options.ressm:   print(frmt % (filt.yp[i] - s[i]), end='', file=fp)
-		if options.gr:                         print(frmt % (g[i]), end='', file=fp)
+	columns = export_columns(options, filt, x, sample)
 
-		print(file=fp)
+	if options.outformat != "text":
+		if filename is None:
+			sys.exit("An output file is required for --outformat=%s" % options.outformat)
+		export_binary(options.outformat, filename, columns)
+		return
+
+	if filename is None:
+		fp = sys.stdout
+	else:
+		try:
+			fp = open(filename, "w")
+		except IOError as e:
+			sys.exit("Can't open file for writing. %s" % e)
+
+	if options.showheader:
+		export_header(options, fp, sample)
+
+	frmt = "".join([c[1] for c in columns])
+	data = numpy.column_stack([c[2] for c in columns])
+	write_text(fp, frmt, data)
+
+	if fp is not sys.stdout:
+		fp.close()
+
+
+##########################################################################
+def write_text(fp, frmt, data, chunksize=100000):
+	""" Write rows of data to file pointer fp, formatted with frmt.
+	Formats chunksize rows at a time with one string format operation,
+	which is faster than formatting each row (or value) separately.
+	"""
+
+	rowfrmt = frmt + "\n"
+	for i in range(0, data.shape[0], chunksize):
+		chunk = data[i:i+chunksize]
+		fp.write((rowfrmt * chunk.shape[0]) % tuple(chunk.ravel().tolist()))
 
 
 ##########################################################################
-def export_header(options, fp):
+def export_binary(outformat, filename, columns):
+	""" Write columns of data to filename in a binary format.
+
+	outformat is one of
+		npy - numpy structured array
+		parquet - parquet table, requires pandas and pyarrow (or fastparquet)
+		netcdf - netcdf file, requires xarray
+	"""
+
+	if outformat == "npy":
+		data = numpy.zeros(len(columns[0][2]), dtype=[(name, numpy.asarray(values).dtype) for name, frmt, values in columns])
+		for name, frmt, values in columns:
+			data[name] = values
+		numpy.save(filename, data)
+
+	elif outformat == "parquet":
+		try:
+			import pandas
+		except ImportError:
+			sys.exit("pandas is required for --outformat=parquet")
+
+		try:
+			import pyarrow
+		except ImportError:
+			try:
+				import fastparquet
+			except ImportError:
+				sys.exit("pyarrow or fastparquet is required for --outformat=parquet")
+
+		df = pandas.DataFrame(dict([(name, values) for name, frmt, values in columns]))
+		df.to_parquet(filename, index=False)
+
+	elif outformat == "netcdf":
+		try:
+			import xarray
+		except ImportError:
+			sys.exit("xarray is required for --outformat=netcdf")
+
+		ds = xarray.Dataset(dict([(name, ("time", values)) for name, frmt, values in columns]))
+		ds.to_netcdf(filename)
+
+
+##########################################################################
+def export_header(options, fp, sample=False):
 	""" Export a line with column header names to file pointer fp.
 	"""
 
@@ -147,20 +230,20 @@ def export_header(options, fp):
 
 	print(frmt % "date", end='', file=fp)
 
-	# make sure these are in same order as in export_dates()
-	if options.sample and options.orig:    print(frmt % "value", end='', file=fp)
-	if options.func:                       print(frmt % "function", end='', file=fp)
-	if options.poly:                       print(frmt % "polynomial", end='', file=fp)
-	if options.smooth:                     print(frmt % "smooth", end='', file=fp)
-	if options.trend:                      print(frmt % "trend", end='', file=fp)
-	if options.sample and options.detrend: print(frmt % "detrended", end='', file=fp)
-	if options.smcycle:                    print(frmt % "smooth_cycle", end='', file=fp)
-	if options.harm:                       print(frmt % "harmonics", end='', file=fp)
-	if options.sample and options.res:     print(frmt % "residuals", end='', file=fp)
-	if options.smres:                      print(frmt % "smooth_resid", end='', file=fp)
-	if options.trres:                      print(frmt % "trend_resid", end='', file=fp)
-	if options.sample and options.ressm:   print(frmt % "resid_smooth", end='', file=fp)
-	if options.gr:                         print(frmt % "growth_rate", end='', file=fp)
+	# make sure these are in same order as in export_columns()
+	if sample and options.orig:    print(frmt % "value", end='', file=fp)
+	if options.func:               print(frmt % "function", end='', file=fp)
+	if options.poly:               print(frmt % "polynomial", end='', file=fp)
+	if options.smooth:             print(frmt % "smooth", end='', file=fp)
+	if options.trend:              print(frmt % "trend", end='', file=fp)
+	if sample and options.detrend: print(frmt % "detrended", end='', file=fp)
+	if options.smcycle:            print(frmt % "smooth_cycle", end='', file=fp)
+	if options.harm:               print(frmt % "harmonics", end='', file=fp)
+	if sample and options.res:     print(frmt % "residuals", end='', file=fp)
+	if options.smres:              print(frmt % "smooth_resid", end='', file=fp)
+	if options.trres:              print(frmt % "trend_resid", end='', file=fp)
+	if sample and options.ressm:   print(frmt % "resid_smooth", end='', file=fp)
+	if options.gr:                 print(frmt % "growth_rate", end='', file=fp)
 
 	print(file=fp)
 
@@ -171,28 +254,35 @@ def read_data(filename=None):
 	# Format is always two columns,
 	# the first column a decimal date value, (e.g. 2010.5 is halfway through 2010)
 	# the second column is the corrsponding measurement value.
+	#
+	# A file ending in .npy is read as a memory mapped numpy array
+	# with two columns.
 	"""
 
 	if filename is None:
 		fp = sys.stdin
-	else:
+	elif filename.endswith(".npy"):
 		try:
-			fp = open(filename)
-		except IOError as e:
-			sys.exit("Cannot open input file. %s" % e)
+			a = numpy.load(filename, mmap_mode="r")
+		except (IOError, ValueError) as e:
+			sys.exit("Cannot read input file. %s" % e)
 
+		return a[:, 0], a[:, 1]
 
-	x = []
-	y = []
-	for line in fp:
-		(xv, yv) = line.split()
-		x.append(float(xv))
-		y.append(float(yv))
+	else:
+		fp = filename
 
-	fp.close()
+	try:
+		a = numpy.loadtxt(fp, ndmin=2)
+	except IOError as e:
+		sys.exit("Cannot open input file. %s" % e)
+	except ValueError as e:
+		sys.exit("Cannot read input file. %s" % e)
 
+	if a.shape[1] != 2:
+		sys.exit("Input data must have two columns.")
 
-	return x, y
+	return a[:, 0], a[:, 1]
 
 
 #########################################################################
@@ -222,6 +312,7 @@ group.add_option('--hour', action="store_true", default=False, help="Include hou
 group.add_option('--date', help="Output data starting at date.")
 group.add_option('--user', help="Output data based on user supplied dates in file.")
 group.add_option('--showheader', action="store_true", default=False, help="Include header on output to identify columns.")
+group.add_option('--outformat', default="text", choices=["text", "npy", "parquet", "netcdf"], help="Format of output data files: text (default), npy, parquet or netcdf. Formats other than text require --file or --samplefile.")
 parser.add_option_group(group)
 
 
@@ -122,6 +122,129 @@ def calendarDate (decyear):
 	return dyr,month,day,hour,minute,seconds
 
 
+###################################################
+def isLeapYear(year):
+	""" Check if year is a leap year. year can be a single value or a numpy array """
+
+	return ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+
+###################################################
+# Day of year at the start of each month, with an extra value for the end of the year.
+# First row is for normal years, second row is for leap years.
+_month_start = numpy.array([
+	[0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334, 365],
+	[0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335, 366],
+])
+
+###################################################
+def decimalDateArray(year, month, day, hour=0, minute=0, second=0):
+	""" Convert arrays of date and time values to fractional years.
+	Array version of decimalDate().
+	"""
+
+	year = numpy.asarray(year, dtype=int)
+	month = numpy.asarray(month, dtype=int)
+	day = numpy.asarray(day, dtype=int)
+
+	if numpy.any((month < 1) | (month > 12)):
+		raise ValueError("Month is out of range")
+
+	if numpy.any((day < 1) | (day > 31)):
+		raise ValueError("Day is out of range")
+
+	if numpy.any((numpy.asarray(hour) < 0) | (numpy.asarray(hour) > 23)):
+		raise ValueError("Hour is out of range")
+
+	if numpy.any((numpy.asarray(minute) < 0) | (numpy.asarray(minute) > 59)):
+		raise ValueError("Minute is out of range")
+
+	if numpy.any((numpy.asarray(second) < 0) | (numpy.asarray(second) > 59)):
+		raise ValueError("Second is out of range")
+
+	leap = isLeapYear(year)
+	doy = _month_start[leap.astype(int), month-1] + day
+	soy = (doy-1)*86400 + numpy.multiply(hour, 3600) + numpy.multiply(minute, 60) + second
+
+	dd = year + soy/numpy.where(leap, 3.16224e7, 3.1536e7)
+
+	return dd
+
+###################################################
+def _secondOfYearArray(decyear):
+	""" Split an array of decimal dates into year and second of the year,
+	rounded to the nearest second.
+	"""
+
+	decyear = numpy.asarray(decyear, dtype=float)
+
+	dyr = numpy.floor(decyear).astype(int)
+	fyr = decyear - dyr
+
+	ndays = 365 + isLeapYear(dyr)
+	nsec = numpy.round(fyr * ndays * 86400).astype(numpy.int64)
+
+	# rounding up to the end of the year is the start of next year
+	nextyear = nsec >= ndays * 86400
+	dyr = numpy.where(nextyear, dyr+1, dyr)
+	nsec = numpy.where(nextyear, 0, nsec)
+
+	return dyr, nsec
+
+###################################################
+def calendarDateArray(decyear):
+	""" Convert an array of decimal dates to calendar components.
+	Array version of calendarDate(), but uses the full gregorian leap
+	year rule, which gives the same results for years 1901-2099.
+	Don't use for resolution less than 1 second.
+
+	Returns 6 integer arrays of year, month, day, hour, minute, second
+	"""
+
+	dyr, nsec = _secondOfYearArray(decyear)
+
+	ndays = nsec // 86400
+	doy = ndays + 1
+
+	starts = _month_start[isLeapYear(dyr).astype(int)]
+	month = numpy.sum(starts[..., 1:12] < doy[..., numpy.newaxis], axis=-1) + 1
+	day = doy - numpy.take_along_axis(starts, (month-1)[..., numpy.newaxis], axis=-1)[..., 0]
+
+	nsecs = nsec - ndays*86400
+	hour = nsecs // 3600
+	minute = (nsecs - hour*3600) // 60
+	seconds = nsecs - hour*3600 - minute*60
+
+	return dyr, month, day, hour, minute, seconds
+
+###################################################
+def datetime64FromDecimalDate(decyear):
+	""" Convert an array of decimal dates to numpy datetime64 values,
+	with a resolution of 1 second.
+	"""
+
+	dyr, nsec = _secondOfYearArray(decyear)
+
+	yearstart = (dyr - 1970).astype("datetime64[Y]").astype("datetime64[s]")
+
+	return yearstart + nsec.astype("timedelta64[s]")
+
+###################################################
+def decimalDateFromDatetime64(dt):
+	""" Convert an array of datetime64 values (or anything numpy can convert
+	to datetime64, e.g. a list of datetimes) to fractional years.
+	Array version of decimalDateFromDatetime().
+	"""
+
+	dt = numpy.asarray(dt, dtype="datetime64[s]")
+
+	year = dt.astype("datetime64[Y]")
+	soy = (dt - year).astype(numpy.int64)
+	year = year.astype(int) + 1970
+
+	dd = year + soy/numpy.where(isLeapYear(year), 3.16224e7, 3.1536e7)
+
+	return dd
+
 ###################################################
 def to_mmdd (year, doy):
 
@@ -259,11 +382,10 @@ def dateFromDecimalDate(dd):
 	return dt
 
 def dec2date(dd):
+	""" Convert a numpy array of decimal dates to a 2d array, with one row of
+	(year, month, day, hour, minute, second) for each date.
+	"""
 
-	a = numpy.empty((dd.size, 6))
-	# dd is a numpy array of decimal dates
-	for i in range(dd.size):
-		yr, mon, dy, hr, mn, sc = calendarDate(dd[i])
-		a[i] = (yr, mon, dy, hr, mn, sc)
+	a = numpy.column_stack(calendarDateArray(numpy.ravel(dd))).astype(float)
 
 	return a
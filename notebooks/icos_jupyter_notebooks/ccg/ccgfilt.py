@@ -16,14 +16,33 @@ The function to be fit to the data is specified in the routines 'fitFunc' and 'h
 from __future__ import print_function
 
 import datetime
+import collections
+import multiprocessing
 
 from math import pi, sqrt, atan2, sin, cos, pow, ceil, log
 from scipy import optimize
+from scipy import linalg
 from scipy import stats
 from scipy import interpolate
-from scipy import fftpack
+from scipy import fft as sp_fft
 import numpy
 
+try:
+	from ccg import ccgdates
+except ImportError:
+	import ccgdates
+
+
+# Cache of filter impulse response weights used in the filter variance
+# calculation, keyed by (cutoff, sample interval in years).
+_weights_cache = {}
+
+# Cache of low-pass filter values at the fft frequencies, keyed by
+# (length of the fft data, sample interval in years, cutoff in days).
+_response_cache = {}
+
+# Results of filtering one series with batchFilter.
+FilterResult = collections.namedtuple("FilterResult", ["xinterp", "smooth", "trend", "deriv", "params", "covar"])
 
 #--------------------------------------------------
 # Define the function we are trying to fit
@@ -79,6 +98,159 @@ def errfunc(p, x, y, numpoly, numharm):
 
 	return y - fitFunc(p, x, numpoly, numharm)
 
+#--------------------------------------------------
+def designMatrix(x, numpoly, numharm):
+	""" Create the design matrix of the function without gain factor at times x.
+	Each column is the partial derivative of the function with respect to one
+	parameter, in the same order as params, i.e.
+
+		[1, x, x^2 ... | sin(2*pi*x), cos(2*pi*x), sin(4*pi*x), cos(4*pi*x) ...]
+	"""
+
+	xa = numpy.asarray(x, dtype=float)
+	A = numpy.empty((xa.size, numpoly + 2*numharm))
+
+	# polynomial part
+	if numpoly > 0:
+		A[:, :numpoly] = numpy.vander(xa, numpoly, increasing=True)
+
+	# harmonic part
+	pi2 = 2*pi*xa
+	for i in range(numharm):
+		ix = 2*i + numpoly
+		A[:, ix] = numpy.sin((i+1)*pi2)
+		A[:, ix+1] = numpy.cos((i+1)*pi2)
+
+	return A
+
+#--------------------------------------------------
+def linearFit(x, y, numpoly, numharm, prev=None):
+	""" Linear least squares fit of the function without gain factor.
+	Without the gain factor the function is linear in its parameters, so
+	it can be solved directly with a QR decomposition of the design matrix
+	instead of iterating with optimize.leastsq.
+
+	If prev is given, it is the qr value returned from a previous fit, and the
+	points x, y are added to that fit.  The result is the same as fitting all
+	of the points at once, but only needs the new points.
+
+	Returns the parameters, the unscaled covariance matrix inv(A^T A),
+	which is the same as the cov_x value returned by optimize.leastsq,
+	and a tuple qr = (R, Q^T y) that can be used to update the fit.
+	"""
+
+	A = designMatrix(x, numpoly, numharm)
+	y = numpy.asarray(y, dtype=float)
+	if prev is not None:
+		A = numpy.vstack((prev[0], A))
+		y = numpy.concatenate((prev[1], y))
+
+	q, r = numpy.linalg.qr(A)
+	qty = numpy.dot(q.T, y)
+
+	params = linalg.solve_triangular(r, qty)
+
+	# inv(A^T A) = inv(R) * inv(R)^T
+	rinv = linalg.solve_triangular(r, numpy.identity(r.shape[0]))
+	covar = numpy.dot(rinv, rinv.T)
+
+	return params, covar, (r, qty)
+
+#--------------------------------------------------
+def vfilt(freq, sigma, power):
+	""" vectorized version of getting filter value at a frequency
+	input:
+		freq - array of frequencies
+		sigma - cutoff value in cycles/year
+		power - integer value for f/fc^power
+	returns:
+		array of filter values at each frequency
+
+	the clip statement insures against underflow, although
+	numpy seems to handle it internally anyway
+	"""
+
+	z = numpy.power((freq/sigma), power)
+	z = numpy.clip(z, 0, 20.0)
+	f = 1.0 / numpy.power(2.0, z)
+	return f
+
+#--------------------------------------------------
+def filterResponse(n, dinterv, cutoff):
+	""" Get the low-pass filter values at each frequency of a real fft of n data values.
+	input:
+		n - number of data values in the fft
+		dinterv - sampling interval in years
+		cutoff - cutoff value in days
+	returns:
+		array of filter values at each frequency
+
+	The values are cached in _response_cache, so they are computed only
+	once for each fft length, sampling interval and cutoff.
+	"""
+
+	key = (n, dinterv, cutoff)
+	if key not in _response_cache:
+		cf = cutoff/365.0	# convert cutoff to years
+		cutoff2 = 1.0/cf	# change to cycles/year
+
+		freq = sp_fft.rfftfreq(n, dinterv)	# get array of frequencies
+		_response_cache[key] = vfilt(freq, cutoff2, 6)	# get filter value at frequencies
+
+	return _response_cache[key]
+
+#--------------------------------------------------
+def fftLength(n):
+	""" Length of the zero padded data used in the fft, the next power of 2 of n.
+	This makes it the same method used in c version.
+	"""
+
+	return int(pow(2, ceil(log(n, 2))))
+
+#--------------------------------------------------
+class FFTBackend(object):
+	""" Real fft routines used by ccgFilter, using scipy.fft.
+
+	Input Parameters
+	----------
+	workers : int
+	    Number of threads to use for the fft.  -1 uses all cpus.
+	    Optional.  Default is 1
+	pow2 : boolean
+	    If True, zero pad the data to the next power of 2 of the data length,
+	    the same as the c version.  If False, zero pad only to the next length
+	    that scipy.fft can do fast, which uses less memory and time for long series
+	    but gives slightly different results near the ends of the data.
+	    Optional.  Default is True
+	"""
+
+	def __init__(self, workers=1, pow2=True):
+
+		self.workers = workers
+		self.pow2 = pow2
+
+	def length(self, n):
+		""" Length of the zero padded data for n data values """
+
+		if self.pow2:
+			return fftLength(n)
+		else:
+			return sp_fft.next_fast_len(n, real=True)
+
+	def rfft(self, a, n=None):
+		""" Real fft of a, zero padded to n values """
+
+		return sp_fft.rfft(a, n=n, workers=self.workers)
+
+	def irfft(self, a, n):
+		""" Inverse of rfft, for n data values """
+
+		return sp_fft.irfft(a, n=n, workers=self.workers)
+
+
+# fft backend used when one is not given to ccgFilter
+default_fft_backend = FFTBackend()
+
 #--------------------------------------------------
 def partial(n, x, numpoly):
 	""" calculate partial derivative of function with respect to parameter n at time x """
@@ -136,9 +308,15 @@ class ccgFilter(object):
 	    Set to True if you want to include a gain factor to the harmonic amplitude.
 	    This means the harmonics part of the function will have a linearly increasing
 	    or decreasing amplitude with time.
+	    Without the gain factor the function is linear in its parameters and is fit
+	    with a direct linear least squares solve, otherwise optimize.leastsq is used.
 	debug: boolean
 	    If true, print out extra information during calculations.
 	    Optional.  Default is false
+	fftbackend: FFTBackend
+	    fft routines and padding to use for the filter.
+	    Optional.  Default is default_fft_backend, which uses power of 2 padding
+	    as in the c version.
 
 
 	Attributes
@@ -234,7 +412,7 @@ class ccgFilter(object):
 	  Returns the value of the filter for frequencies 0 - 10 cycles/year at given cutoff
 
 	getMonthlyMeans()
-	  Return of list of tuples containing monthy means from the smoothed curve.
+	  Return a numpy structured array containing monthy means from the smoothed curve.
 	  The value of the curve is computed at every sample interval, then summed up for each
 	  month and the average computed.
 
@@ -242,9 +420,13 @@ class ccgFilter(object):
 	  Get the dates when the smoothed curve crosses the trend curve.
 	  That is, when the detrended smooth seasonal cycle crosses 0.
 
+	update(xnew, ynew)
+	  Add new data after the end of the current data, and update the
+	  function fit and the smoothed curves near the end of the data.
+
 	"""
 
-	def __init__(self, xp, yp, shortterm=80, longterm=667, sampleinterval=0, numpolyterms=3, numharmonics=4, timezero=-1, gap=0, use_gain_factor=False, debug=False):
+	def __init__(self, xp, yp, shortterm=80, longterm=667, sampleinterval=0, numpolyterms=3, numharmonics=4, timezero=-1, gap=0, use_gain_factor=False, debug=False, fftbackend=None):
 
 		t0 = datetime.datetime.now()
 
@@ -317,6 +499,15 @@ class ccgFilter(object):
 			self.timezero = timezero
 		self.debug = debug
 		self.numpm = self.numpoly + 2*self.numharm
+		if fftbackend is None:
+			self.fftbackend = default_fft_backend
+		else:
+			self.fftbackend = fftbackend
+
+		self.gap = gap
+
+		# smooth and trend curves at xinterp, computed on first use
+		self._curves = {}
 
 		# apply filter to data
 		self._filter_data(gap)
@@ -352,15 +543,46 @@ class ccgFilter(object):
 		# Remove the timezero value from the x data so that coefficients will be relative to the timezero date
 		work = self.xp - self.timezero
 
-
 		# Fit the function to the data
-		pm = [1.0] * self.numpm		# initial parameter values set to 1
-		if self.use_gain_factor:	# add amplitude gain factor parameter with initial value of 0
-			pm.append(0)
-			self.numpm += 1
-		self.params, self.covar, info, mesg, ier = optimize.leastsq(errfunc, pm, full_output=1, args=(work, self.yp, self.numpoly, self.numharm))
+		self._fit_function(work)
+
+		# Smooth the residuals from the function
+		self.xinterp, self.smooth, self.trend, self.yinterp = self._smooth_resid(work, self.resid, gap)
+		self.ninterp = len(self.xinterp)
+
+		# add timezero back in to interpolated values
+		self.xinterp = self.xinterp + self.timezero
+
+
+	#------------------------------------------------------------
+	def _fit_function(self, work, nnew=0):
+		""" Fit the function to the data at times work (xp - timezero).
+		If nnew > 0, the last nnew points have been added since the previous fit,
+		and the fit starts from the previous results.
+		"""
+
+		# Without the gain factor the function is linear in the parameters and
+		# can be solved directly. The gain factor model needs the nonlinear solver.
+		if self.use_gain_factor:
+			if nnew > 0:
+				pm = self.params		# start from previous parameters
+			else:
+				self.numpm = self.numpoly + 2*self.numharm
+				pm = [1.0] * self.numpm		# initial parameter values set to 1
+				pm.append(0)			# add amplitude gain factor parameter with initial value of 0
+				self.numpm += 1
+			self.params, self.covar, info, mesg, ier = optimize.leastsq(errfunc, pm, full_output=1, args=(work, self.yp, self.numpoly, self.numharm))
+			if self.debug:
+				print("  Finished leastsq")
+		else:
+			if nnew > 0:
+				self.params, self.covar, self._qr = linearFit(work[-nnew:], self.yp[-nnew:], self.numpoly, self.numharm, self._qr)
+			else:
+				self.params, self.covar, self._qr = linearFit(work, self.yp, self.numpoly, self.numharm)
+			if self.debug:
+				print("  Finished linear fit")
+
 		if self.debug:
-			print("  Finished leastsq")
 			for i in range(self.numpm):
 				print("    param[%d] = %e" % (i, self.params[i]))
 
@@ -385,59 +607,85 @@ class ccgFilter(object):
 			print("  variance is", self._varnce())
 			print("  Function variance is", self.funcvar)
 
+	#------------------------------------------------------------
+	def _smooth_resid(self, work, resid, gap, xstart=None, record=None):
+		""" Apply the short term and long term filters to the residuals resid
+		at times work (x - timezero).
+
+		Returns the equally spaced times (without timezero), starting at xstart
+		if given, and the smoothed residuals, the trend of the residuals and the
+		interpolated residuals at those times.
+
+		If work and resid are only the end of the record (see update), record
+		is the tuple (ca, cb, nafter, nbefore, head) for the whole record: the end
+		adjustment, the number of zeros after and before the data in the fft, and
+		the first interpolated residuals.  The end of the data is then placed in the
+		fft as in the fft of the whole record, with the start of the record
+		following the zeros after the end (the fft is circular), so that the
+		values near the end are the same as for the whole record.
+		"""
 
 		# fit linear line to ends of residual data
 		# subtract this from residuals so ends are ~ near 0
-		ca, cb = self._adjustend(work, self.resid, self.longterm)
-		resid = self.resid - (ca + cb*work)
+		if record is None:
+			ca, cb = self._adjustend(work, resid, self.longterm)
+		else:
+			ca, cb, nafter, nbefore, head = record
+		resid = resid - (ca + cb*work)
 		if self.debug:
 			print("  Finished adjustend")
 			print("    ca = %e, cb = %e" % (ca, cb))
-			print("    x[0] = %e, x[%d] = %e" % (work[0], self.np, work[-1]))
-			print("    resid[0] = %e, resid[%d] = %e" % (resid[0], self.np, resid[-1]))
+			print("    x[0] = %e, x[%d] = %e" % (work[0], work.size, work[-1]))
+			print("    resid[0] = %e, resid[%d] = %e" % (resid[0], work.size, resid[-1]))
 
 
 		# Interpolate data at evenly spaced intervals (self.sampleinterval)
-		self.xinterp, yinterp = self._lin_interp(work, resid, gap)
-		self.ninterp = len(self.xinterp)
+		xinterp, yinterp = self._lin_interp(work, resid, gap, xstart)
 
 		if self.debug:
 			print("  Interpolated points.")
-			print("    Number of interpolated points: %d" % (self.ninterp))
-			print("    xinterp[np-1] = %e, x[0] = %e" % (self.xinterp[-1], self.xinterp[0]))
+			print("    Number of interpolated points: %d" % (xinterp.size))
+			print("    xinterp[np-1] = %e, x[0] = %e" % (xinterp[-1], xinterp[0]))
 			print("    yinterp[np-1] = %e, y[0] = %e" % (yinterp[-1], yinterp[0]))
 
 
 		# do fft on interpolated data
-		# we'll zero pad the data to an even power of 2
-		# This makes it the same method used in c version.
-		n2 = int(pow(2, ceil(log(yinterp.size, 2))))
+		# we'll zero pad the data to the length given by the fft backend,
+		# by default an even power of 2, which makes it the same method used in c version.
+		if record is None:
+			n2 = self.fftbackend.length(yinterp.size)
+			nstart = int((n2 - yinterp.size)/2)
+		else:
+			n2 = self.fftbackend.length(nbefore + head.size + yinterp.size + nafter)
+			nstart = n2 - nafter - yinterp.size
 		zzz = numpy.zeros(n2)
-		nstart = int((n2 - yinterp.size)/2)
 		nend = nstart + yinterp.size
 		zzz[nstart:nend] = yinterp
+		if record is not None:
+			zzz[nbefore:nbefore+head.size] = head
 
-		fft = fftpack.rfft(zzz)
+		fft = self.fftbackend.rfft(zzz)
 
 		# do short term filter
 		if self.debug:
 			print("  Do short term filter, cutoff = ", self.shortterm)
-		a = self._freq_filter(fft, self.dinterval, self.shortterm)
-		yfilt = fftpack.irfft(a)
-		self.smooth = yfilt[nstart:nend] + ca + cb*self.xinterp
+		a = self._freq_filter(fft, n2, self.dinterval, self.shortterm)
+		yfilt = self.fftbackend.irfft(a, n2)
+		smooth = yfilt[nstart:nend] + ca + cb*xinterp
 
 
 		# do long term filter
 		if self.debug:
 			print("  Do long term filter, cutoff = ", self.longterm)
-		a = self._freq_filter(fft, self.dinterval, self.longterm)
-		yfilt = fftpack.irfft(a)
-		self.trend = yfilt[nstart:nend] + ca + cb*self.xinterp
+		a = self._freq_filter(fft, n2, self.dinterval, self.longterm)
+		yfilt = self.fftbackend.irfft(a, n2)
+		trend = yfilt[nstart:nend] + ca + cb*xinterp
 
 
-		# add linear fit and timezero back in to interpolated values
-		self.yinterp = yinterp + ca + cb*self.xinterp
-		self.xinterp = self.xinterp + self.timezero
+		# add linear fit back in to interpolated values
+		yinterp = yinterp + ca + cb*xinterp
+
+		return xinterp, smooth, trend, yinterp
 
 
 	#------------------------------------------------------------
@@ -457,84 +705,53 @@ class ccgFilter(object):
 		return intercept, slope
 
 	#------------------------------------------------------------
-	def _lin_interp(self, x, y, gap):
+	def _lin_interp(self, x, y, gap, xstart=None):
 		""" Linear interpolate between input data to get equally spaced values
-		at every sample interval.
+		at every sample interval, starting at xstart if given, otherwise at
+		the first data point.
 		"""
 
+		if xstart is None:
+			xstart = x[0]
+
 		# calculate the x values for evenly spaced data at the specified sampling interval
-		xi = numpy.arange(x[0], x[-1]+self.dinterval/2, self.dinterval)
+		xi = numpy.arange(xstart, x[-1]+self.dinterval/2, self.dinterval)
 		xi[-1] = x[-1]		# make sure last point is equal to last data point
 
 		# if there are multiple y data points at a single x value, then average them
 		# to get only 1 y data point for each x
-		xx = []
-		yy = []
-		xt = x[0]
-		ys = y[0]
-		ns = 1
-		for xp, yp in zip(x[1:], y[1:]):
-			if xp == xt:
-				ys += yp
-				ns += 1
-			else:
-				ya = ys/ns
-				xx.append(xt)
-				yy.append(ya)
-				ys = yp
-				ns = 1
-			xt = xp
-		ya = ys/ns
-		xx.append(xt)
-		yy.append(ya)
-
-		# calculate interpolation values at each x point
-		f = interpolate.interp1d(xx, yy)
-
-		# if a gap setting was not made, use normal linear interpolation
-		# to get equally space points.
-		# Otherwise, fill in gaps using the function value (0) instead.
-		if gap == 0:
-			yi = f(xi)
-
-		else:
-			n = len(xx)
-			ni = len(xi)
-			yi = numpy.zeros( (ni) )
-			j = 0
-			for i in range(ni):
-				while xi[i] >= xx[j]:
-					j += 1
-					if j >= n-1:
-						break
-
-				j -= 1
-				if (xx[j+1] - xx[j]) > gap/365.0: #  8*self.dinterval:
-					yi[i] = 0
-				else:
-					yi[i] = f(xi[i])
-
+		xx, idx, counts = numpy.unique(x, return_inverse=True, return_counts=True)
+		yy = numpy.bincount(idx, weights=y) / counts
+
+		# linear interpolation at each equally spaced point
+		yi = numpy.interp(xi, xx, yy)
+
+		# if a gap setting was made, fill in gaps using the function value (0)
+		# instead of the linear interpolated value.
+		# A point is in a gap if the interval between the data points on either side
+		# of it is larger than gap days.
+		if gap != 0:
+			n = xx.size
+			j = numpy.minimum(numpy.searchsorted(xx, xi, side='right'), n-1) - 1
+			seglen = numpy.diff(xx)
+			yi[seglen[j] > gap/365.0] = 0
 
 		return xi, yi
 
 	#------------------------------------------------------------
-	def _freq_filter(self, fft, dinterv, cutoff):
+	def _freq_filter(self, fft, n, dinterv, cutoff):
 		""" Apply low-pass filter to fft data.
 		Multiply each discrete frequency in fft by a
 		low-pass filter function value set by the value 'cutoff'
 		input:
-			fft - results of fft
+			fft - results of real fft
+			n - number of data values in the fft
 			dinterv - sampling interval in years
 			cutoff - cutoff value in days
 		"""
 
-		n2 = len(fft)
-		cf = cutoff/365.0	# convert cutoff to years
-		cutoff2 = 1.0/cf	# change to cycles/year
-
-		freq = fftpack.rfftfreq(n2, dinterv)	# get array of frequencies
-		rw = self._vfilt(freq, cutoff2, 6)	# get filter value at frequencies
-		filt = fft*rw				# apply filter values to fft
+		rw = filterResponse(n, dinterv, cutoff)	# get filter value at frequencies
+		filt = fft*rw					# apply filter values to fft
 
 
 		return filt
@@ -567,22 +784,11 @@ class ccgFilter(object):
 
 	#------------------------------------------------------------
 	def _vfilt(self, freq, sigma, power):
-		""" vectorized version of getting filter value at a frequency
-		input:
-			freq - array of frequencies
-			sigma - cutoff value in cycles/year
-			power - integer value for f/fc^power
-		returns:
-			array of filter values at each frequency
-
-		the clip statement insures against underflow, although
-		numpy seems to handle it internally anyway
+		""" vectorized version of getting filter value at a frequency.
+		See vfilt()
 		"""
 
-		z = numpy.power((freq/sigma), power)
-		z = numpy.clip(z, 0, 20.0)
-		f = 1.0 / numpy.power(2.0, z)
-		return f
+		return vfilt(freq, sigma, power)
 
 
 	#------------------------------------------------------------
@@ -591,15 +797,145 @@ class ccgFilter(object):
 		This is the derivative of self.trend + derivative of polynomial part of the function
 		"""
 
+		self.deriv = self._trend_deriv(self.xinterp, self.trend)
+
+	#------------------------------------------------------------
+	def _trend_deriv(self, x, trend):
+		""" Compute derivative of trend of residuals at times x,
+		plus derivative of polynomial part of the function.
+		"""
+
 		# Connect trend data points with spline to get derivative at each point
-		tck = interpolate.splrep(self.xinterp, self.trend, s=0.0)
-		self.deriv = interpolate.splev(self.xinterp, tck, der=1)
+		tck = interpolate.splrep(x, trend, s=0.0)
+		deriv = interpolate.splev(x, tck, der=1)
 
 		# compute derivative of polynomial at each interpolated data point
 		# we need to reverse order of polynomial coefficients for input into poly1d
 		poly = numpy.poly1d(self.params[self.numpoly-1::-1])
 		pd = numpy.polyder(poly)
-		self.deriv += pd(self.xinterp - self.timezero)
+		deriv += pd(x - self.timezero)
+
+		return deriv
+
+	#------------------------------------------------------------
+	def update(self, xnew, ynew):
+		""" Add new data points after the end of the current data, and update
+		the function fit and the smoothed curves.
+
+		The function fit starts from the previous fit.  Without the gain factor
+		this gives the same parameters as a full fit, otherwise leastsq usually
+		needs only a few iterations.
+
+		The filters are only applied to the residuals in a window starting
+		3 long term cutoffs before the previous end of the data, and the curves
+		are only replaced from 1 long term cutoff before the previous end.
+		Values before that are kept, so the cost depends on the window length
+		and not on the length of the record.  The residuals in the window are
+		adjusted with the end adjustment of the whole record, and placed in the
+		fft as the end of the whole record (see _smooth_resid).
+
+		Compared to a full refit on all of the data, the smooth and trend curves
+		differ by less than 0.01 * rsd1 (residual standard deviation about the function),
+		and the growth rate by less than 0.02 * rsd1 per year, when adding a few days
+		of data at a time to 10 year records of daily or hourly data with
+		autocorrelated noise and no gap setting (see check_update in ccgfilt_benchmark.py).
+		This does not hold within 1 long term cutoff of the start of the record,
+		which is not updated even though a full refit changes it through the end
+		adjustment of the residuals.  With a gap setting, a full refit also changes
+		the values around every gap in the record, because the gaps are filled
+		from the end adjustment line, and only the gaps in the window are updated.
+		If the record is shorter than the window, a full refit is done.
+
+		Input
+		-----
+		xnew, ynew - lists or numpy arrays with the new data.
+		             All xnew must be later than the last current data point.
+		"""
+
+		c = numpy.argsort(xnew)
+		xnew = numpy.asarray(xnew, dtype=float)[c]
+		ynew = numpy.asarray(ynew, dtype=float)[c]
+		if xnew.size == 0:
+			return
+		if xnew[0] <= self.xp[-1]:
+			raise ValueError("New data must be later than the last data point %f" % self.xp[-1])
+
+		oldend = self.xp[-1]
+		cutoff = self.longterm/365.0
+
+		# full curves before the update
+		xg = self.xinterp
+		smooth_old = self._get_curve("smooth")
+		trend_old = self._get_curve("trend")
+		func_old = smooth_old - self.smooth
+		yinterp_old = self.yinterp
+		deriv_old = self.deriv
+
+		self.xp = numpy.concatenate((self.xp, xnew))
+		self.yp = numpy.concatenate((self.yp, ynew))
+		self.np = self.xp.size
+		work = self.xp - self.timezero
+
+		# start of window and start of replaced values, on the equally spaced times
+		k = numpy.searchsorted(xg, oldend - 3*cutoff)
+		k2 = numpy.searchsorted(xg, oldend - cutoff)
+		if k == 0 or k2 >= xg.size - 1:
+			# record shorter than the window, full refit
+			self._filter_data(self.gap)
+			self._compute_deriv()
+			self._curves = {}
+
+		else:
+			self._fit_function(work, xnew.size)
+
+			# include the data point before the window start for the interpolation
+			i0 = max(numpy.searchsorted(self.xp, xg[k], side='right') - 1, 0)
+			record = self._record_fft_layout(work, k + numpy.arange(xg[k], self.xp[-1] + self.dinterval/2, self.dinterval).size)
+			xw, smooth, trend, yinterp = self._smooth_resid(work[i0:], self.resid[i0:], self.gap, xg[k] - self.timezero, record)
+			xw = xw + self.timezero
+			deriv = self._trend_deriv(xw, trend)
+
+			j = k2 - k
+			self.xinterp = numpy.concatenate((xg[0:k2], xw[j:]))
+			self.ninterp = len(self.xinterp)
+
+			func = self.getFunctionValue(self.xinterp)
+			poly = self.getPolyValue(self.xinterp)
+
+			smooth_curve = numpy.concatenate((smooth_old[0:k2], smooth[j:] + func[k2:]))
+			trend_curve = numpy.concatenate((trend_old[0:k2], trend[j:] + poly[k2:]))
+
+			self._curves = {"smooth": smooth_curve, "trend": trend_curve}
+			self.smooth = smooth_curve - func
+			self.trend = trend_curve - poly
+			self.deriv = numpy.concatenate((deriv_old[0:k2], deriv[j:]))
+			self.yinterp = numpy.concatenate((yinterp_old[0:k2] + func_old[0:k2] - func[0:k2], yinterp[j:]))
+
+		# standard deviation of residuals about smooth curve
+		r = self.yp - self.getSmoothValue(self.xp)
+		self.rsd2 = numpy.std(r, ddof=1)
+		self.rmean = numpy.mean(r)
+
+	#------------------------------------------------------------
+	def _record_fft_layout(self, work, ninterp):
+		""" End adjustment and fft layout of the whole record, for filtering
+		only the end of the record in update().  ninterp is the number of
+		equally spaced points of the whole record.
+		"""
+
+		ca, cb = self._adjustend(work, self.resid, self.longterm)
+
+		n2 = self.fftbackend.length(ninterp)
+		nbefore = int((n2 - ninterp)/2)
+		nafter = n2 - nbefore - ninterp
+
+		# the first interpolated residuals (2 long term cutoffs, more is
+		# beyond the reach of the filters after wrapping around)
+		nhead = min(int(2*self.longterm/self.sampleinterval), ninterp)
+		j = min(numpy.searchsorted(work, work[0] + nhead*self.dinterval) + 1, work.size)
+		xhead, head = self._lin_interp(work[:j], self.resid[:j] - (ca + cb*work[:j]), self.gap)
+
+		return ca, cb, nafter, nbefore, head[:nhead]
 
 	#------------------------------------------------------------
 	def _varnce(self, poly=False):
@@ -633,16 +969,20 @@ class ccgFilter(object):
 		return df2
 
 	#------------------------------------------------------------
-	def _filtvar(self, which):
-		""" calculate the filter variance at cutoff f """
+	def _filter_weights(self, cutoff):
+		""" Compute weights of filter by filtering a single point in the
+		middle of zero values (impulse response).
 
-		# First step: Compute weights of filter by filtering a single
-		# point in the middle of zero values (impulse response)
+		Returns the weights and the sum of products of the weights at each lag k,
+		i.e. sum(weights[i]*weights[i+k]) for k = 0 ... n0-1.
 
-		if which == "short":
-			cutoff = self.shortterm
-		else:
-			cutoff = self.longterm
+		These depend only on the cutoff and sample interval, so they are
+		cached in _weights_cache and reused by other ccgFilter instances.
+		"""
+
+		key = (cutoff, self.dinterval)
+		if key in _weights_cache:
+			return _weights_cache[key]
 
 		n0 = 4 * int(cutoff/365.0/self.dinterval)
 
@@ -655,14 +995,35 @@ class ccgFilter(object):
 		ytemp[int(n0/2)] = 1.0
 
 		# do fft
-		fft = fftpack.rfft(ytemp)
+		fft = self.fftbackend.rfft(ytemp)
 
 		# do filter
 		if self.debug:
 			print("  In filtvar, do filter, cutoff = ", cutoff, "n0 is ", n0)
 
-		a = self._freq_filter(fft, self.dinterval, cutoff)
-		weights = fftpack.irfft(a)
+		a = self._freq_filter(fft, n0, self.dinterval, cutoff)
+		weights = self.fftbackend.irfft(a, n0)
+
+		# autocorrelation of the weights using fft, zero padded to avoid wrap around
+		fw = self.fftbackend.rfft(weights, 2*n0)
+		wcorr = self.fftbackend.irfft(fw*numpy.conj(fw), 2*n0)[0:n0]
+
+		_weights_cache[key] = (weights, wcorr)
+
+		return weights, wcorr
+
+	#------------------------------------------------------------
+	def _filtvar(self, which):
+		""" calculate the filter variance at cutoff f """
+
+		if which == "short":
+			cutoff = self.shortterm
+		else:
+			cutoff = self.longterm
+
+		# First step: Get weights of filter (impulse response)
+		weights, wcorr = self._filter_weights(cutoff)
+		n0 = weights.size
 
 		# Compute sum of squares of weights
 		ssw = numpy.sum(weights*weights)
@@ -691,12 +1052,13 @@ class ccgFilter(object):
 
 		# Compute auto covariances
 		# r(k) = r(1)^k
-		sm = 0.0
-		for i in range(n0-1):
-			for j in range(i+1, n0):
-				r = pow(cor, j-i)
-				if r < 1e-5: break # speed things up by ignoring really small values
-				sm += r*weights[i]*weights[j]
+		# The sum over all pairs of weights sum(r(j-i)*weights[i]*weights[j]) for j > i
+		# is the same as the sum over lags k of r(k) * sum(weights[i]*weights[i+k]).
+		# Ignore lags where r(k) is really small.
+		r = numpy.power(cor, numpy.arange(1, n0))
+		small = numpy.nonzero(r < 1e-5)[0]
+		nlag = small[0] if small.size else n0-1
+		sm = numpy.sum(r[0:nlag]*wcorr[1:nlag+1])
 
 
 		var = rsd*rsd*(ssw+2*sm)
@@ -845,11 +1207,9 @@ class ccgFilter(object):
 		This is the function plus the smoothed residuals.
 		"""
 
-		ysmooth = self.getFunctionValue(self.xinterp)
-		ysmooth = ysmooth + self.smooth
+		ysmooth = self._get_curve("smooth")
 
-		f = interpolate.interp1d(self.xinterp, ysmooth, bounds_error=False)
-		yi = f(x)
+		yi = numpy.interp(x, self.xinterp, ysmooth, left=numpy.nan, right=numpy.nan)
 
 		return yi
 
@@ -860,11 +1220,9 @@ class ccgFilter(object):
 		i.e., poly plus the long term filter of the residuals
 		"""
 
-		ytrend = self.getPolyValue(self.xinterp)
-		ytrend = ytrend + self.trend
+		ytrend = self._get_curve("trend")
 
-		f = interpolate.interp1d(self.xinterp, ytrend, bounds_error=False)
-		yi = f(x)
+		yi = numpy.interp(x, self.xinterp, ytrend, left=numpy.nan, right=numpy.nan)
 
 		return yi
 
@@ -908,11 +1266,31 @@ class ccgFilter(object):
 		A numpy 1d array with the growth rate values at the given x
 		"""
 
-		f = interpolate.interp1d(self.xinterp, self.deriv) # , bounds_error=False)
-		yi = f(x)
+		xa = numpy.asarray(x)
+		if numpy.any(xa < self.xinterp[0]) or numpy.any(xa > self.xinterp[-1]):
+			raise ValueError("A value in x is outside the interpolation range.")
+
+		yi = numpy.interp(xa, self.xinterp, self.deriv)
 
 		return yi
 
+	#------------------------------------------------------------
+	def _get_curve(self, which):
+		""" Get the smooth curve (function + smoothed residuals) or the
+		trend curve (polynomial + long term filtered residuals) at every xinterp.
+		The curves are computed on first use and saved in self._curves.
+		"""
+
+		if which not in self._curves:
+			if which == "smooth":
+				y = self.getFunctionValue(self.xinterp) + self.smooth
+			else:
+				y = self.getPolyValue(self.xinterp) + self.trend
+
+			self._curves[which] = y
+
+		return self._curves[which]
+
 	#------------------------------------------------------------
 	def getFilterResponse(self, cutoff):
 		""" Get the filter response for a range of frequencies.
@@ -944,35 +1322,31 @@ class ccgFilter(object):
 
 		Returns
 		--------
-		A list of tuples, each tuple has 5 values (year, month, value, std. deviation, n)
+		A numpy structured array, each row has 5 values (year, month, value, std, n)
 		"""
 
 		if data is None:
-			ysmooth = self.getSmoothValue(self.xinterp)
+			ysmooth = self._get_curve("smooth")
 		else:
 			ysmooth = data
 
-		a = []
-		data = []
-		tyear = 0
-		tmonth = 0
-		for x, y in zip(self.xinterp, ysmooth):
-			dt = self.calendarDate(x)
+		year, month = ccgdates.calendarDateArray(self.xinterp)[0:2]
 
-			if dt.year != tyear or dt.month != tmonth:
-				if len(a):
-					mean = numpy.mean(a)
-					std = numpy.std(a, ddof=1)
-					data.append((tyear, tmonth, mean, std, len(a)))
-					a = []
+		# index of the month for each point, counting from the first month
+		idx = year*12 + month - 1
+		idx = idx - idx[0]
 
-			a.append(y)
-			tyear = dt.year
-			tmonth = dt.month
+		mean, std, n = _group_stats(idx, ysmooth)
 
-		mean = numpy.mean(a)
-		std = numpy.std(a, ddof=1)
-		data.append((dt.year, dt.month, mean, std, len(a)))
+		# only months with data
+		w = n > 0
+		data = numpy.zeros(numpy.count_nonzero(w), dtype=[("year", int), ("month", int), ("value", float), ("std", float), ("n", int)])
+		months = numpy.nonzero(w)[0] + year[0]*12 + month[0] - 1
+		data["year"] = months // 12
+		data["month"] = months % 12 + 1
+		data["value"] = mean[w]
+		data["std"] = std[w]
+		data["n"] = n[w]
 
 		return data
 
@@ -983,24 +1357,27 @@ class ccgFilter(object):
 
 		Returns
 		--------
-		A list of tuples, each tuple has 4 values (year, value, std. deviation, n)
+		A numpy structured array, each row has 4 values (year, value, std, n)
 		"""
 
 
 		if data is None:
-			ysmooth = self.getSmoothValue(self.xinterp)
+			ysmooth = self._get_curve("smooth")
 		else:
 			ysmooth = data
 
 		firstyear = int(self.xinterp[0])
-		lastyear = int(self.xinterp[-1])
 
-		data = []
-		for year in range(firstyear, lastyear+1):
-			w = numpy.where( (self.xinterp >= float(year)) & (self.xinterp < float(year+1)))
-			mean = numpy.mean(ysmooth[w])
-			std = numpy.std(ysmooth[w], ddof=1)
-			data.append((year, mean, std, len(w[0])))
+		# index of the year for each point, counting from the first year
+		idx = numpy.floor(self.xinterp).astype(int) - firstyear
+
+		mean, std, n = _group_stats(idx, ysmooth)
+
+		data = numpy.zeros(n.size, dtype=[("year", int), ("value", float), ("std", float), ("n", int)])
+		data["year"] = numpy.arange(firstyear, firstyear + n.size)
+		data["value"] = mean
+		data["std"] = std
+		data["n"] = n
 
 		return data
 
@@ -1049,3 +1426,104 @@ class ccgFilter(object):
 		dt = datetime.datetime(dyr, 1, 1) + datetime.timedelta(seconds=nsec)
 
 		return dt
+
+
+#--------------------------------------------------
+def _group_stats(idx, y):
+	""" Get the mean, standard deviation and number of values of y
+	in each group given by the integer group index idx (0 ... max(idx)).
+	Groups without values have a mean and std. deviation of nan.
+	"""
+
+	y = numpy.asarray(y, dtype=float)
+
+	n = numpy.bincount(idx)
+	with numpy.errstate(invalid="ignore", divide="ignore"):
+		mean = numpy.bincount(idx, weights=y) / n
+		d = y - mean[idx]
+		std = numpy.sqrt(numpy.bincount(idx, weights=d*d) / (n-1))
+
+	return mean, std, n
+
+#--------------------------------------------------
+def _init_worker(responses):
+	""" Fill the filter response cache of a batchFilter worker process """
+
+	_response_cache.update(responses)
+
+#--------------------------------------------------
+def _filter_series(args):
+	""" Filter one series in a batchFilter worker process """
+
+	xp, yp, kwargs = args
+
+	filt = ccgFilter(xp, yp, **kwargs)
+
+	return FilterResult(filt.xinterp,
+			    filt.getSmoothValue(filt.xinterp),
+			    filt.getTrendValue(filt.xinterp),
+			    filt.deriv,
+			    filt.params,
+			    filt.covar)
+
+#--------------------------------------------------
+def batchFilter(series, shortterm=80, longterm=667, sampleinterval=0, numpolyterms=3, numharmonics=4, timezero=-1, gap=0, use_gain_factor=False, fftbackend=None, processes=None):
+	""" Apply the curve fitting/filtering to many series with the same settings,
+	using a pool of processes.
+
+	Input Parameters
+	----------
+	series : list
+	    list of (xp, yp) tuples, one for each series
+	processes : int
+	    Number of worker processes.  If 1, the series are filtered in this process.
+	    Optional.  Default is the number of cpus.
+
+	The other parameters are the same as for ccgFilter and are used for all series.
+
+	The low-pass filter values for each fft length are computed once here and
+	shared with the workers.  This is only possible if sampleinterval is given,
+	otherwise each worker computes and caches them itself.
+
+	Returns
+	-------
+	A list of FilterResult named tuples in the same order as series, with
+	    xinterp - equally spaced times
+	    smooth - smoothed curve (function + short term smoothing) at xinterp
+	    trend - trend curve (polynomial + long term smoothing) at xinterp
+	    deriv - growth rate (derivative of trend) at xinterp
+	    params - parameters of the function fit
+	    covar - covariance of the parameters
+	"""
+
+	kwargs = dict(shortterm=shortterm,
+		      longterm=longterm,
+		      sampleinterval=sampleinterval,
+		      numpolyterms=numpolyterms,
+		      numharmonics=numharmonics,
+		      timezero=timezero,
+		      gap=gap,
+		      use_gain_factor=use_gain_factor,
+		      fftbackend=fftbackend)
+
+	tasks = [(xp, yp, kwargs) for xp, yp in series]
+
+	if processes == 1:
+		return [_filter_series(task) for task in tasks]
+
+	# Compute filter values for the fft lengths of all series
+	responses = {}
+	if sampleinterval != 0:
+		if fftbackend is None:
+			fftbackend = default_fft_backend
+		dinterval = sampleinterval/365.0
+		for xp, yp, kw in tasks:
+			ni = numpy.arange(numpy.min(xp), numpy.max(xp)+dinterval/2, dinterval).size
+			n2 = fftbackend.length(ni)
+			for cutoff in (shortterm, longterm):
+				responses[(n2, dinterval, cutoff)] = filterResponse(n2, dinterval, cutoff)
+
+	with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(responses,)) as pool:
+		results = pool.map(_filter_series, tasks)
+
+	return results
@@ -0,0 +1,280 @@
+#!/usr/bin/python
+"""
+Benchmarks for the ccgfilt curve fitting/filtering routines.
+
+Times the vectorized routines in ccgfilt against the original pure python
+versions, which are kept here only as a reference, and checks that both give
+the same results.
+
+Usage:
+	python ccgfilt_benchmark.py [-n NPOINTS] [--interv DAYS] [--gap GAP]
+
+General python requirements:
+	numpy, scipy
+"""
+
+from __future__ import print_function
+
+import optparse
+import timeit
+
+import numpy
+from scipy import interpolate
+from scipy import fftpack
+from scipy import signal
+
+import ccgfilt
+
+
+##########################################################################
+def make_data(npoints, interval=1/48.0, seed=0):
+	""" Create a synthetic co2 like record with npoints at 'interval' days,
+	including some duplicate time values, a few gaps and autocorrelated noise.
+	"""
+
+	rng = numpy.random.RandomState(seed)
+	dinterval = interval/365.0
+
+	x = 2000 + numpy.arange(npoints) * dinterval
+	x = x + rng.uniform(0, dinterval/2, npoints)
+
+	# duplicate time values
+	dup = rng.randint(1, npoints, npoints//100)
+	x[dup] = x[dup-1]
+
+	# gaps of 2 weeks in the data
+	keep = numpy.ones(npoints, dtype=bool)
+	for start in rng.randint(0, npoints, 10):
+		keep[start:start+int(14/interval)] = False
+	x = x[keep]
+
+	# autocorrelated noise, as in high frequency in situ records
+	noise = signal.lfilter([1.0], [1.0, -0.95], rng.normal(0, 1, x.size))
+
+	y = 380 + 2*(x-2000) + 5*numpy.sin(2*numpy.pi*x) + noise
+
+	return x, y
+
+
+##########################################################################
+def lin_interp_loop(x, y, dinterval, gap):
+	""" Original pure python version of ccgFilter._lin_interp """
+
+	xi = numpy.arange(x[0], x[-1]+dinterval/2, dinterval)
+	xi[-1] = x[-1]
+
+	xx = []
+	yy = []
+	xt = x[0]
+	ys = y[0]
+	ns = 1
+	for xp, yp in zip(x[1:], y[1:]):
+		if xp == xt:
+			ys += yp
+			ns += 1
+		else:
+			ya = ys/ns
+			xx.append(xt)
+			yy.append(ya)
+			ys = yp
+			ns = 1
+		xt = xp
+	ya = ys/ns
+	xx.append(xt)
+	yy.append(ya)
+
+	f = interpolate.interp1d(xx, yy)
+
+	if gap == 0:
+		yi = f(xi)
+
+	else:
+		n = len(xx)
+		ni = len(xi)
+		yi = numpy.zeros( (ni) )
+		j = 0
+		for i in range(ni):
+			while xi[i] >= xx[j]:
+				j += 1
+				if j >= n-1:
+					break
+
+			j -= 1
+			if (xx[j+1] - xx[j]) > gap/365.0:
+				yi[i] = 0
+			else:
+				yi[i] = f(xi[i])
+
+	return xi, yi
+
+
+##########################################################################
+def filtvar_loop(filt, which):
+	""" Original version of ccgFilter._filtvar, with a double loop over the weights """
+
+	if which == "short":
+		cutoff = filt.shortterm
+	else:
+		cutoff = filt.longterm
+
+	n0 = 4 * int(cutoff/365.0/filt.dinterval)
+	ytemp = numpy.zeros( (n0) )
+	ytemp[int(n0/2)] = 1.0
+	fft = fftpack.rfft(ytemp)
+	freq = fftpack.rfftfreq(n0, filt.dinterval)
+	a = fft * ccgfilt.vfilt(freq, 365.0/cutoff, 6)
+	weights = fftpack.irfft(a)
+
+	ssw = numpy.sum(weights*weights)
+
+	if which == "short":
+		f = interpolate.interp1d(filt.xinterp, filt.smooth, bounds_error=False)
+	else:
+		f = interpolate.interp1d(filt.xinterp, filt.trend, bounds_error=False)
+	yp = f(filt.xp)
+	yy = filt.resid - yp
+	rmean = numpy.mean(yy)
+	rsd = numpy.std(yy, ddof=1)
+	n = yy.size
+
+	sm = numpy.sum( (yy[0:-1]-rmean) * (yy[1:]-rmean) )
+	cor = sm / (n-1) / (rsd*rsd)
+
+	sm = 0.0
+	for i in range(n0-1):
+		for j in range(i+1, n0):
+			r = pow(cor, j-i)
+			if r < 1e-5: break
+			sm += r*weights[i]*weights[j]
+
+	var = rsd*rsd*(ssw+2*sm)
+
+	return var
+
+
+##########################################################################
+def bench(name, func_old, func_new):
+	""" Time one call of the old and new versions of a routine and print the speedup.
+	Returns the results of both versions.
+	"""
+
+	t0 = timeit.default_timer()
+	r_old = func_old()
+	t_old = timeit.default_timer() - t0
+
+	t0 = timeit.default_timer()
+	r_new = func_new()
+	t_new = timeit.default_timer() - t0
+
+	print("%-30s old %10.4f s   new %10.4f s   speedup %8.1fx" % (name, t_old, t_new, t_old/t_new))
+
+	return r_old, r_new
+
+
+##########################################################################
+def bench_lin_interp(x, y, interval, gap):
+	""" Compare _lin_interp with the original loop version, using equally
+	spaced output points at 'interval' days.
+	"""
+
+	x = x - int(x[0])
+	filt = ccgfilt.ccgFilter.__new__(ccgfilt.ccgFilter)
+	filt.dinterval = interval/365.0
+
+	(xi_old, yi_old), (xi_new, yi_new) = bench("_lin_interp (gap=%g)" % gap,
+		lambda: lin_interp_loop(x, y, filt.dinterval, gap),
+		lambda: filt._lin_interp(x, y, gap))
+
+	print("    max difference: %g" % numpy.max(numpy.abs(yi_old - yi_new)))
+
+
+##########################################################################
+def bench_filtvar(x, y, interval):
+	""" Compare _filtvar with the original loop version. """
+
+	filt = ccgfilt.ccgFilter(x, y, sampleinterval=interval)
+
+	for which in ["short", "long"]:
+		# empty the weights cache so timing includes computing the weights
+		ccgfilt._weights_cache.clear()
+		v_old, v_new = bench("_filtvar (%s)" % which,
+			lambda: filtvar_loop(filt, which),
+			lambda: filt._filtvar(which))
+
+		print("    relative difference: %g" % (abs(v_old - v_new)/v_old))
+
+
+##########################################################################
+def check_update(npoints, interval, nnew, nupdates=1):
+	""" Check that adding nnew points at a time with update() gives the same
+	curves as a full fit on all of the data, within the limits given in
+	ccgFilter.update, and compare the times.
+	"""
+
+	x, y = make_data(npoints, interval)
+	n = x.size - nnew*nupdates
+
+	filt = ccgfilt.ccgFilter(x[:n], y[:n], sampleinterval=interval)
+	t0 = timeit.default_timer()
+	for i in range(n, x.size, nnew):
+		filt.update(x[i:i+nnew], y[i:i+nnew])
+	t_update = (timeit.default_timer() - t0)/nupdates
+
+	t0 = timeit.default_timer()
+	full = ccgfilt.ccgFilter(x, y, sampleinterval=interval)
+	t_full = timeit.default_timer() - t0
+
+	# the first long term cutoff of the record is not updated
+	xi = full.xinterp[full.xinterp >= x[0] + filt.longterm/365.0]
+	smooth = numpy.max(numpy.abs(filt.getSmoothValue(xi) - full.getSmoothValue(xi)))/filt.rsd1
+	trend = numpy.max(numpy.abs(filt.getTrendValue(xi) - full.getTrendValue(xi)))/filt.rsd1
+	growth = numpy.max(numpy.abs(filt.getGrowthRateValue(xi) - full.getGrowthRateValue(xi)))/filt.rsd1
+
+	name = "update (%d x %d points)" % (nupdates, nnew)
+	print("%-30s update %10.4f s   full %10.4f s   speedup %8.1fx" % (name, t_update, t_full, t_full/t_update))
+	print("    difference from full fit / rsd1: smooth %g, trend %g, growth rate %g" % (smooth, trend, growth))
+	assert smooth < 0.01 and trend < 0.01 and growth < 0.02
+
+
+##########################################################################
+def check_update_short(npoints=700, nnew=10):
+	""" Check that update() on a record shorter than the update window gives
+	the same curves as a full fit on all of the data, with and without the gain factor.
+	"""
+
+	x, y = make_data(npoints, interval=1.0)
+	n = x.size - nnew
+
+	for gain in [False, True]:
+		filt = ccgfilt.ccgFilter(x[:n], y[:n], sampleinterval=1, use_gain_factor=gain)
+		filt.update(x[n:], y[n:])
+		full = ccgfilt.ccgFilter(x, y, sampleinterval=1, use_gain_factor=gain)
+
+		assert filt.numpm == full.numpm
+		diff = max(numpy.max(numpy.abs(filt.getSmoothValue(x) - full.getSmoothValue(x))),
+			numpy.max(numpy.abs(filt.getTrendValue(x) - full.getTrendValue(x))))
+		print("%-30s max difference from full fit: %g" % ("update short (gain=%s)" % gain, diff))
+		assert diff < 1e-6 * filt.rsd1
+
+
+#########################################################################
+
+if __name__ == "__main__":
+
+	parser = optparse.OptionParser(usage='%prog [options]', description="Benchmark ccgfilt routines.")
+	parser.add_option('-n', '--npoints', default=500000, type='int', help="Number of points in the test data.")
+	parser.add_option('--interv', default=1/48.0, type='float', help="Sampling interval of the test data in days.")
+	parser.add_option('--gap', default=5, type='float', help="Gap setting in days for _lin_interp.")
+	options, args = parser.parse_args()
+
+	x, y = make_data(options.npoints, options.interv)
+	print("Number of data points: %d" % x.size)
+
+	bench_lin_interp(x, y, options.interv, 0)
+	bench_lin_interp(x, y, options.interv, options.gap)
+	bench_filtvar(x, y, options.interv)
+	check_update_short()
+	check_update(10*365, 1.0, 5)
+	check_update(10*365, 1.0, 5, nupdates=10)
+	check_update(10*365*24, 1/24.0, 120)
+	check_update(10*365*24, 1/24.0, 120, nupdates=5)
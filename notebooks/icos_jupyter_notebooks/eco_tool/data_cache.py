@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    Persistent local storage of ICOS data objects.
+
+    The data of a data object (pid) is stored in one file per month
+    in a directory of the pid, together with the metadata of the
+    data object. An index file keeps track on the stored columns,
+    months, sizes and access times of the data objects.
+
+    A pid of an ICOS data object is never updated, new data is
+    published as a new version (with a new pid) pointing back to
+    the old one by `previousVersion`. Hence, stored data never
+    becomes stale, but once a new version is stored, the previous
+    versions are removed.
+
+    Classes
+    -------
+    DataCache(cache_dir)
+        get()       Returns (meta, df) of a data object, restricted
+                    to the months of a date range. Only data objects
+                    (or columns) not in the cache are downloaded.
+        remove()    Removes a data object from the cache.
+        clear()     Removes all data objects from the cache.
+
+    Examples
+    --------
+    >>> from eco_tool.data_cache import DataCache
+    >>> from eco_tool.icos_data import StationData
+    >>> cache = DataCache('~/output/eco_nrt_tool/appdata/dobj_cache')
+    >>> df = StationData.group_ts(var_tuple_ls=[('TA_1_1_1', pid)],
+    ...                           start_date='2023-06-01',
+    ...                           data_cache=cache)
+"""
+
+__credits__ = "ICOS Carbon Portal"
+__license__ = "GPL-3.0"
+__version__ = "0.0.1"
+__maintainer__ = "ICOS Carbon Portal, elaborated products team"
+__email__ = ['info@icos-cp.eu', 'anders.dahlner@nateko.lu.se']
+__date__ = "2024-05-20"
+
+import importlib.util
+import json
+import os
+import shutil
+import threading
+import time
+
+import pandas as pd
+
+
+def _parquet_engine_available() -> bool:
+    return any(importlib.util.find_spec(engine) is not None
+               for engine in ['pyarrow', 'fastparquet'])
+
+
+def _pid_key(pid: str) -> str:
+    # Both '11676/<hash>' and 'https://meta.icos-cp.eu/objects/<hash>'
+    # refer to the same data object.
+    return str(pid).rstrip('/').split('/')[-1]
+
+
+class DataCache:
+
+    def __init__(self, cache_dir: str,
+                 max_size_mb: float = None,
+                 file_format: str = None,
+                 debug: bool = None):
+        """
+        Local cache of ICOS data objects.
+
+        Parameters
+        ----------
+        cache_dir: str
+            Directory of the cache, created if it does not exist.
+        max_size_mb: float
+            Default is 2048. When the stored data exceeds this size,
+            the least recently used data objects are removed.
+        file_format: str
+            Default is 'parquet' if pyarrow or fastparquet is installed,
+            otherwise 'pickle'. Possible values: 'parquet', 'pickle'
+        debug: bool
+            Default is False. If True, messages are printed.
+        """
+
+        self.cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.max_size = int((max_size_mb or 2048) * 1024 ** 2)
+        if file_format not in ['parquet', 'pickle']:
+            file_format = 'parquet' if _parquet_engine_available() \
+                else 'pickle'
+        self.file_format = file_format
+        self.debug = debug if isinstance(debug, bool) else False
+
+        self._lock = threading.Lock()
+        self._index_file = os.path.join(self.cache_dir, 'index.json')
+        self._index = self._read_index()
+
+        # Changes since the index file was last written, merged with
+        # the entries of other kernels using the same cache.
+        self._stored = set()
+        self._accessed = set()
+        self._removed = set()
+
+    def _read_index(self) -> dict:
+        if os.path.isfile(self._index_file):
+            try:
+                with open(self._index_file, 'r') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {}
+
+    def _merge_index(self):
+        # Expects self._lock to be held.
+        # Several kernels can use the same cache, each with its own
+        # copy of the index. The index file is the common state: the
+        # entries stored or removed by this instance are applied to it,
+        # and entries removed by other kernels are dropped here.
+        index = self._read_index()
+        for key in self._removed:
+            index.pop(key, None)
+        for key in self._stored:
+            if key in self._index:
+                index[key] = self._index[key]
+        for key in self._accessed:
+            if key in index and key in self._index:
+                index[key]['last_access'] = max(
+                    index[key]['last_access'],
+                    self._index[key]['last_access'])
+        self._index = index
+
+    def _write_index(self):
+        # Expects self._lock to be held.
+        # The index is replaced in one go, other kernels using the
+        # same cache never see a partly written index.
+        self._merge_index()
+        tmp_file = f'{self._index_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_file, self._index_file)
+        self._stored.clear()
+        self._accessed.clear()
+        self._removed.clear()
+
+    def _pid_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _month_file(self, key: str, month: str) -> str:
+        ext = 'parquet' if self.file_format == 'parquet' else 'pkl'
+        return os.path.join(self._pid_dir(key), f'{month}.{ext}')
+
+    @property
+    def size(self) -> int:
+        """Size in bytes of the stored data."""
+        return sum(entry['size'] for entry in self._index.values())
+
+    def get(self, pid: str, col_ls: list = None,
+            start_date=None, end_date=None,
+            fetch=None) -> tuple:
+        """
+        Returns the tuple (meta, df) of the data object with the
+        given pid, where df holds the months of the data object
+        that overlap start_date <= TIMESTAMP < end_date.
+
+        Parameters
+        ----------
+        pid: str
+            pid of an ICOS digital object.
+        col_ls: list of strings
+            Columns to return, if None all columns are returned.
+        start_date, end_date:
+            Any date object that can be casted to np.datetime64.
+        fetch: function
+            Called as fetch(pid, col_ls) -> (meta, df) when the data
+            object, or some of the columns, is not in the cache.
+        """
+
+        key = _pid_key(pid)
+        if col_ls:
+            col_ls = [c for c in col_ls if c != 'TIMESTAMP'] + ['TIMESTAMP']
+
+        # The lookup and the reading are done while holding the lock,
+        # so that other threads (group_ts fetches in parallel) do not
+        # remove the data object in between.
+        with self._lock:
+            if key not in self._index:
+                # maybe stored by another kernel
+                self._merge_index()
+            entry = self._index.get(key)
+            if entry and entry['format'] != self.file_format:
+                entry = None
+            if entry is None or entry['columns'] is None:
+                missing = []
+            elif col_ls:
+                missing = [c for c in col_ls if c not in entry['columns']]
+            else:
+                # all columns are requested, but only some are stored
+                entry = None
+                missing = []
+
+            if entry is not None and not missing:
+                result = self._read(key, col_ls, start_date, end_date)
+                if result is not None:
+                    return result
+                # removed by another kernel using the same cache
+                entry = None
+
+        fetch_ls = col_ls
+        if missing:
+            # Refetch the stored columns together with the new ones
+            # so that every month file holds the same columns.
+            fetch_ls = [c for c in entry['columns'] if c != 'TIMESTAMP']
+            fetch_ls += missing
+            if 'TIMESTAMP' in fetch_ls:
+                fetch_ls.remove('TIMESTAMP')
+            fetch_ls.append('TIMESTAMP')
+        if self.debug:
+            print(f'DataCache: fetching {pid}, columns = {fetch_ls}')
+        meta, df = fetch(pid, fetch_ls)
+        self._store(key, meta, df, fetch_ls)
+
+        with self._lock:
+            result = self._read(key, col_ls, start_date, end_date)
+        if result is not None:
+            return result
+
+        # Already removed again to make room for other data objects
+        if col_ls:
+            df = df[col_ls]
+        months = df['TIMESTAMP'].dt.to_period('M')
+        in_range = pd.Series(True, index=df.index)
+        if start_date is not None:
+            in_range &= months >= pd.Period(start_date, freq='M')
+        if end_date is not None:
+            in_range &= months <= pd.Period(end_date, freq='M')
+        return meta, df[in_range].reset_index(drop=True)
+
+    def _store(self, key: str, meta: dict, df: pd.DataFrame, col_ls: list):
+        pid_dir = self._pid_dir(key)
+        tmp_dir = f'{pid_dir}.{os.getpid()}.{threading.get_ident()}.tmp'
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, default=str)
+
+        months = []
+        periods = df['TIMESTAMP'].dt.to_period('M')
+        for period, df_month in df.groupby(periods, sort=True):
+            month = str(period)
+            path = os.path.join(tmp_dir, os.path.basename(
+                self._month_file(key, month)))
+            df_month = df_month.reset_index(drop=True)
+            if self.file_format == 'parquet':
+                df_month.to_parquet(path, index=False)
+            else:
+                df_month.to_pickle(path)
+            months.append(month)
+
+        size = sum(os.path.getsize(os.path.join(tmp_dir, f))
+                   for f in os.listdir(tmp_dir))
+
+        with self._lock:
+            if os.path.isdir(pid_dir):
+                shutil.rmtree(pid_dir, ignore_errors=True)
+            os.replace(tmp_dir, pid_dir)
+
+            self._index[key] = {'columns': col_ls,
+                                'months': months,
+                                'size': size,
+                                'format': self.file_format,
+                                'last_access': time.time()}
+            self._stored.add(key)
+            self._removed.discard(key)
+
+            # A new version supersedes the previous versions
+            previous = meta.get('previousVersion') or []
+            if isinstance(previous, str):
+                previous = [previous]
+            for p in previous:
+                self._remove(_pid_key(p))
+
+            # Include the data objects stored by other kernels
+            self._merge_index()
+            self._evict(keep=key)
+            self._write_index()
+
+    def _read(self, key: str, col_ls: list = None,
+              start_date=None, end_date=None) -> tuple:
+        # Expects self._lock to be held.
+        # Returns (meta, df), or None if the data object is no longer
+        # stored. The access time is written to the index file with
+        # the next change of the index.
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        try:
+            with open(os.path.join(self._pid_dir(key), 'meta.json'),
+                      'r') as f:
+                meta = json.load(f)
+            df = self._read_months(key, entry['months'], col_ls,
+                                   start_date, end_date)
+        except FileNotFoundError:
+            self._index.pop(key, None)
+            self._stored.discard(key)
+            self._accessed.discard(key)
+            return None
+
+        entry['last_access'] = time.time()
+        self._accessed.add(key)
+        return meta, df
+
+    def _read_months(self, key: str, stored_months: list, col_ls: list,
+                     start_date, end_date) -> pd.DataFrame:
+        months = stored_months
+        if months and (start_date is not None or end_date is not None):
+            first = pd.Period(start_date, freq='M') \
+                if start_date is not None else pd.Period(months[0], freq='M')
+            last = pd.Period(end_date, freq='M') \
+                if end_date is not None else pd.Period(months[-1], freq='M')
+            months = [m for m in months
+                      if first <= pd.Period(m, freq='M') <= last]
+
+        df_ls = []
+        for month in months:
+            path = self._month_file(key, month)
+            if self.file_format == 'parquet':
+                df_ls.append(pd.read_parquet(path, columns=col_ls))
+            else:
+                df = pd.read_pickle(path)
+                df_ls.append(df[col_ls] if col_ls else df)
+
+        if not df_ls:
+            # Keep the columns (and dtypes) of the data object
+            path = self._month_file(key, stored_months[0]) \
+                if stored_months else None
+            if path is None:
+                return pd.DataFrame(columns=col_ls or ['TIMESTAMP'])
+            if self.file_format == 'parquet':
+                df = pd.read_parquet(path, columns=col_ls)
+            else:
+                df = pd.read_pickle(path)
+                df = df[col_ls] if col_ls else df
+            return df.iloc[0:0]
+
+        return pd.concat(df_ls, ignore_index=True)
+
+    def _remove(self, key: str):
+        # Expects self._lock to be held
+        self._stored.discard(key)
+        self._accessed.discard(key)
+        self._removed.add(key)
+        if self._index.pop(key, None) is not None:
+            shutil.rmtree(self._pid_dir(key), ignore_errors=True)
+            if self.debug:
+                print(f'DataCache: removed {key}')
+
+    def _evict(self, keep: str = None):
+        # Expects self._lock to be held.
+        # Least recently used data objects are removed first.
+        size = self.size
+        lru_ls = sorted(self._index.items(),
+                        key=lambda item: item[1]['last_access'])
+        for key, entry in lru_ls:
+            if size <= self.max_size:
+                break
+            if key == keep:
+                continue
+            size -= entry['size']
+            self._remove(key)
+
+    def remove(self, pid: str):
+        """Removes the data object with the given pid from the cache."""
+        with self._lock:
+            self._remove(_pid_key(pid))
+            self._write_index()
+
+    def clear(self):
+        """Removes all data objects from the cache."""
+        with self._lock:
+            self._merge_index()
+            for key in list(self._index.keys()):
+                self._remove(key)
+            self._write_index()
@@ -856,9 +856,12 @@ class AnalysisGui:
 
         rw = self.report_writer
         if rw is None:
+            cache_dir = os.path.join(self.output_directories['appdata'],
+                                     'dobj_cache')
             rw = report_writer.ReportWriter(retriever=self.retriever,
                                             icos_info=self.icos_info,
-                                            debug_function=self.debug_value)
+                                            debug_function=self.debug_value,
+                                            data_cache_dir=cache_dir)
             self.report_writer = rw
 
         today = dt.datetime.today().strftime('YYYY-MM-DD')
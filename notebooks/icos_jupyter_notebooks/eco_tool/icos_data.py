@@ -39,10 +39,12 @@ warnings.simplefilter("ignore", FutureWarning)
 
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from icoscp.cpb.dobj import Dobj
 from icoscp.station import station as st
 from icoscp.sparql import sparqls, runsparql
 from eco_tool.icos_timeseries import IcosFrame
+from eco_tool.data_cache import DataCache
 
 
 class StationData:
@@ -206,7 +208,8 @@ class StationData:
 
     def get_ts(self, pid: str = None, stn_id: str = None,
                stn_name: str = None, product: str = None,
-               col_ls: list = None, **kwargs) -> IcosFrame or None:
+               col_ls: list = None, data_cache: DataCache = None,
+               **kwargs) -> IcosFrame or None:
         """
         Returns a pandas dataframe df with an ICOS timeseries
         and attached metadata (an instance of IcosFrame which
@@ -232,6 +235,9 @@ class StationData:
         col_ls: list of strings
             List of columns to retrieve. The column 'TIMESTAMP' 
             will be added if it is not in the list.
+        data_cache: DataCache
+            If given, the data object is read from the local cache
+            and only downloaded if it is not stored there.
         
         Returns
         -------
@@ -257,9 +263,13 @@ class StationData:
             else:
                 return None
 
-        do = Dobj(pid)
-        df = do.data
-        meta = do.meta
+        if data_cache is not None:
+            meta, df = data_cache.get(pid, col_ls=col_ls,
+                                      fetch=StationData._download_dobj)
+        else:
+            do = Dobj(pid)
+            df = do.data
+            meta = do.meta
 
         # Filter out columns
         if col_ls:
@@ -274,10 +284,63 @@ class StationData:
 
         return ts_df
 
+    @staticmethod
+    def _download_dobj(pid: str, col_ls: list = None) -> tuple:
+        """
+        Returns the tuple (meta, df) of the ICOS data object with the
+        given pid. Only the columns in col_ls (and 'TIMESTAMP') are
+        downloaded.
+        """
+
+        do = Dobj(pid)
+        if col_ls:
+            col_ls = [c for c in col_ls if c != 'TIMESTAMP'] + ['TIMESTAMP']
+            df = do.get(col_ls)[col_ls]
+        else:
+            df = do.data
+        meta = do.meta
+        del do
+
+        return meta, df
+
+    @staticmethod
+    def _fetch_dobj(pid: str, col_ls: list = None,
+                    start_date=None, end_date=None,
+                    data_cache: DataCache = None) -> tuple:
+        """
+        Returns the tuple (meta, df) of the ICOS data object with the
+        given pid. Only the columns in col_ls (and 'TIMESTAMP') are
+        fetched and the rows of df are restricted to the dates
+        start_date <= TIMESTAMP < end_date. The dataframe df uses
+        'TIMESTAMP' as index.
+        """
+
+        if data_cache is not None:
+            meta, df = data_cache.get(pid, col_ls=col_ls,
+                                      start_date=start_date,
+                                      end_date=end_date,
+                                      fetch=StationData._download_dobj)
+        else:
+            meta, df = StationData._download_dobj(pid, col_ls)
+
+        if start_date:
+            df = df.loc[df['TIMESTAMP'] >= start_date]
+        if end_date:
+            df = df.loc[df['TIMESTAMP'] < end_date]
+
+        df = df.set_index(keys='TIMESTAMP')
+        # A timestamp-aligned join needs a unique index
+        if not df.index.is_unique:
+            df = df.loc[~df.index.duplicated(keep='last')]
+
+        return meta, df
+
     @staticmethod
     def group_ts(var_tuple_ls: list = None,
                  start_date=None,
-                 end_date=None) -> IcosFrame:
+                 end_date=None,
+                 max_workers: int = None,
+                 data_cache: DataCache = None) -> IcosFrame:
         """
         Returns a pandas dataframe df with an ICOS timeseries
         and attached metadata (an instance of IcosFrame which
@@ -302,6 +365,14 @@ class StationData:
             Returns sampled data before the end date at 00:00:00 (excluded). 
             Accepts any date object that can be casted to np.datetime64, 
             for example a string in the format 'YYYY-MM-DD'
+
+        max_workers: int
+            Maximal number of data objects fetched concurrently.
+            Default is one thread per distinct pid, at most 8.
+
+        data_cache: DataCache
+            If given, data objects are read from the local cache and
+            only downloaded if they are not stored there.
             
         Returns
         -------
@@ -329,25 +400,35 @@ class StationData:
                 order_dict[p]['cols'].append(v)
                 order_dict[p]['compose_order'][i] = v
             else:
-                order_dict[p] = {'cols': [v], 'compose_order': {i: v},
-                                 'dobj': Dobj(p)}
-
-        # 2. We might also have to rename duplicate variables.
+                order_dict[p] = {'cols': [v], 'compose_order': {i: v}}
+
+        # 2. The distinct data objects are fetched concurrently, only
+        #    the columns of the group are requested from the server.
+        pid_ls = list(order_dict.keys())
+        if not max_workers:
+            max_workers = min(len(pid_ls), 8)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {p: executor.submit(StationData._fetch_dobj, p,
+                                          order_dict[p]['cols'],
+                                          start_date, end_date,
+                                          data_cache)
+                       for p in pid_ls}
+            for p, future in futures.items():
+                meta, df = future.result()
+                order_dict[p]['meta'] = IcosFrame.trim_icos_meta(meta)
+                order_dict[p]['df'] = df
+
+        # 3. We might also have to rename duplicate variables.
         products = set()
         stations = set()
         if len(order_dict.keys()) > 1:
             # in this case we will rename columns
             for p in order_dict.keys():
-                p_meta = IcosFrame.trim_icos_meta(order_dict[p]['dobj'].meta)
-                order_dict[p]['meta'] = p_meta
+                p_meta = order_dict[p]['meta']
                 products.add(p_meta['product'])
                 stations.add(p_meta['stationId'])
                 order_dict[p]['product'] = p_meta['product']
                 order_dict[p]['stn_id'] = p_meta['stationId']
-        else:
-            for p in order_dict.keys():
-                p_meta = IcosFrame.trim_icos_meta(order_dict[p]['dobj'].meta)
-                order_dict[p]['meta'] = p_meta
 
         if len(products) > 1:
             for p in order_dict.keys():
@@ -366,17 +447,12 @@ class StationData:
                     order_dict[p]['rename_cols'] = {c: f'{stn_id}_{c}' for c in
                                                     order_dict[p]['cols']}
 
-        # 3. Next, we gather the data in a dataframe and keep track on the order
-        df_m = None
+        # 4. Next, we join the data on the timestamps in one go and keep
+        #    track on the order
+        df_ls = []
         total_col_order = {}
         for p in order_dict.keys():
-            do = order_dict[p]['dobj']
-            col_ls = order_dict[p]['cols'] + ['TIMESTAMP']
-            df = do.data[col_ls]
-            if start_date:
-                df = df.loc[df['TIMESTAMP'] >= start_date]
-            if end_date:
-                df = df.loc[df['TIMESTAMP'] < end_date]
+            df = order_dict[p].pop('df')
 
             if 'rename_cols' in order_dict[p].keys():
                 rename_dict = order_dict[p]['rename_cols']
@@ -386,14 +462,13 @@ class StationData:
                                         order_dict[p]['compose_order'].items()})
             else:
                 total_col_order.update(order_dict[p]['compose_order'])
+            df_ls.append(df)
 
-            if df_m is None:
-                df_m = df
-            else:
-                df_m = df_m.merge(df, how='outer', on='TIMESTAMP')
-
-        # We use timestamp as index and restrict the set with respect to dates
-        df_m.set_index(keys='TIMESTAMP', inplace=True)
+        if len(df_ls) == 1:
+            df_m = df_ls[0]
+        else:
+            df_m = pd.concat(df_ls, axis=1, join='outer', sort=True)
+        df_m.index.name = 'TIMESTAMP'
 
         col_order = [total_col_order[i] for i in range(len(total_col_order))]
         df_m = df_m[col_order]
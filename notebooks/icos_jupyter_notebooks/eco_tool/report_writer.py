@@ -21,11 +21,13 @@ if os.getcwd()[-8:] == 'eco_tool':
     import icos_data
     import plot
     import json_handler as json_manager
+    from data_cache import DataCache
 else:
     from eco_tool import gui
     from eco_tool import icos_data
     from eco_tool import plot
     from eco_tool import json_handler as json_manager
+    from eco_tool.data_cache import DataCache
     from multiprocessing import Pool
 import warnings
 warnings.simplefilter("ignore", FutureWarning)
@@ -34,7 +36,7 @@ warnings.simplefilter("ignore", FutureWarning)
 class ReportWriter:
 
     def __init__(self, retriever, icos_info, debug_function=None,
-                 multiproc: bool = None):
+                 multiproc: bool = None, data_cache_dir: str = None):
 
         self.debug = True if debug_function else False
         if self.debug:
@@ -53,6 +55,18 @@ class ReportWriter:
 
         self.user_settings = self._load_user_settings()
 
+        # Data objects are stored on disk, so that repeated reports and
+        # restarts of the kernel do not download unchanged data again.
+        self.data_cache = None
+        if data_cache_dir:
+            try:
+                self.data_cache = DataCache(cache_dir=data_cache_dir)
+            except OSError as e:
+                if self.debug:
+                    self.debug_value(0, 'ReportWriter init -- Exception',
+                                     f'No data cache in {data_cache_dir}',
+                                     f'exception = {e}')
+
         self.stored_timeseries = {}
         self.cached_reports = {}
         if self.debug:
@@ -152,7 +166,8 @@ class ReportWriter:
             try:
                 df = icos_data.StationData.group_ts(var_tuple_ls=var_pid_ls,
                                                     start_date=stored_start,
-                                                    end_date=stored_end)
+                                                    end_date=stored_end,
+                                                    data_cache=self.data_cache)
             except Exception as e:
                 if self.debug:
                     import traceback
@@ -19,6 +19,7 @@ import warnings
 warnings.filterwarnings('ignore')
 import six
 from numpy import loadtxt
+from scipy import sparse
 from netCDF4 import Dataset
 import math
 from ipywidgets import Output, HBox
@@ -33,19 +34,62 @@ from bokeh.models import HoverTool, ColumnDataSource, FactorRange, Legend
 from datetime import datetime
 from matplotlib.colors import LogNorm
 import json
+import itertools
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 from icoscp_stilt import stiltstation
 
+# shared footprint functions in the tools folder, imported from the icos_jupyter_notebooks
+# folder (the working directory of the notebooks), as the other tools
+from tools.footprint import aggregate
+from tools.footprint import ancillary
+from tools.footprint import cubes
+from tools.footprint import threshold as footprint_threshold
+
 reset_output()
 output_notebook()
 
 folder_tool_fps = '/data/project/stc/footprints_2018_averaged'
 folder_data = '/data/project/stc/'
 
+#path to footprints
+pathFP = '/data/stiltweb/stations/'
+
+#number of processes reading the footprint files of one station (None = number of CPUs). 
+#1 in the processes reading several stations at the same time (see process_network)
+footprintProcesses = None
+
+#memory (MB) for the footprints of the stations read at the same time in process_network
+footprintMemoryBudget = 2048
+
 dictionary_area_choice = {'ALB':'Albania', 'Andorra':'Andorra', 'AUT':'Austria','BLR':'Belarus','BEL':'Belgium', 'BIH':'Bosnia and Herzegovina', 'BGR':'Bulgaria', 'HRV':'Croatia','CYP':'Cyprus','CZE':'Czechia','DNK':'Denmark','EST':'Estonia','FIN':'Finland','FRA':'France','DEU':'Germany','GRC':'Greece','HUN':'Hungary','IRL':'Ireland','ITA':'Italy','XKX':'Kosovo','LVA':'Latvia','LIE':'Liechtenstein','LTU':'Lithuania','LUX':'Luxembourg','MKD':'Macedonia','MTL':'Malta','MDA':'Moldova','MNE':'Montenegro','NLD':'Netherlands','NOR':'Norway','POL':'Poland','PRT':'Portugal','SRB':'Republic of Serbia','ROU':'Romania','SMR':'San Marino','SVK':'Slovakia','SVN':'Slovenia','ESP':'Spain','SWE':'Sweden','CHE':'Switzerland','GBR':'United Kingdom'}
 
 country_masks = Dataset(os.path.join(folder_data,'europe_STILT_masks.nc'))
 country_masks_eez_included = Dataset(os.path.join(folder_data,'europe_STILT_masks_eez_included.nc'))
+
+all_countries = ["ALB","Andorra","AUT", "BLR","BEL","BIH", "BGR","HRV","CYP","CZE","DNK","EST","FIN", "FRA","DEU","GRC","HUN","IRL","ITA","XKX","LVA","LIE","LTU","LUX","MKD","MTL", "MDA","MNE","NLD","NOR", "POL", "PRT","SRB","ROU","SMR","SVK","SVN","ESP","SWE","CHE","GBR"]
+
+def country_mask_matrix(masks, countries):
+    
+    #sparse matrix (country, cell) with the country masks of the flattened STILT grid. 
+    #only the cells of a country are stored, the whole breakdown by country is one matrix product
+    data = []
+    indices = []
+    indptr = [0]
+    ncells = None
+    
+    for country_code in countries:
+        mask = np.ma.filled(masks.variables[country_code][:,:], 0).ravel()
+        ncells = len(mask)
+        cells = np.flatnonzero(mask)
+        data.append(mask[cells].astype(np.float64))
+        indices.append(cells)
+        indptr.append(indptr[-1] + len(cells))
+    
+    return sparse.csr_matrix((np.concatenate(data), np.concatenate(indices), np.array(indptr)), 
+                             shape=(len(countries), ncells))
+
+country_masks_matrix = country_mask_matrix(country_masks, all_countries)
     
 def save_settings(settings, directory):
 
@@ -62,39 +106,17 @@ def save_settings(settings, directory):
 
 def import_landcover_HILDA(year='2018'):
     
-    name_data = 'hilda_lulc_'+ year +'.nc' 
-    
-    all_hilda_classes= Dataset(folder_data + name_data)
-
-    #access all the different land cover classes in the .nc files:
-    cropland = all_hilda_classes.variables['cropland'][:,:]
-    ocean = all_hilda_classes.variables['ocean'][:,:]
-    forest_decidious_broad_leaf = all_hilda_classes.variables['f_de_br_le'][:,:]
-    forest_decidious_needle_leaf = all_hilda_classes.variables['f_de_ne_le'][:,:]
-    forest_evergreen_broad_leaf = all_hilda_classes.variables['f_eg_br_le'][:,:]
-    forest_evergreen_needle_leaf = all_hilda_classes.variables['f_eg_ne_le'][:,:]
-    mixed_forest = all_hilda_classes.variables['forest_mix'][:,:]
-    forest_unknown = all_hilda_classes.variables['forest_unk'][:,:]
-    grass_shrub = all_hilda_classes.variables['grass_shru'][:,:]
-    other_land = all_hilda_classes.variables['other_land'][:,:]
-    pasture = all_hilda_classes.variables['pasture'][:,:]
-    urban = all_hilda_classes.variables['urban'][:,:]
-    water = all_hilda_classes.variables['water'][:,:]
-    unknown = all_hilda_classes.variables['unknown'][:,:]
-    
-    # aggregated classes:
-    broad_leaf_forest = forest_decidious_broad_leaf + forest_evergreen_broad_leaf 
-    coniferous_forest = forest_decidious_needle_leaf+ forest_evergreen_needle_leaf
-    mixed_forest = mixed_forest + forest_unknown
-    other = other_land + water
+    #read once and shared with the station characterization, see tools/footprint/ancillary.py
+    names, landcover = ancillary.landcover_HILDA(year, path=folder_data)
+    
+    broad_leaf_forest, coniferous_forest, mixed_forest, ocean, other, grass_shrub, cropland, pasture, urban, unknown = landcover
    
     return broad_leaf_forest, coniferous_forest, mixed_forest, ocean, other, grass_shrub, cropland, pasture, urban, unknown
 
 def import_population_data():
 
-    pop_data= Dataset(os.path.join(folder_data, 'GEOSTAT_population_2011_2018.nc'))
+    fp_pop = ancillary.grid_variable('GEOSTAT_population_2011_2018.nc', '2018', path=folder_data)
     
-    fp_pop=pop_data.variables['2018'][:,:]
     return fp_pop
 
 # function to convert station longitude and latitude (slat, slon) to indices of STILT model grid (ix,jy)
@@ -218,45 +240,36 @@ def plot_maps(field, lon, lat, title='', label='', unit='', linlog='linear', sta
 
 def update_footprint_based_on_threshold(input_footprint, threshold):
     
-    threshold_sensitivity = input_footprint.sum() * threshold
-
-    df_sensitivity = pd.DataFrame({
-        'sensitivity': input_footprint.flatten()
-    })
-
-    #sort the DataFrame by sensitivity values in descending order
-    df_sensitivity_sorted = df_sensitivity.sort_values(by='sensitivity', ascending=False)
+    #the footprint where only the most sensitive cells making up the threshold (share of
+    #the total sensitivity) keep their values. A list of thresholds gives a list of footprints
+    #from one sorting, see tools/footprint/threshold.py
+    return footprint_threshold.footprint_based_on_threshold(input_footprint, threshold)
 
-    #calculate the cumulative sum of the sorted sensitivity values
-    df_sensitivity_sorted['cumsum_sens'] = df_sensitivity_sorted['sensitivity'].cumsum()
-
-    #apply the threshold condition
-    if threshold == 1:
-        df_sensitivity_sorted['mask_threshold'] = np.where(df_sensitivity_sorted['sensitivity'] == 0, 0, 1)
-    else:
-        df_sensitivity_sorted['mask_threshold'] = np.where(df_sensitivity_sorted['cumsum_sens'] >= threshold_sensitivity, 0, 1)
-
-    #compute the updated sensitivity values where the footprint has the value 0 in case of below the threshold
-    df_sensitivity_sorted['mask_sensitivity'] = df_sensitivity_sorted['mask_threshold'] * df_sensitivity_sorted['sensitivity']
-
-    #restore the original order
-    df_sensitivity_upd = df_sensitivity_sorted.sort_index()
-
-    #convert the updated sensitivity values back to the original shape
-    upd_footprint_sens = df_sensitivity_upd['mask_sensitivity'].values.reshape(input_footprint.shape)
-
-    return upd_footprint_sens
-
-def load_and_update_footprint(station, date_range, unique_hours, threshold):
+def is_2018_full_year(date_range, unique_hours):
     
-    # check if there is a pre-computed footprint.
-    is_2018_full_year = (
+    # there are pre-computed footprints for 2018 (all hours)
+    return (
         pd.Timestamp(min(date_range)) == pd.Timestamp(2018, 1, 1, 0) and
         pd.Timestamp(max(date_range)) == pd.Timestamp(2018, 12, 31, 21) and
         len(unique_hours) == 8
     )
 
-    if is_2018_full_year:
+def footprints_on_server(station, date_range, unique_hours):
+    
+    # True if the footprints are read from this server (pre-computed 2018 footprints, monthly 
+    # sums or footprint files), False if they have to be fetched with stiltstation
+    if is_2018_full_year(date_range, unique_hours):
+        return True
+    
+    return (cubes.has_cube(station, date_range.year.unique()) or 
+            len(aggregate.footprint_dates(station, date_range, pathFP)) > 0)
+
+def load_and_update_footprint(station, date_range, unique_hours, threshold):
+    
+    # check if there is a pre-computed footprint.
+    is_2018 = is_2018_full_year(date_range, unique_hours)
+
+    if is_2018:
         name_load_footprint_csv = f'fp_{station}.csv'
         filepath = os.path.join(folder_tool_fps, name_load_footprint_csv)
 
@@ -265,10 +278,20 @@ def load_and_update_footprint(station, date_range, unique_hours, threshold):
         else:
             aggregated_footprint = None
     else:
+        # whole months from the precomputed monthly sums (if any), the other dates from the 
+        # footprint files: only the files of the selected dates and hours are read, and they are 
+        # summed in chunks (see tools/footprint/cubes.py and tools/footprint/aggregate.py)
+        result = cubes.read_footprints(station, date_range, path=pathFP, processes=footprintProcesses)
+        aggregated_footprint = result.fp[0] if result.nfp > 0 else None
+        
+    if aggregated_footprint is None and not is_2018:
+        # footprints not available on this server. get_fp returns all footprints from the 
+        # first to the last date (in memory), the hours are selected after that.
         try:
             st = stiltstation.get(id=station)
             footprints =  st.get_fp(date_range.min(), date_range.max())
-            footprints_filtered = footprints.where(footprints.time.dt.hour.isin(unique_hours), drop=True)
+            # select the hours by index (no masked copy of the whole cube)
+            footprints_filtered = footprints.isel(time=footprints.time.dt.hour.isin(unique_hours).values)
             # fp values for the cells are stored in the variable "foot"
             aggregated_footprint = footprints_filtered.mean(dim="time").foot.values
 
@@ -280,23 +303,147 @@ def load_and_update_footprint(station, date_range, unique_hours, threshold):
 
     return update_footprint_based_on_threshold(aggregated_footprint, threshold)
 
-def process_network(stations, date_range, threshold, load_lat, load_lon, df_footprints_network, index, list_non_footprints):
+def _init_footprint_worker():
+    
+    #the stations are read in parallel, each process reads the files of its station itself
+    global footprintProcesses
+    footprintProcesses = 1
+
+def _load_station_footprint(args):
+    
+    station, date_range, unique_hours, threshold = args
+    
+    return station, load_and_update_footprint(station, date_range, unique_hours, threshold)
+
+def station_footprints_concurrently(stations, date_range, unique_hours, threshold, ncells, processes=None):
+    
+    """
+    Yields (station, footprint within the threshold or None) in the order the stations are 
+    done. The stations with footprints on this server are read at the same time in a pool 
+    of processes. The number of stations in progress is limited by footprintMemoryBudget, 
+    and a new station is only started when the footprint of a finished station has been taken.
+    
+    The budget assumes a few grids per station, which holds when the footprints are summed 
+    from the files. Stations without footprints on this server are fetched with stiltstation, 
+    which holds all footprints of the date range in memory: these stations are read one at a 
+    time, after the pool, and are not covered by footprintMemoryBudget.
+    """
+    
+    tasks = [(station, date_range, unique_hours, threshold) for station in stations]
+    
+    if processes is None:
+        processes = os.cpu_count() or 1
+    
+    #grids (float64) per station in progress: sum of the footprints, footprint read, ranking of the cells, result...
+    station_bytes = ncells * 8 * 8
+    processes = max(1, min(processes, len(tasks), int(footprintMemoryBudget * 1024**2 // station_bytes)))
+    
+    if processes == 1:
+        for task in tasks:
+            yield _load_station_footprint(task)
+        return
+    
+    on_server = [footprints_on_server(task[0], date_range, unique_hours) for task in tasks]
+    fetched_tasks = [task for task, read in zip(tasks, on_server) if not read]
+    tasks = [task for task, read in zip(tasks, on_server) if read]
+    
+    if len(tasks) > 0:
+        
+        processes = min(processes, len(tasks))
+        tasks = iter(tasks)
+        
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_footprint_worker) as ex:
+            
+            pending = {ex.submit(_load_station_footprint, task) for task in itertools.islice(tasks, processes)}
+            
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    yield future.result()
+                    
+                    task = next(tasks, None)
+                    if task is not None:
+                        pending.add(ex.submit(_load_station_footprint, task))
+    
+    for task in fetched_tasks:
+        yield _load_station_footprint(task)
+
+def network_maxima(networks, date_range, threshold, load_lat, load_lon, list_non_footprints, network_max=None, station_footprints=None, processes=None):
+    
+    """
+    Maximum sensitivity in each cell of several networks (lists of stations): the 
+    footprints of all stations (only the cells making up the threshold) are read at the 
+    same time (see station_footprints_concurrently) and each footprint is added to the 
+    running maximum (float32 grid) of the networks it belongs to. A station in several 
+    networks is only read once.
+    
+    network_max :       list with the running maximum to continue on for each network 
+                        (None or a grid, updated in place). Default is None for all.
+    station_footprints: dictionary, if given the footprint of each station is added 
+                        (station: float32 grid).
+    processes :         number of stations read at the same time, default is the number of CPUs.
+    
+    Returns the list of maximum grids, None for a network without footprints (and no 
+    network_max). Stations without footprints are added to list_non_footprints.
+    """
+    
+    if network_max is None:
+        network_max = [None] * len(networks)
+    network_max = list(network_max)
     
     unique_hours = list(date_range.hour.unique())
+    shape = (len(load_lat), len(load_lon))
     
-    for station in stations:
-        updated_fp = load_and_update_footprint(station, date_range, unique_hours, threshold)
+    #all stations in the order of the networks, each station once
+    stations = list(dict.fromkeys(station for network in networks for station in network))
+    
+    missing = set()
+    footprints = {}
+    
+    for station, updated_fp in station_footprints_concurrently(stations, date_range, unique_hours, threshold, 
+                                                                shape[0] * shape[1], processes=processes):
         if updated_fp is None:
-            list_non_footprints.append(station)
+            missing.add(station)
             continue
-        df_footprints_network[f'fp_{index}'] = updated_fp.flatten()
-        index += 1
+            
+        updated_fp = np.asarray(updated_fp, dtype=np.float32).reshape(shape)
+        
+        for i, network in enumerate(networks):
+            if station not in network:
+                continue
+                
+            if network_max[i] is None:
+                network_max[i] = updated_fp.copy()
+            else:
+                #fmax: nan values are ignored (as in pandas max)
+                np.fmax(network_max[i], updated_fp, out=network_max[i])
+        
+        if station_footprints is not None:
+            footprints[station] = updated_fp
+    
+    #in the order of the stations (not the order they were read)
+    list_non_footprints.extend(station for network in networks for station in network if station in missing)
+    
+    if station_footprints is not None:
+        station_footprints.update((station, footprints[station]) for station in stations if station in footprints)
+    
+    return network_max
 
-    if not df_footprints_network.empty:
-        df_max_network = df_footprints_network.max(axis=1)
-        return np.array(df_max_network.tolist()).reshape((len(load_lat), len(load_lon))), df_footprints_network, index
+def process_network(stations, date_range, threshold, load_lat, load_lon, list_non_footprints, network_max=None, station_footprints=None, processes=None):
     
-    return None, df_footprints_network, index
+    """
+    Maximum sensitivity of the network in each cell (see network_maxima).
+    
+    network_max :       running maximum to continue on (updated in place), for example 
+                        a copy of the base network for the compare network.
+    
+    Returns the maximum grid, None if no station (and no network_max) has footprints. 
+    """
+    
+    return network_maxima([stations], date_range, threshold, load_lat, load_lon, list_non_footprints, 
+                          network_max=[network_max], station_footprints=station_footprints, 
+                          processes=processes)[0]
 
 def return_networks(networkObj):
     now = datetime.now()
@@ -311,114 +458,114 @@ def return_networks(networkObj):
     load_lat = networkObj.loadLat
     load_lon = networkObj.loadLon
     
-    df_footprints_network = pd.DataFrame()
     list_non_footprints = []
-    index = 1
     
-    fp_max_base_network, df_footprints_network, index,  = process_network(
-        stations_base_network, date_range, threshold,
-        load_lat, load_lon, df_footprints_network, index, list_non_footprints
+    #the footprints of the individual stations are only kept on request
+    if networkObj.settings.get('keepStationFootprints', False):
+        station_footprints = {}
+    else:
+        station_footprints = None
+    
+    #the stations of both networks are read at the same time. The compare network is an 
+    #extension of the base network: maximum of the base network and the added stations
+    fp_max_base_network, fp_max_added_stations = network_maxima(
+        [stations_base_network, stations_compare_network or []], date_range, threshold,
+        load_lat, load_lon, list_non_footprints, station_footprints=station_footprints, 
+        processes=networkObj.settings.get('footprintProcesses')
     )
 
     if fp_max_base_network is None:
-        return None, None, list_non_footprints, date_time
+        return None, None, list_non_footprints, date_time, station_footprints
 
     if not stations_compare_network:
-        return fp_max_base_network, None, list_non_footprints, date_time
+        return fp_max_base_network, None, list_non_footprints, date_time, station_footprints
 
-    # continues on df_footprints_network (compare network is an extension of the base network. 
-    fp_max_compare_network, _, _ = process_network(
-        stations_compare_network, date_range, threshold,
-        load_lat, load_lon, df_footprints_network, index, list_non_footprints
-    )
+    fp_max_compare_network = fp_max_base_network.copy()
+    if fp_max_added_stations is not None:
+        np.fmax(fp_max_compare_network, fp_max_added_stations, out=fp_max_compare_network)
 
     if fp_max_compare_network is not None and fp_max_compare_network.sum() == fp_max_base_network.sum():
         fp_max_compare_network = None
 
-    return fp_max_base_network, fp_max_compare_network, list_non_footprints, date_time
+    return fp_max_base_network, fp_max_compare_network, list_non_footprints, date_time, station_footprints
     
 
 def country_dict_landcover(networkObj):
     
     base_network =  networkObj.baseNetwork
     
-    total_sens_base_network = base_network.sum()
-    
     compare_network = networkObj.compareNetwork
     
-    fp_pop = import_population_data()
+    fp_pop = np.ma.filled(import_population_data(), 0).ravel()
     
-    if compare_network is not None: 
-        total_sens_compare_network = compare_network.sum()
+    gridarea = ancillary.grid_area_m2(path=folder_data).ravel()
     
-    f_gridarea = cdf.Dataset(os.path.join(folder_data, 'gridareaSTILT.nc'))
-    gridarea = f_gridarea.variables['cell_area'][:]
+    land_cover_names = ['Broad leaf forest', 'Coniferous forest', 'Mixed forest', 'Cropland', 'Pasture', 'Urban', 'Ocean', 'Grass/shrubland', 'Other', 'Unknown']
     
-    broad_leaf_forest, coniferous_forest, mixed_forest, ocean, other, grass_shrub, cropland, pasture, urban, unknown = import_landcover_HILDA(year='2018') 
+    #land cover classes (class, cell) in the order of land_cover_names
+    hilda_names, hilda_stack = ancillary.landcover_HILDA('2018', path=folder_data)
+    land_cover = hilda_stack.reshape(len(hilda_names), -1)[[hilda_names.index(name) for name in land_cover_names]]
     
-    list_land_cover_classes = [broad_leaf_forest, coniferous_forest, mixed_forest, cropland, pasture, urban, ocean, grass_shrub, other, unknown]
+    nclasses = len(land_cover_names)
     
-    land_cover_names = ['Broad leaf forest', 'Coniferous forest', 'Mixed forest', 'Cropland', 'Pasture', 'Urban', 'Ocean', 'Grass/shrubland', 'Other', 'Unknown']
+    #the values to sum per country, one column each (cell, value):
+    #area (km2), land cover, then sensitivity, population sensitivity and land cover
+    #sensitivity of the base network (and the compare network)
+    columns = [(gridarea/1000000)[:, np.newaxis], land_cover.T]
     
-    all_countries = ["ALB","Andorra","AUT", "BLR","BEL","BIH", "BGR","HRV","CYP","CZE","DNK","EST","FIN", "FRA","DEU","GRC","HUN","IRL","ITA","XKX","LVA","LIE","LTU","LUX","MKD","MTL", "MDA","MNE","NLD","NOR", "POL", "PRT","SRB","ROU","SMR","SVK","SVN","ESP","SWE","CHE","GBR"]
+    networks = [('base_network_breakdown', base_network)]
+    if compare_network is not None: 
+        networks.append(('compare_network_breakdown', compare_network))
+    
+    for breakdown, network in networks:
+        network = np.ma.filled(network, 0).ravel().astype(np.float64)
+        columns.append(network[:, np.newaxis])
+        columns.append((network * fp_pop)[:, np.newaxis])
+        columns.append(land_cover.T * network[:, np.newaxis])
+    
+    #sums (country, value) of all countries and values in one product with the sparse country masks
+    sums = country_masks_matrix @ np.hstack(columns)
     
     dict_all_countries= {}
     
-    for country_code in all_countries:
+    for i, country_code in enumerate(all_countries):
+        
+        country_sums = sums[i]
         
         dict_all_countries[country_code]={}
      
         dict_all_countries[country_code]['country_breakdown'] = {}
         
-        dict_all_countries[country_code]['base_network_breakdown'] = {}
-        
-        country_mask = country_masks.variables[country_code][:,:]
         #area of country 
-        country_area_grid = (gridarea*country_mask)/1000000
-        country_area_total=country_area_grid.sum()
+        country_area_total = country_sums[0]
         dict_all_countries[country_code]['country_breakdown']['total area (km2)'] = country_area_total
         
-        if compare_network is not None: 
+        for j, land_cover_name in enumerate(land_cover_names):
             
-            dict_all_countries[country_code]['compare_network_breakdown'] = {}
+            # country breakdown
+            area_country_landcover = country_sums[1 + j]
+            
+            dict_all_countries[country_code]['country_breakdown'][land_cover_name] = (area_country_landcover / country_area_total)*100 
+        
+        #columns of the networks start after the area and the land cover
+        start = 1 + nclasses
+        
+        for breakdown, network in networks:
             
-            country_compare_network_sens_total = (compare_network * country_mask).sum()
+            network_sums = country_sums[start:start + 2 + nclasses]
+            start = start + 2 + nclasses
             
-            dict_all_countries[country_code]['compare_network_breakdown']['total sens'] = country_compare_network_sens_total
+            dict_all_countries[country_code][breakdown] = {}
             
-            dict_all_countries[country_code]['compare_network_breakdown']['total sens/km2'] = country_compare_network_sens_total/country_area_total
-     
-            dict_all_countries[country_code]['compare_network_breakdown']['population sens'] = (country_mask * compare_network * fp_pop).sum()
+            dict_all_countries[country_code][breakdown]['total sens'] = network_sums[0]
             
-      
-        country_base_network_sens_total = (base_network * country_mask).sum()
-
-        dict_all_countries[country_code]['base_network_breakdown']['total sens'] = country_base_network_sens_total
-
-        dict_all_countries[country_code]['base_network_breakdown']['total sens/km2'] = country_base_network_sens_total/country_area_total
-        
-        dict_all_countries[country_code]['base_network_breakdown']['population sens'] = (country_mask * base_network * fp_pop).sum()
-       
-        for land_cover, land_cover_name in zip(list_land_cover_classes, land_cover_names):
-        
-            # country breakdown
-            area_country_landcover = (land_cover*country_mask).sum()
+            dict_all_countries[country_code][breakdown]['total sens/km2'] = network_sums[0]/country_area_total
             
-            percent_country_breakdown = (area_country_landcover / country_area_total)*100 
+            dict_all_countries[country_code][breakdown]['population sens'] = network_sums[1]
             
-            dict_all_countries[country_code]['country_breakdown'][land_cover_name]=percent_country_breakdown
-
-            if compare_network is not None: 
-                sens_country_landcover_compare = (country_mask * compare_network * land_cover).sum()
-                
-                dict_all_countries[country_code]['compare_network_breakdown'][land_cover_name+ ' total'] = sens_country_landcover_compare
+            for j, land_cover_name in enumerate(land_cover_names):
                 
-
-            # base network breakdown
-            
-            sens_country_landcover_base = (country_mask * base_network * land_cover).sum()
-
-            dict_all_countries[country_code]['base_network_breakdown'][land_cover_name + ' total']= sens_country_landcover_base
+                dict_all_countries[country_code][breakdown][land_cover_name + ' total'] = network_sums[2 + j]
 
     return dict_all_countries
     
@@ -1142,65 +1289,18 @@ def histogram_fp_distribution(networkObj, fp_type):
 # 10-90% footprint visualization notebook
 def footprint_show_percentages(footprint_code, input_footprint, fp_lat, fp_lon, return_fp=False):
 
-    sum_sensitivity_values=sum(input_footprint.flatten()) 
-    #create a dataframe that will have the updated sensitivity values + the steps on the way
-    df_sensitivity = pd.DataFrame()
-
-    #one column with the original senstivity values. Has an index that will be used to sort back to 
-    #this order (flattened 2D... back to 2D with updated sensitivity values in last step)
-    df_sensitivity['sensitivity']=input_footprint.flatten()
-    
-    #sensitivity values sorterd from largest to smallest
-    df_sensitivity_sorted=df_sensitivity.sort_values(by=['sensitivity'], ascending=False)
-    
-    #another column that has the cumilated sum of the values in the sensitivity column.
-    #used to determine when the footprint threshold is met. 
-    df_sensitivity_sorted['cumsum_sens']=df_sensitivity_sorted.cumsum()
-    
-    #mask threshold: when the cumulative sum is over the threshold - these values are assigned 0.
-    #to be multiplied with the original sensitivity values (disregard the ones with value 0)
-    #df_sensitivity_sorted['ten_percent']=df_sensitivity_sorted['cumsum_sens']
-    df_sensitivity_sorted['twenty_percent']=df_sensitivity_sorted['cumsum_sens']
-    df_sensitivity_sorted['thirty_percent']=df_sensitivity_sorted['cumsum_sens']
-    df_sensitivity_sorted['forty_percent']=df_sensitivity_sorted['cumsum_sens']
-    df_sensitivity_sorted['fifty_percent']=df_sensitivity_sorted['cumsum_sens']
-    
-    
-    ten_percent = sum_sensitivity_values*0.1
-    twenty_percent = sum_sensitivity_values*0.2
-    thirty_percent = sum_sensitivity_values*0.3
-    forty_percent = sum_sensitivity_values*0.4
-    fifty_percent = sum_sensitivity_values*0.5
-    sixty_percent = sum_sensitivity_values*0.6
-    seventy_percent = sum_sensitivity_values*0.7
-    eighty_percent = sum_sensitivity_values*0.8
-    ninty_percent = sum_sensitivity_values*0.9
-
-    
-    df_sensitivity_sorted['ten_percent']= np.where(df_sensitivity_sorted['cumsum_sens']>=ten_percent, 0, 1)
-    df_sensitivity_sorted['twenty_percent']= np.where(df_sensitivity_sorted['cumsum_sens']>=twenty_percent, 0, 1)
-    df_sensitivity_sorted['thirty_percent']= np.where(df_sensitivity_sorted['cumsum_sens']>=thirty_percent, 0, 1)
-    df_sensitivity_sorted['forty_percent']= np.where(df_sensitivity_sorted['cumsum_sens']>=forty_percent, 0, 1)
-    df_sensitivity_sorted['fifty_percent']= np.where(df_sensitivity_sorted['cumsum_sens']>=fifty_percent, 0, 1)  
-    df_sensitivity_sorted['sixty_percent']= np.where(df_sensitivity_sorted['cumsum_sens']>=sixty_percent, 0, 1)
-    df_sensitivity_sorted['seventy_percent']= np.where(df_sensitivity_sorted['cumsum_sens']>=seventy_percent, 0, 1)
-    df_sensitivity_sorted['eighty_percent']= np.where(df_sensitivity_sorted['cumsum_sens']>=eighty_percent, 0, 1)
-    df_sensitivity_sorted['ninty_percent']= np.where(df_sensitivity_sorted['cumsum_sens']>=ninty_percent, 0, 1)
-    
-
-    df_sensitivity_sorted['aggreg'] = df_sensitivity_sorted['ten_percent'] + df_sensitivity_sorted['twenty_percent']+df_sensitivity_sorted['thirty_percent']+df_sensitivity_sorted['forty_percent']+df_sensitivity_sorted['fifty_percent'] + df_sensitivity_sorted['sixty_percent'] + df_sensitivity_sorted['seventy_percent'] + df_sensitivity_sorted['eighty_percent'] + df_sensitivity_sorted['ninty_percent']
-    
-    df_sensitivity_sorted['aggreg']=df_sensitivity_sorted['aggreg']*10
+    #masks for the 10, 20, ... 90% most important sensitivity areas (one sorting for all).
+    #the number of masks a cell is in gives the smallest of these areas that the cell belongs to.
+    masks = footprint_threshold.threshold_masks(np.asarray(input_footprint).flatten(), 
+                                                [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9])
     
-    df_sensitivity_sorted['reversed_percent'] = 100 - df_sensitivity_sorted['aggreg']
+    aggreg = np.sum(masks, axis=0) * 10
     
-    df_sensitivity_sorted['reversed_percent']= np.where(df_sensitivity_sorted['reversed_percent']>90, 0, df_sensitivity_sorted['reversed_percent'])
+    reversed_percent = 100 - aggreg
     
-    df_sensitivity_upd=df_sensitivity_sorted.sort_index()
+    reversed_percent = np.where(reversed_percent > 90, 0, reversed_percent)
     
-    list_aggreg_footprint=df_sensitivity_upd['reversed_percent'].tolist()
-
-    footprint_0_90=np.array(list_aggreg_footprint).reshape((len(fp_lat), len(fp_lon)))
+    footprint_0_90=reversed_percent.reshape((len(fp_lat), len(fp_lon)))
     
     if return_fp:
         return footprint_0_90
@@ -32,6 +32,8 @@ class NetworkObj():
         self.loadLon = loadtxt(os.path.join(folder_tool_fps, 'longitude.csv'), delimiter=',')
         self.baseNetwork = None
         self.compareNetwork = None
+        self.stationFootprints = None   # dictionary station: footprint within the threshold (float32), 
+                                        # only if settings['keepStationFootprints'] is True
         self.vmaxPercentile = 99.5
         self.vmaxSens = None
         self.compareMinusBase = None
@@ -46,7 +48,7 @@ class NetworkObj():
  
     def _setNetworks(self):
         
-        self.baseNetwork, self.compareNetwork, self.noFootprints, self.dateTime = functions.return_networks(self)
+        self.baseNetwork, self.compareNetwork, self.noFootprints, self.dateTime, self.stationFootprints = functions.return_networks(self)
         
         if self.compareNetwork is not None:
          
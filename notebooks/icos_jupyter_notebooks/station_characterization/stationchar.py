@@ -80,6 +80,8 @@ class StationChar():
         self.intervalLabels = None      # list with the bin labels for the maps 
         self.dirBins = None             # numpy array with the direction bins for the maps
         self.dirLabels = None           # list with the direction labels for the maps
+        self.roseBinIndex = None        # numpy array with the (distance, direction) bin of each cell for the maps
+        self.roseNumberBins = None      # number of (distance, direction) bins for the maps
 
         
         self.figures = {}               # dictionary to store figures and captions
@@ -150,25 +152,12 @@ class StationChar():
         """
         Distances and degrees from the station to all cells in the STILT grid.
         The information is used to bin the footprints based on angle and distance 
-        to station. For the labelled atmoshperic stations (as of 2020-07-15)
-        this is pre-calculated and accessed from csv-files. If it is any other
-        station, these values are calculated and set as attributes. The 
-        calculated values are also appended to the csv-files. 
+        to station. The values are calculated for the whole grid at once and 
+        saved, so that the next object for a station with the same coordinates 
+        reads them from file (see stc_functions.distances_and_degrees_to_grid_cells). 
         """
-      
-        #saved distances and degrees for ICOS stations:
-        df_w_distances=pd.read_csv(stcDataPath+ "approved_stations_distances.csv")
-        df_w_degrees=pd.read_csv(stcDataPath + "approved_stations_degrees.csv") 
-    
-        #if not saved distances to all 192000 cells, calculate it. 
-        if self.stationId in df_w_degrees.keys().tolist():
-            self.distances=df_w_distances[self.stationId]
-            self.degrees=df_w_degrees[self.stationId]
         
-        else:
-            self.distances=stc_functions.distances_from_point_to_grid_cells(self.lat, self.lon, self.fpLat, self.fpLon)
-
-            self.degrees=stc_functions.degrees_from_point_to_grid_cells(self.lat, self.lon, self.fpLat, self.fpLon)
+        self.distances, self.degrees = stc_functions.distances_and_degrees_to_grid_cells(self.lat, self.lon, self.fpLat, self.fpLon)
 
     #or other class... but belongs to object station characterization as much as distances and degrees to footprint?   
     #can now remove "define_bins_landcover_polar_graph"
@@ -183,6 +172,9 @@ class StationChar():
         bin_size = self.settings['binSize']
         self.intervalBins, self.intervalLabels, self.dirBins, self.dirLabels = stc_functions.define_bins_maprose(km_intervals, bin_size)
         
+        #the bin of each cell, shared by all maps of the station
+        self.roseBinIndex, self.roseNumberBins = stc_functions.maprose_bin_index(self.distances, self.degrees, self.intervalBins, self.dirBins)
+        
     def add_figure(self, key, figure, caption):
         """
         add figures in the dictionary self.figures. To retrieve the figures
@@ -19,6 +19,7 @@ import textwrap
 import datetime as dt
 import os
 import six
+import subprocess
 import requests
 import tex
 from IPython.core.display import display, HTML 
@@ -32,6 +33,16 @@ from cartopy.feature import ShapelyFeature
 import warnings
 warnings.filterwarnings('ignore')
 import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+# shared footprint functions in the tools folder, imported from the icos_jupyter_notebooks
+# folder (the working directory of the notebooks), as the other tools
+from tools.footprint import aggregate
+from tools.footprint import ancillary
+from tools.footprint import cubes
+from tools.footprint import threshold as footprint_threshold
+from tools.stilt import results as stilt_results
 
 #path to data such as population data and land cover data
 stcDataPath='/data/project/stc/'
@@ -39,6 +50,31 @@ stcDataPath='/data/project/stc/'
 #path to footprints
 pathFP='/data/stiltweb/stations/'
 
+#path to locally computed values that are reused (distances and degrees to the grid cells)
+stcCachePath=os.path.join(os.path.expanduser('~'), 'output', 'station_characterization', 'cache')
+
+#number of processes used to read the footprint files (None = number of CPUs). 
+#set to 1 when many station characterizations run in parallel (stc_generate_PDFs.py)
+footprintProcesses=None
+
+#pre-computed annual averages for the multiple variables graph (in stcDataPath)
+multipleVariablesPrecomputed='seasonal_table_values_2024_02_19.csv'
+
+#client for the STILT results (saved in stcCachePath), see get_stilt_client. 
+#set to a StiltResultClient(url=...) to use another server, e.g. tools/stilt/standin.py
+stilt_client = None
+_stilt_client_pid = None
+
+#STILT result columns used for the seasonal table and the multiple variables graph
+stilt_columns = ['co2.bio.gee', 'co2.bio.resp', 'co2.industry', 'co2.energy', 'co2.transport', 'co2.residential', 'co2.other_categories']
+
+#the stations to compare to in the multiple variables graph
+reference_stations = ['TRN180', 'SVB150', 'TOH147', 'SMR125', 'LUT', 'KRE250', 'IPR100', 'JFJ', 'KIT200', 'GAT344']
+
+#values for the multiple variables graph computed in this kernel (or handed over by 
+#stc_generate_PDFs.py), key: (footprints_modified, number of footprints, values), see multiple_variable_values
+reference_values = {}
+
 #added to not show the land cover bar graph that is being saved for the PDF which is different size than the one displayed
 matplotlib.pyplot.ioff()
 
@@ -49,87 +85,78 @@ R = 6373.8
 dictionary_color = {'Broad leaf forest': {'color': '#4c9c5e'}, 'Coniferous forest':{'color':'#CAE0AB'}, 'Mixed forest':{'color':'#90C987'}, 'Ocean':{'color':'#1964B0'}, 'Other':{'color':'#882E72'}, 'Grass/shrubland':{'color':'#F1932D'}, 'Cropland':{'color': '#521A13'}, 'Pasture':{'color':'#F7F056'}, 'Urban':{'color':'#DC050C'}, 'Unknown':{'color':'#777777'}}
 
 #function to read and aggregate footprints for given date range
-def read_aggreg_footprints(station, date_range):
+def read_aggreg_footprints(station, date_range, processes=None, report=False):
     
-    # loop over all dates and read netcdf files
-
-    # path to footprint files in new stiltweb directory structure
-    pathFP='/data/stiltweb/stations/'
+    # whole months are taken from the precomputed monthly sums (tools/footprint/cubes.py),
+    # the remaining footprint files are read and summed in parallel (tools/footprint/aggregate.py)
+    if processes is None:
+        processes = footprintProcesses
     
-    fp=[]
-    nfp=0
-    first = True
-    for date in date_range:
-
-        filename=(pathFP+station+'/'+str(date.year)+'/'+str(date.month).zfill(2)+'/'
-             +str(date.year)+'x'+str(date.month).zfill(2)+'x'+str(date.day).zfill(2)+'x'+str(date.hour).zfill(2)+'/foot')
- 
-        if os.path.isfile(filename):
-            f_fp = cdf.Dataset(filename)
-          
-            if (first):
-                fp=f_fp.variables['foot'][:,:,:]
-                lon=f_fp.variables['lon'][:]
-                lat=f_fp.variables['lat'][:]
-                first = False
-            else:
-                fp=fp+f_fp.variables['foot'][:,:,:]
-            f_fp.close()
-            nfp+=1
-        #else:
-            #print ('file does not exist: ',filename)
-    if nfp > 0:
-        fp=fp/nfp
+    result = cubes.read_footprints(station, date_range, path=pathFP, processes=processes)
+    
+    if report:
+        print(station + ': ' + str(result.stats))
+    
+    if result.nfp > 0:
         title = 'not used'
         
-        return nfp, fp, lon, lat, title
+        return result.nfp, result.fp, result.lon, result.lat, title
 
     else:
 
         return 0, None, None, None, None
 
-# function to read STILT concentration time series (new format of STILT results)
-def read_stilt_timeseries(station,date_range,timeselect_list):
-    url = 'https://stilt.icos-cp.eu/viewer/stiltresult'
-    headers = {'Content-Type': 'application/json', 'Accept-Charset': 'UTF-8'}
+def get_stilt_client():
+    
+    #one client (with its open connections) per process, a client inherited from 
+    #another process (process pools) is replaced by a client with the same settings
+    global stilt_client, _stilt_client_pid
+    
+    if stilt_client is None:
+        stilt_client = stilt_results.StiltResultClient(cache_dir=os.path.join(stcCachePath, 'stilt_results'))
+        
+    elif _stilt_client_pid != os.getpid():
+        stilt_client = stilt_results.StiltResultClient(url=stilt_client.url, cache_dir=stilt_client.cache_dir)
+    
+    _stilt_client_pid = os.getpid()
+        
+    return stilt_client
 
-    new_range=[]
+# function to read STILT concentration time series (new format of STILT results)
+def read_stilt_timeseries(station,date_range,timeselect_list,columns=None):
+    
+    if columns is None:
+        columns = stilt_results.all_columns
     
-    for date in date_range:
-        if os.path.exists(pathFP+station+'/'+str(date.year)+'/'+str(date.month).zfill(2)+'/'
-             +str(date.year)+'x'+str(date.month).zfill(2)+'x'+str(date.day).zfill(2)+'x'+str(date.hour).zfill(2)+'/'):
-            new_range.append(date)
+    #the results are requested from the first to the last date with a footprint 
+    #(the footprint folders are listed once per month)
+    new_range = aggregate.footprint_dates(station, date_range, pathFP)
+    
+    df = None
             
     if len(new_range) > 0:
-        date_range = new_range
-        fromDate = date_range[0].strftime('%Y-%m-%d')
-        toDate = date_range[-1].strftime('%Y-%m-%d')
-        columns = ('["isodate","co2.stilt","co2.fuel","co2.bio","co2.bio.gee","co2.bio.resp","co2.fuel.coal","co2.fuel.oil",'+
-                   '"co2.fuel.gas","co2.fuel.bio","co2.fuel.waste", "co2.energy","co2.transport", "co2.industry",'+
-                   '"co2.other_categories", "co2.residential", "co2.cement", "co2.background",'+
-                   '"co.stilt","co.fuel","co.bio","co.fuel.coal","co.fuel.oil",'+
-                   '"co.fuel.gas","co.fuel.bio","co.energy","co.transport", "co.industry",'+
-                   '"co.others", "co.cement", "co.background",'+
-                   '"rn", "rn.era","rn.noah","wind.dir","wind.u","wind.v","latstart","lonstart"]')
-        data = '{"columns": '+columns+', "fromDate": "'+fromDate+'", "toDate": "'+toDate+'", "stationId": "'+station+'"}'
-        #print (data)
-        response = requests.post(url, headers=headers, data=data)
-        if response.status_code != 500:
-            #print (response.json())
-            output=np.asarray(response.json())
-            df = pd.DataFrame(output[:,:], columns=eval(columns))
-            df = df.replace('null',np.NaN)
-            df = df.astype(float)
-            df['date'] = pd.to_datetime(df['isodate'], unit='s')
-            df.set_index(['date'],inplace=True)
-            df['name'] = station
-            df['model'] = 'STILT'
-            df['wind.speed']=np.sqrt((df['wind.u']**2)+(df['wind.v']**2))
-            #print (df.columns)
-    else:
-        df=pd.DataFrame({'A' : []})
+        fromDate = new_range[0].strftime('%Y-%m-%d')
+        toDate = new_range[-1].strftime('%Y-%m-%d')
+        
+        #only the requested columns, parsed to float (nan for missing values). The STILT results 
+        #are computed together with the footprints: a saved response is only used until the 
+        #footprints of the station and dates change (see tools/stilt/results.py)
+        try:
+            df = get_stilt_client().timeseries(station, fromDate, toDate, columns, 
+                                               version=footprints_modified(station, new_range))
+        except stilt_results.StiltResultError:
+            df = None
+        
+    if df is None:
+        df = pd.DataFrame(columns=['isodate'] + [c for c in columns if c != 'isodate'], 
+                          index=pd.DatetimeIndex([], name='date'), dtype=float)
+    
+    df['name'] = station
+    df['model'] = 'STILT'
+    if 'wind.u' in df.columns and 'wind.v' in df.columns:
+        df['wind.speed']=np.sqrt((df['wind.u']**2)+(df['wind.v']**2))
 
-    df=df[(df['co2.fuel'].index.hour.isin(timeselect_list))]
+    df=df[df.index.hour.isin(timeselect_list)]
 
     return df
 
@@ -141,105 +168,45 @@ def area_footprint_based_on_threshold(input_footprint, fp_lat, fp_lon, threshold
         input_footprint (numpy.ndarray): The sensitivity values of the footprint.
         fp_lat (numpy.ndarray): Latitude values of the footprint grid.
         fp_lon (numpy.ndarray): Longitude values of the footprint grid.
-        threshold (float): The threshold to calculate the area of interest within the footprint.
+        threshold (float or list): The threshold to calculate the area of interest within the footprint.
+            A list of thresholds (e.g. [0.5, 0.75, 0.9]) is computed in one pass.
         
     Returns:
-        float: The total area within the specified sensitivity threshold.
+        float: The total area within the specified sensitivity threshold (a list if threshold is a list).
     """
     
-    # Flatten the input footprint for easier manipulation
-    flattened_fp = input_footprint.flatten()
-    sum_sensitivity_values = flattened_fp.sum()
-    threshold_sensitivity = sum_sensitivity_values * threshold
-
-    # Create a DataFrame for manipulation
-    df_sensitivity = pd.DataFrame({'sensitivity': flattened_fp})
-    df_sensitivity_sorted = df_sensitivity.sort_values(by='sensitivity', ascending=False)
-    df_sensitivity_sorted['cumsum_sens'] = df_sensitivity_sorted['sensitivity'].cumsum()
-
-    # Apply threshold mask
-    if threshold == 1:
-        df_sensitivity_sorted['mask_threshold']= np.where(df_sensitivity_sorted['sensitivity']==0, 0, 1)
-    else:
-        df_sensitivity_sorted['mask_threshold']= np.where(df_sensitivity_sorted['cumsum_sens']>=threshold_sensitivity, 0, 1)
-
-    # not sorted according to cell size anymore: back to position in original shapefile
-    df_sensitivity_mask=df_sensitivity_sorted.sort_index()
-    
-    # Use mask to filter values and reshape back to original footprint shape
-    fp_sensitivity_mask = np.array(list(df_sensitivity_mask['mask_threshold'])).reshape((len(fp_lat), len(fp_lon)))
-    
-    #a NetCDF file with the grid size calues in m2
-    f_gridarea = cdf.Dataset(stcDataPath + 'gridareaSTILT.nc')
-
-    gridarea_km2 = f_gridarea.variables['cell_area'][:] / 1e6  # Convert m2 to km2
-    area_within_threshold = (fp_sensitivity_mask * gridarea_km2).sum()
+    # mask of the most sensitive cells (one sorting for all thresholds) times the 
+    # cached grid area in km2, see tools/footprint/threshold.py
+    footprint = np.ma.filled(input_footprint, 0).reshape((len(fp_lat), len(fp_lon)))
     
-    return area_within_threshold
+    return footprint_threshold.area_based_on_threshold(footprint, threshold, path=stcDataPath)
 
 def import_landcover_HILDA(year='2018'):
     
-    name_data = 'hilda_lulc_'+ year +'.nc' 
-    
-    all_hilda_classes= Dataset(stcDataPath + name_data)
-
-    #access all the different land cover classes in the .nc files:
-    cropland = all_hilda_classes.variables['cropland'][:,:]
-    ocean = all_hilda_classes.variables['ocean'][:,:]
-    forest_decidious_broad_leaf = all_hilda_classes.variables['f_de_br_le'][:,:]
-    forest_decidious_needle_leaf = all_hilda_classes.variables['f_de_ne_le'][:,:]
-    forest_evergreen_broad_leaf = all_hilda_classes.variables['f_eg_br_le'][:,:]
-    forest_evergreen_needle_leaf = all_hilda_classes.variables['f_eg_ne_le'][:,:]
-    mixed_forest = all_hilda_classes.variables['forest_mix'][:,:]
-    forest_unknown = all_hilda_classes.variables['forest_unk'][:,:]
-    grass_shrub = all_hilda_classes.variables['grass_shru'][:,:]
-    other_land = all_hilda_classes.variables['other_land'][:,:]
-    pasture = all_hilda_classes.variables['pasture'][:,:]
-    urban = all_hilda_classes.variables['urban'][:,:]
-    water = all_hilda_classes.variables['water'][:,:]
-    unknown = all_hilda_classes.variables['unknown'][:,:]
-    
-    # aggregated classes:
-    broad_leaf_forest = forest_decidious_broad_leaf + forest_evergreen_broad_leaf 
-    coniferous_forest = forest_decidious_needle_leaf+ forest_evergreen_needle_leaf
-    mixed_forest = mixed_forest + forest_unknown
-    other = other_land + water
+    #the aggregated classes are read once and shared (also with the network characterization), 
+    #see tools/footprint/ancillary.py. The arrays are read-only. 
+    names, landcover = ancillary.landcover_HILDA(year, path=stcDataPath)
+    
+    broad_leaf_forest, coniferous_forest, mixed_forest, ocean, other, grass_shrub, cropland, pasture, urban, unknown = landcover
        
     return broad_leaf_forest, coniferous_forest, mixed_forest, ocean, other, grass_shrub, cropland, pasture, urban, unknown
 
 def import_population_data():
    
-    pop_data= Dataset(stcDataPath + 'GPW_population_2020.nc')
-    fp_pop=pop_data.variables['pop_2020'][:,:]
+    fp_pop = ancillary.grid_variable('GPW_population_2020.nc', 'pop_2020', path=stcDataPath)
 
     return fp_pop
 
 def import_point_source_data():
     """
-    Calculates point source CO2 emissions per square meter per second from annual data.
-
-    Args:
-        stcDataPath (str): Path to the directory containing the relevant NetCDF files.
+    Point source CO2 emissions per square meter per second from annual data (E-PRTR 2017).
+    Computed once per kernel, see tools/footprint/ancillary.py.
 
     Returns:
         numpy.ndarray: The emissions in micro-moles per square meter per second.
     """
-    # Load point source data and grid area from NetCDF files
-    with Dataset(os.path.join(stcDataPath, 'E_PRTR_pointsource_2017.nc')) as point_source_data, \
-         Dataset(os.path.join(stcDataPath, 'gridareaSTILT.nc')) as grid_area_data:
-        
-        # Emissions in kg/year from the variable "Sum_Tota_1"
-        emissions_kg_year = point_source_data.variables['Sum_Tota_1'][:,:]
 
-        # Grid cell area in m2 from the variable "cell_area"
-        grid_area_m2 = grid_area_data.variables['cell_area'][:]
-
-    # Convert emissions from kg/year to micro-moles per m2 per second
-    molar_mass_C = 44  # g/mol for CO2, or 0.044 kg/mol
-    seconds_per_year = 31536000
-    emissions_micromoles_m2_s = (emissions_kg_year / molar_mass_C * 1e6) / grid_area_m2 / seconds_per_year
-
-    return emissions_micromoles_m2_s
+    return ancillary.point_source_emissions(path=stcDataPath)
 
 def date_and_time_string_for_title(date_range, timeselect_list):
     # Use datetime formatting to simplify date string construction
@@ -334,6 +301,28 @@ def define_bins_maprose(km_intervals, bin_size):
     return interval_bins, interval_labels, dir_bins, dir_labels
 
 
+def maprose_bin_index(distances, degrees, interval_bins, dir_bins):
+    
+    #index of the (distance, direction) bin of each cell in the STILT grid. 
+    #the distance bins include their right edge and the direction bins their left edge.
+    #the last direction bin (360 degrees) is the same as the first (0 degrees).
+    #cells outside the distance or direction bins (the station cell at distance 0) 
+    #are kept in an extra bin.
+    n_intervals = len(interval_bins) - 1
+    n_directions = len(dir_bins) - 2
+    
+    interval_index = np.digitize(distances, interval_bins, right=True) - 1
+    interval_index[(interval_index < 0) | (interval_index >= n_intervals)] = n_intervals
+    
+    direction_index = direction_bin_index(degrees, dir_bins)
+    direction_index[direction_index == n_directions] = 0
+    direction_index[direction_index < 0] = n_directions
+    
+    bin_index = interval_index * (n_directions + 1) + direction_index
+    number_bins = (n_intervals + 1) * (n_directions + 1)
+    
+    return bin_index, number_bins
+
 # function to convert station longitude and latitude (slat, slon) to indices of STILT model grid (ix,jy)
 def lonlat_2_ixjy(slon,slat,mlon,mlat):
     #slon, slat: longitude and latitude of station
@@ -402,29 +391,73 @@ def plot_maps(myStation, field, title='', label='', linlog='linear', zoom='', vm
 #or min_lat, max_lat, step (in degrees)    
 def distances_from_point_to_grid_cells(station_lat, station_lon, grid_lat, grid_lon):
     
-    x = [math.radians(station_lon-lon)*math.cos(math.radians(station_lat+lat)/2) for lat in grid_lat for lon in grid_lon]
+    #all cells of the grid, row by row (same order as the flattened footprint)
+    lon, lat = np.meshgrid(np.asarray(grid_lon, dtype=float), np.asarray(grid_lat, dtype=float))
+    
+    x = np.radians(station_lon-lon)*np.cos(np.radians(station_lat+lat)/2)
 
-    y = [math.radians(station_lat-lat) for lat in grid_lat for lon in grid_lon]
+    y = np.radians(station_lat-lat)
 
-    distance=[math.sqrt((x[index]*x[index])+(y[index]*y[index])) * R for index in range(len(x))]
+    distance = np.sqrt((x*x)+(y*y)) * R
     
-    #return list with distances.
-    return distance
+    #return array with distances.
+    return distance.ravel()
 
 def degrees_from_point_to_grid_cells(station_lat, station_lon, grid_lat, grid_lon):
     
-    degrees_0_360=[compass_bearing((station_lat, station_lon), (lat, lon)) for lat in grid_lat for lon in grid_lon]
+    #same as compass_bearing() for all cells of the grid at once
+    lon, lat = np.meshgrid(np.asarray(grid_lon, dtype=float), np.asarray(grid_lat, dtype=float))
+    
+    lat1 = math.radians(station_lat)
+    lat2 = np.radians(lat)
+    diffLong = np.radians(lon - station_lon)
+    
+    x = np.sin(diffLong) * np.cos(lat2)
+    y = math.cos(lat1) * np.sin(lat2) - (math.sin(lat1) * np.cos(lat2) * np.cos(diffLong))
+    
+    degrees_0_360 = (np.degrees(np.arctan2(x, y)) + 360) % 360
         
-    #return list with degrees
-    return degrees_0_360
+    #return array with degrees
+    return degrees_0_360.ravel()
 
+def distances_and_degrees_to_grid_cells(station_lat, station_lon, grid_lat, grid_lon):
+    """
+    Distances (km) and degrees from the station to all cells in the STILT grid.
+    The result is saved as a .npy file in stcCachePath, named by the station 
+    coordinates and the grid, and read from there the next time. 
+    
+    Returns:
+        tuple: (distances, degrees) as numpy arrays, one value per cell.
+    """
+    
+    grid_lat = np.asarray(grid_lat, dtype=float)
+    grid_lon = np.asarray(grid_lon, dtype=float)
+    
+    name_cache = 'distances_degrees_{:.5f}_{:.5f}_{}x{}_{:.3f}_{:.3f}.npy'.format(
+        station_lat, station_lon, len(grid_lat), len(grid_lon), grid_lat[0], grid_lon[0])
+    file_cache = os.path.join(stcCachePath, name_cache)
+    
+    if os.path.isfile(file_cache):
+        try:
+            distances, degrees = np.load(file_cache)
+            return distances, degrees
+        except (OSError, ValueError):
+            pass
+    
+    distances = distances_from_point_to_grid_cells(station_lat, station_lon, grid_lat, grid_lon)
+    degrees = degrees_from_point_to_grid_cells(station_lat, station_lon, grid_lat, grid_lon)
+    
+    #not being able to save the cache is not an error (read-only home directory)
+    try:
+        os.makedirs(stcCachePath, exist_ok=True)
+        np.save(file_cache, np.vstack((distances, degrees)))
+    except OSError:
+        pass
+    
+    return distances, degrees
 
 def polar_graph(myStation, rose_type, colorbar='gist_heat_r', zoom=''):   
 
-    interval_bins=myStation.intervalBins
-    interval_labels=myStation.intervalLabels
-    dir_bins=myStation.dirBins
-    dir_labels=myStation.dirLabels
     fp=myStation.fp
     unit=myStation.settings['unit']
     
@@ -445,53 +478,20 @@ def polar_graph(myStation, rose_type, colorbar='gist_heat_r', zoom=''):
         fp_pop= import_population_data()
         grid_to_display=fp*fp_pop
         
-    # Initialize an empty DataFrame to hold sensitivity mapping data.
-    df_sensitivity_map = pd.DataFrame()
-
-    # Populate the DataFrame with sensitivity data and associated spatial metrics.
-    df_sensitivity_map['sensitivity'] = grid_to_display.flatten()  # Convert 2D grid data to a 1D array.
-    df_sensitivity_map['distance'] = myStation.distances  # Distance from the station for each grid cell.
-    df_sensitivity_map['degrees'] = myStation.degrees  # Degree direction for each grid cell.
-
-    # Binning data by distance and degree intervals to summarize information.
-    # Define bins for distance intervals.
-    rosedata = df_sensitivity_map.assign(
-        Interval_bins=lambda df: pd.cut(df['distance'], bins=interval_bins, labels=interval_labels, right=True)
-    )
-
-    # Define bins for directional degrees, treating the circular nature of direction (0 and 360 degrees are the same).
-    rosedata = rosedata.assign(
-        Degree_bins=lambda df: pd.cut(df['degrees'], bins=dir_bins, labels=dir_labels, right=False)
-    ).replace({'Degree_bins': {360: 0}})  # Correcting for circular direction representation.
-
-    # Create a unique identifier for each combination of distance and direction.
-    rosedata['key'] = rosedata['Interval_bins'].astype(str) + ' ' + rosedata['Degree_bins'].astype(str)
-
-    # Aggregate sensitivity data by the unique combination of distance and direction.
-    # This summarization helps in understanding the sensitivity distribution across different spatial bins.
-    rosedata_groupby = rosedata.groupby('key', as_index=False)['sensitivity'].sum().reset_index()
-
-    # Merge the aggregated sensitivity data back to the original DataFrame.
-    # This step assigns the summed sensitivity values to each cell based on their distance and direction bin.
-    # The merge operation is performed without sorting to maintain the original order.
-    rosedata = rosedata.reset_index().merge(rosedata_groupby[['key', 'sensitivity']], on='key', suffixes=('', '_summed'), sort=False)
-
-    # Sort the DataFrame by the original grid cell index to maintain spatial consistency.
-    # This sorting is crucial for visualizing the sensitivity data correctly on the map.
-    rosedata = rosedata.sort_values(by=['index'])
-
-    # Note: The final DataFrame 'rosedata' now contains both individual cell sensitivities
-    # and the aggregated sensitivity sums for each spatial bin, ready for visualization or further analysis.
-    
-    rosedata_list=rosedata['sensitivity_summed'].tolist()
+    # Sum the values of the cells in each (distance, direction) bin and give the sum back to 
+    # every cell of the bin. The bin of each cell is computed once for the station 
+    # (myStation.roseBinIndex, see maprose_bin_index)
+    values = np.ma.filled(grid_to_display, 0).ravel()
+    bin_sums = np.bincount(myStation.roseBinIndex, weights=values, minlength=myStation.roseNumberBins)
+    rosedata_array = bin_sums[myStation.roseBinIndex]
 
     if unit=='percent':
 
-        total_sensitivity= df_sensitivity_map['sensitivity'].sum() 
-        rosedata_list=[(sensitivity_value/total_sensitivity)*100 for sensitivity_value in rosedata_list]
+        total_sensitivity= values.sum() 
+        rosedata_array = (rosedata_array/total_sensitivity)*100
 
     # footprint shape for display in map according to STILT grid
-    rosedata_array = np.array(np.array(rosedata_list).reshape(len(myStation.fpLat), len(myStation.fpLon)))
+    rosedata_array = rosedata_array.reshape(len(myStation.fpLat), len(myStation.fpLon))
         
     caption=(unit.capitalize() + ' ' + rose_type + ' given direction and distance')
           
@@ -507,42 +507,20 @@ def land_cover_bar_graph(myStation):
     degrees=myStation.degrees
     fp=myStation.fp
 
-    # Import all the land cover data
-    landcover_types = import_landcover_HILDA(year='2018')
-    
-        # Initialize a DataFrame to store aggregated land cover values
-    df_all = pd.DataFrame()
-
-    # List of land cover names for columns
-    landcover_names = [
-        "Broad leaf forest", "Coniferous forest", "Mixed forest", "Ocean", 
-        "Other", "Grass/shrubland", "Cropland", "Pasture", "Urban", "Unknown"
-    ]
-    
-    # Aggregate land cover values multiplied by footprint
-    for i, landcover in enumerate(landcover_types):
-        landcover_values = (fp * landcover).flatten()
-        df_temp = pd.DataFrame({
-            'landcover_vals': landcover_values,
-            'degrees': degrees,
-            'landcover_type': landcover_names[i]
-        })
-        df_all = df_all.append(df_temp, ignore_index=True)
-        
+    # land cover classes as one stack (class, lat, lon)
+    landcover_names, landcover_stack = ancillary.landcover_HILDA('2018', path=stcDataPath)
         
     dir_bins= np.asarray([0, 22.5,67.5,112.5,157.5,202.5,247.5,292.5,337.5,383.5])
     dir_labels= np.asarray([0, 22.5,67.5,112.5,157.5,202.5,247.5,292.5,337.5])
 
-    #get columns - for each degree
-    rosedata=df_all.assign(Degree_bins=lambda df: pd.cut(df['degrees'], bins=dir_bins, labels=dir_labels, right=False))
-
-    rosedata=rosedata.replace({'Degree_bins': {0.0: 337.5}})
-
-    #group the data by the distance bins, and again by the direction bins. The value to be summed in the sensitivity values.
-    rosedata=rosedata.groupby(by=['landcover_type', 'Degree_bins'])['landcover_vals'].sum()
+    #sensitivity to each land cover class (rows) in each direction bin (columns)
+    bin_index = direction_bin_index(degrees, dir_bins)
+    sums = direction_binned_sums(fp, landcover_stack, bin_index, len(dir_labels))
 
-    #changes the format:
-    rosedata=rosedata.unstack(level='landcover_type')
+    #the first bin (0 to 22.5) is part of the north bin (337.5 to 383.5)
+    sums[:, -1] += sums[:, 0]
+    
+    rosedata = pd.DataFrame(sums[:, 1:].T, index=dir_labels[1:], columns=landcover_names)
 
     #want to sort the dataframe so that the land cover the station is the most
     #sensitive to is first. 
@@ -554,7 +532,7 @@ def land_cover_bar_graph(myStation):
     #for all values: want the % of the total sensitivity (one value for each distance for each direction)
     total_all=sum(rosedata_sum)
 
-    rosedata= rosedata.applymap(lambda x: x / total_all * 100)
+    rosedata= rosedata / total_all * 100
 
     list_land_cover_values = [rosedata[land_cover_type].values for land_cover_type in list_land_cover_names_sorted]
      
@@ -647,7 +625,7 @@ def seasonal_table(myStation):
     year=myStation.settings['startYear']
     available_STILT= myStation.settings['stilt']
     months= available_STILT[str(year)]['months']
-    var_load=pd.read_csv(stcDataPath + 'seasonal_table_values_2024_02_19.csv')
+    var_load=pd.read_csv(stcDataPath + multipleVariablesPrecomputed)
 
     station_year = f'{station}_{year}'
 
@@ -731,12 +709,12 @@ def seasonal_table(myStation):
 
                 #get the modelled concentration values
                 timeselect_list=[0, 3, 6, 9, 12, 15, 18, 21]
-                df_winter1 = read_stilt_timeseries(station, winter_date_range1, timeselect_list)
-                df_winter2 = read_stilt_timeseries(station, winter_date_range2, timeselect_list)
+                df_winter1 = read_stilt_timeseries(station, winter_date_range1, timeselect_list, stilt_columns)
+                df_winter2 = read_stilt_timeseries(station, winter_date_range2, timeselect_list, stilt_columns)
                 df_winter = df_winter1.append(df_winter2)
-                df_spring = read_stilt_timeseries(station, spring_date_range, timeselect_list)
-                df_summer = read_stilt_timeseries(station, summer_date_range, timeselect_list)
-                df_fall = read_stilt_timeseries(station, fall_date_range, timeselect_list)
+                df_spring = read_stilt_timeseries(station, spring_date_range, timeselect_list, stilt_columns)
+                df_summer = read_stilt_timeseries(station, summer_date_range, timeselect_list, stilt_columns)
+                df_fall = read_stilt_timeseries(station, fall_date_range, timeselect_list, stilt_columns)
 
                 #averages of the modelled concentration values.
                 df_winter_mean=df_winter.mean()
@@ -823,34 +801,17 @@ def land_cover_polar_graph(myStation):
     
     dir_bins, dir_labels = define_bins_landcover_polar_graph(bin_size=bin_size)
 
-     # Import land cover data
-    land_cover_data = import_landcover_HILDA(year='2018')
-    land_cover_types = ['Broad leaf forest', 'Coniferous forest', 'Mixed forest', 'Ocean', 'Other', 
-                        'Grass/shrubland', 'Cropland', 'Pasture', 'Urban', 'Unknown']
-    # Process and aggregate land cover data
-    df_all = pd.DataFrame()
-    for lc_type, lc_data in zip(land_cover_types, land_cover_data):
-        lc_values = [item for sublist in (fp * lc_data)[0] for item in sublist]
-        df_temp = pd.DataFrame({
-            'landcover_vals': lc_values,
-            'degrees': degrees,
-            'landcover_type': lc_type
-        })
-        df_all = df_all.append(df_temp, ignore_index=True)
-        
-  
-    #already have the different land cover classes in one cell (no need to use "pandas.cut" to generate new column with information for groupby)
-    #still need a column with the different direction bins - defined in last cell - to use for the groupby (slice)
-    rosedata=df_all.assign(Degree_bins=lambda df: pd.cut(df['degrees'], bins=dir_bins, labels=dir_labels, right=False))
+    # land cover classes as one stack (class, lat, lon)
+    land_cover_types, land_cover_stack = ancillary.landcover_HILDA('2018', path=stcDataPath)
+    
+    #sensitivity to each land cover class (rows) in each direction bin (columns)
+    bin_index = direction_bin_index(degrees, dir_bins)
+    sums = direction_binned_sums(fp, land_cover_stack, bin_index, len(dir_labels))
 
     #the 360 degrees are the same as 0:
-    rosedata=rosedata.replace({'Degree_bins': {360: 0}})
-
-    #group the data by the distance bins, and again by the direction bins. The value to be summed in the sensitivity values.
-    rosedata=rosedata.groupby(by=['landcover_type', 'Degree_bins'])['landcover_vals'].sum()
-
-    #changes the format:
-    rosedata=rosedata.unstack(level='landcover_type')
+    sums[:, 0] += sums[:, -1]
+    
+    rosedata = pd.DataFrame(sums[:, :-1].T, index=dir_labels[:-1], columns=land_cover_types)
 
     #want to sort the dataframe so that the land cover the station is the most
     #sensitive to is first. 
@@ -862,7 +823,7 @@ def land_cover_polar_graph(myStation):
     #for all values: want the % of the total sensitivity (one value for each distance for each direction)
     total_all=sum(rosedata_sum_per_class_sorted)
     #for all values: want the % of the total sensitivity (one value for each distance for each direction)
-    rosedata= rosedata.applymap(lambda x: x / total_all * 100)
+    rosedata= rosedata / total_all * 100
 
     directions = np.arange(dir_bins[1], 360, bin_size)
     
@@ -897,10 +858,10 @@ def land_cover_polar_graph(myStation):
 
     #all other values mapped in relation to this: 
     #first: what is the "area value" for specific class given the max area
-    rosedata=rosedata.applymap(lambda x: (x/max_radius)*area_max)
+    rosedata=(rosedata/max_radius)*area_max
     
     #second: given that area value, what is the radius? (=where it should be placed in the graph)
-    rosedata=rosedata.applymap(lambda x: math.sqrt(x / math.pi))
+    rosedata=np.sqrt(rosedata / math.pi)
          
     #bar direction and height
     bar_dir, bar_width = _convert_dir(directions)
@@ -972,6 +933,30 @@ def _convert_dir(directions, N=None):
     barWidth = 2 * np.pi / N
     return barDir, barWidth
     
+def direction_bin_index(degrees, dir_bins):
+    
+    #index of the direction bin of each cell (dir_bins[i] <= degree < dir_bins[i+1]).
+    #cells outside the bins (and the station cell if its direction is nan) get -1 
+    bin_index = np.digitize(degrees, dir_bins) - 1
+    bin_index[(bin_index < 0) | (bin_index >= len(dir_bins) - 1)] = -1
+    
+    return bin_index
+
+def direction_binned_sums(fp, layers, bin_index, nbins):
+    
+    #sum of footprint * layer for each layer (rows) and direction bin (columns), 
+    #computed with one np.bincount instead of one dataframe per layer
+    fp = np.ma.filled(fp, 0).ravel()
+    nlayers = len(layers)
+    
+    valid = bin_index >= 0
+    weights = np.reshape(layers, (nlayers, -1))[:, valid] * fp[valid]
+    index = np.arange(nlayers)[:, np.newaxis] * nbins + bin_index[valid]
+    
+    sums = np.bincount(index.ravel(), weights=weights.ravel(), minlength=nlayers * nbins)
+    
+    return sums.reshape(nlayers, nbins)
+
 def define_bins_landcover_polar_graph(bin_size):
     
     #direction: using the input (bin_size) to set the bins so that the first bin has "north (0 degrees) in the middle"
@@ -1001,13 +986,13 @@ def multiple_variables_graph(myStation):
     end_date_year=max(date_range).year
     
     # pre-computed annual averages
-    var_load=pd.read_csv(stcDataPath + 'seasonal_table_values_2024_02_19.csv')
+    var_load=pd.read_csv(stcDataPath + multipleVariablesPrecomputed)
     
     # the final data frame: put in the normalized values
     df_save = pd.DataFrame(columns=['Station','Sensitivity','Area 50% sensitivity', 'GEE','Respiration','Anthro','Point source','Population'])
 
     # the stations to compare to
-    all_stations = ['TRN180', 'SVB150', 'TOH147', 'SMR125', 'LUT', 'KRE250', 'IPR100', 'JFJ', 'KIT200', 'GAT344']
+    all_stations = list(reference_stations)
     
     # make sure to include the selected station (selected in the tool)
     if selected_station not in all_stations:
@@ -1019,6 +1004,20 @@ def multiple_variables_graph(myStation):
     index = 0 
     stations_missing_footprints=[]
     
+    # values that are not pre-computed are read from the cache or computed at the same time for all stations
+    if full_year:
+        stations_to_compute = [station for station in all_stations if f'{station}_{start_date_year}' not in var_load['station_year'].values]
+    else:
+        stations_to_compute = all_stations
+    
+    computed_values = multiple_variable_values(stations_to_compute, date_range, timeselect_list)
+    
+    # stations with less than 75% of the footprints
+    for station in stations_to_compute:
+        nfp = computed_values[station][0]
+        if nfp > 0 and (nfp/len(date_range))*100 < 75:
+            display(HTML('<p style="font-size:16px;">' + station + ' (' + str(nfp) + '/' + str(len(date_range)) +' footprints)</p>'))
+    
     if full_year:
         for station in all_stations:
             # Construct the station_year identifier
@@ -1169,22 +1168,153 @@ def multiple_variables_graph(myStation):
     return fig, caption
     
 
+def reference_values_key(station, date_range, timeselect_list):
+    
+    #the date range is given by the first and last date and the hours of the day
+    return (station, str(min(date_range)), str(max(date_range)), len(date_range), tuple(sorted(timeselect_list)))
+
 def values_multiple_variable_graph(myStation, station):
+    
+    return multiple_variable_values([station], myStation.dateRange, myStation.settings['timeOfDay'])[station][1]
+
+def footprints_modified(station, date_range):
+    
+    #latest change of the footprints of the station in the months of the date range (dates added 
+    #or removed, or footprints computed again), 0 if there are no footprints
+    modified = 0
+    for year, month in sorted(set((date.year, date.month) for date in date_range)):
+        month_modified = aggregate.month_modified(station, year, month, path=pathFP)
+        if month_modified is not None:
+            modified = max(modified, month_modified)
+        
+    return modified
+
+def _reference_values_file(key):
+    
+    name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    
+    return os.path.join(stcCachePath, 'multiple_variables', key[0] + '_' + name + '.json')
+
+def read_reference_values(key, date_range, modified=None):
+    
+    #(number of footprints, values) saved earlier, None if not saved or if footprints were added 
+    #or updated since (modified: footprints_modified of the station and date range, if already known)
+    if modified is None:
+        modified = footprints_modified(key[0], date_range)
+    
+    try:
+        with open(_reference_values_file(key), 'r') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    if saved['key'] != repr(key) or saved['footprints_modified'] != modified or 'nfp' not in saved:
+        return None
+    
+    return saved['nfp'], tuple(saved['values'])
+
+def write_reference_values(key, date_range, nfp, values, modified):
+    
+    filename = _reference_values_file(key)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    
+    saved = {'key': repr(key), 
+             'footprints_modified': modified,
+             'nfp': int(nfp),
+             'values': [None if value is None else float(value) for value in values]}
+    
+    #written to a temporary file first, a kernel reading at the same time never gets half a file
+    tmp_filename = filename + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_filename, 'w') as f:
+        json.dump(saved, f)
+    os.replace(tmp_filename, filename)
+
+def _init_reference_values_worker():
+    
+    #the stations are computed in parallel, each process reads its footprints itself
+    global footprintProcesses
+    footprintProcesses = 1
 
-    date_range = myStation.dateRange
-    timeselect_list = myStation.settings['timeOfDay']  
+def _compute_reference_values(args):
+    
+    station, date_range, timeselect_list = args
+    
+    #the time of the footprints is taken before they are read
+    modified = footprints_modified(station, date_range)
+    
+    nfp, values = compute_values_multiple_variable_graph(station, date_range, timeselect_list)
+    
+    return modified, nfp, values
+
+def multiple_variable_values(stations, date_range, timeselect_list, processes=None):
+    
+    """
+    Values for the multiple variables graph (sensitivity, area 50% sensitivity, GEE, 
+    respiration, anthropogenic, point source and population) of the stations. 
+    
+    The values only depend on the station, the date range and the hours. They are kept in 
+    this kernel (reference_values) and saved in stcCachePath, the saved values are used 
+    until footprints are added or updated for the station and dates. Stations without 
+    saved values are computed at the same time in a pool of processes. 
+
+    Returns
+    -------
+    Dictionary station: (number of footprints, tuple with the values). The values are None 
+    if the station has no footprints.
+    """
+    
+    values = {}
+    to_compute = []
+    
+    for station in stations:
+        
+        key = reference_values_key(station, date_range, timeselect_list)
+        
+        #values kept in this kernel are also checked against the footprints
+        modified = footprints_modified(station, date_range)
+        
+        if key not in reference_values or reference_values[key][0] != modified:
+            saved = read_reference_values(key, date_range, modified)
+            if saved is not None:
+                reference_values[key] = (modified,) + saved
+            else:
+                reference_values.pop(key, None)
+        
+        if key in reference_values:
+            values[station] = reference_values[key][1:]
+        elif station not in to_compute:
+            to_compute.append(station)
+    
+    if processes is None:
+        processes = min(len(to_compute), os.cpu_count() or 1)
+    
+    tasks = [(station, date_range, timeselect_list) for station in to_compute]
+    
+    if len(to_compute) > 1 and processes > 1:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_reference_values_worker) as ex:
+            computed = list(ex.map(_compute_reference_values, tasks))
+    else:
+        computed = [_compute_reference_values(task) for task in tasks]
+    
+    for station, (modified, nfp, station_values) in zip(to_compute, computed):
+        
+        key = reference_values_key(station, date_range, timeselect_list)
+        reference_values[key] = (modified, nfp, station_values)
+        write_reference_values(key, date_range, nfp, station_values, modified)
+        values[station] = (nfp, station_values)
+        
+    return values
+
+def compute_values_multiple_variable_graph(station, date_range, timeselect_list):
+    
+    #returns the number of footprints and the values, stations with few footprints are 
+    #reported in multiple_variables_graph (this may run in a worker process)
     nfp, fp_station, lon, lat, title = read_aggreg_footprints(station, date_range)
    
     if nfp > 0:
         
         fp_pop= import_population_data()
         fp_point= import_point_source_data()
-
-        percent_footprints=(nfp/len(date_range))*100
-
-        if percent_footprints<75:
-
-            display(HTML('<p style="font-size:16px;">' + station + ' (' + str(nfp) + '/' + str(len(date_range)) +' footprints)</p>'))       
             
         sens_area_50 = area_footprint_based_on_threshold(fp_station, lat, lon, 0.5)
 
@@ -1193,7 +1323,7 @@ def values_multiple_variable_graph(myStation, station):
 
         #read the modelled concentration data - for anthro and bio values
         #using the updated version of read_stilt_timeseries allows for filtering out different hours of the days
-        df_modelled_concentrations = read_stilt_timeseries(station, date_range, timeselect_list)
+        df_modelled_concentrations = read_stilt_timeseries(station, date_range, timeselect_list, stilt_columns)
 
         #averages of the values --> default skip nan
         df_mean=df_modelled_concentrations.mean()
@@ -1204,14 +1334,14 @@ def values_multiple_variable_graph(myStation, station):
         point_whole=(fp_station * fp_point).sum()
         pop_whole=(fp_station*fp_pop).sum()
 
-        return sens_whole, sens_area_50, gee_whole, resp_whole, anthro_whole, point_whole, pop_whole
+        return nfp, (sens_whole, sens_area_50, gee_whole, resp_whole, anthro_whole, point_whole, pop_whole)
     
     else:
         
-        return None, None, None, None, None, None, None
+        return nfp, (None, None, None, None, None, None, None)
 
     
-def save(stc, fmt='pdf'):
+def save(stc, fmt='pdf', compile_tex=True):
     """
     Saves all figures from the station characterization object to specified format,
     along with captions and settings in JSON format.
@@ -1222,6 +1352,12 @@ def save(stc, fmt='pdf'):
         Station characterization object with figures.
     fmt : str, optional
         Image filename extension used to infer format ('pdf' or 'png'). Defaults to 'pdf'.
+    compile_tex : bool, optional
+        If False, the LaTeX file is written but not compiled (see compile_pdf). Defaults to True.
+
+    Returns
+    -------
+    Path to the LaTeX file.
     """
     captions = {}
     
@@ -1267,12 +1403,36 @@ def save(stc, fmt='pdf'):
     with open(tex_filepath, "w") as file:
         file.write(tex_string)
     
-    # Compile LaTeX file to PDF
-    compile_status = os.system(f'pdflatex -output-directory={stc.settings["output_folder"]} {tex_filepath}')
+    if compile_tex:
+        
+        if not compile_pdf(tex_filepath, stc.settings['output_folder']):
+            print('Problem generating the output PDF')
+    
+    return tex_filepath
+
+def compile_pdf(tex_filepath, output_folder):
+    """
+    Compiles a LaTeX file to PDF with pdflatex. The output of pdflatex is not
+    printed (several PDFs can be compiled at the same time), if the compilation 
+    fails see the .log file in output_folder.
+
+    Returns
+    -------
+    True if the PDF was generated.
+    """
+    
+    compile_status = subprocess.run(['pdflatex', '-interaction=nonstopmode', 
+                                     f'-output-directory={output_folder}', tex_filepath],
+                                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, 
+                                    stderr=subprocess.DEVNULL).returncode
     
     if compile_status != 0:
-        print('Problem generating the output PDF')
-    else:
-        # Clean up auxiliary files generated by LaTeX
-        for ext in ['.aux', '.log', '.out']:
-            os.remove(os.path.join(stc.settings['output_folder'], f"{stc.settings['date/time generated']}{stc.stationId}{ext}"))
+        return False
+    
+    # Clean up auxiliary files generated by LaTeX
+    name = os.path.splitext(os.path.basename(tex_filepath))[0]
+    for ext in ['.aux', '.log', '.out']:
+        if os.path.exists(os.path.join(output_folder, name + ext)):
+            os.remove(os.path.join(output_folder, name + ext))
+    
+    return True
@@ -3,66 +3,275 @@ import stc_functions
 
 from datetime import datetime
 import os
+import json
+import time
+import traceback
+import matplotlib
+import matplotlib.pyplot as plt
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from icoscp.station import station as cpstation
 from icoscp_stilt import stiltstation
 import datetime as dt
 stiltstations= stiltstation.find()
+
+#footprints used for the PDFs (all hours of the day)
+time_of_day = [0,3,6,9,12,15,18,21]
+
+def station_settings(station, year=2020):
+
+    settings = {}
+
+    settings['stationCode'] = station
+    if stiltstations[station]['icos']:
+        settings['icos'] = cpstation.get(station[0:3].upper()).info()
+    settings['stilt'] = stiltstations[station]
+    settings['startYear'] = year
+    settings['startMonth'] = 1
+    settings['startDay'] = 1
+    settings['endYear'] = year
+    settings['endMonth'] = 12
+    settings['endDay'] = 31
+    settings['timeOfDay'] = list(time_of_day)
+    settings['binSize'] = 15
+    settings['binInterval'] = 100
+    settings['unit'] = 'percent'
+    settings['labelPolar'] = 'no'
+    settings['saveFigs'] = 'yes'
+    settings['titles'] = 'no'
+    settings['figFormat'] = 'pdf'
+
+    return settings
+
+def generate_station_figures(station, year=2020, output='output', compile_tex=True):
+
+    #times (seconds) of the steps, returned together with the LaTeX file
+    timing = {}
+
+    start = time.perf_counter()
+    settings = station_settings(station, year)
+    stc=stationchar.StationChar(settings)
+    timing['station'] = time.perf_counter() - start
+
+    now = datetime.now()
+    stc.settings['date/time generated'] =  now.strftime("%Y%m%d_%H%M%S_")
+    stc.settings['output_folder'] = os.path.join(output, (stc.settings['date/time generated']+stc.stationId))
+    os.makedirs(stc.settings['output_folder'], exist_ok=True)
+
+    start = time.perf_counter()
+
+    fig, caption = stc_functions.polar_graph(stc, 'sensitivity')
+    stc.add_figure(1, fig, caption)
+
+
+    fig, caption=stc_functions.polar_graph(stc, 'point source contribution', colorbar='Purples')
+    stc.add_figure(2, fig, caption)
+
+
+    fig, caption =stc_functions.polar_graph(stc, 'population sensitivity', colorbar='Greens')
+    stc.add_figure(3, fig, caption)
+
+    fig, caption=stc_functions.land_cover_bar_graph(stc)
+    stc.add_figure(4, fig, caption)
+
+    fig, caption=stc_functions.seasonal_table(stc)
+    stc.add_figure(5, fig, caption)
+
+    fig, caption=stc_functions.land_cover_polar_graph(stc)
+    stc.add_figure(6, fig, caption)
+
+    fig, caption= stc_functions.multiple_variables_graph(stc)
+    stc.add_figure(7, fig, caption)
+
+    timing['figures'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tex_filepath = stc_functions.save(stc, 'pdf', compile_tex=compile_tex)
+    timing['save'] = time.perf_counter() - start
+
+    #the figures are not displayed, free the memory before the next station
+    plt.close('all')
+
+    return stc.settings['output_folder'], tex_filepath, timing
+
 def generate_PDFs(list_stations):
 
     for station in list_stations:
-        
-        settings = {}
-
-        settings['stationCode'] = station
-        if stiltstations[station]['icos']:
-            settings['icos'] = cpstation.get(station[0:3].upper()).info()
-        settings['stilt'] = stiltstations[station]
-        settings['startYear'] = 2020
-        settings['startMonth'] = 1
-        settings['startDay'] = 1
-        settings['endYear'] = 2020
-        settings['endMonth'] = 12
-        settings['endDay'] = 31
-        settings['timeOfDay'] = [0,3,6,9,12,15,18,21]
-        settings['binSize'] = 15
-        settings['binInterval'] = 100
-        settings['unit'] = 'percent'
-        settings['labelPolar'] = 'no'
-        settings['saveFigs'] = 'yes'
-        settings['titles'] = 'no'
-        settings['figFormat'] = 'pdf'
-
-        stc=stationchar.StationChar(settings)
-
-        now = datetime.now()
-        stc.settings['date/time generated'] =  now.strftime("%Y%m%d_%H%M%S_")
-        stc.settings['output_folder'] = os.path.join('output', (stc.settings['date/time generated']+stc.stationId))
-        if not os.path.exists('output'):
-            os.makedirs('output')
-
-        os.mkdir(stc.settings['output_folder'])
-
-        fig, caption = stc_functions.polar_graph(stc, 'sensitivity')
-        stc.add_figure(1, fig, caption)
-
-
-        fig, caption=stc_functions.polar_graph(stc, 'point source contribution', colorbar='Purples')
-        stc.add_figure(2, fig, caption)
-
-
-        fig, caption =stc_functions.polar_graph(stc, 'population sensitivity', colorbar='Greens')
-        stc.add_figure(3, fig, caption)
-        
-        fig, caption=stc_functions.land_cover_bar_graph(stc)
-        stc.add_figure(4, fig, caption)
-                
-        fig, caption=stc_functions.seasonal_table(stc)
-        stc.add_figure(5, fig, caption)
-
-        fig, caption=stc_functions.land_cover_polar_graph(stc)
-        stc.add_figure(6, fig, caption)
-
-        fig, caption= stc_functions.multiple_variables_graph(stc)
-        stc.add_figure(7, fig, caption)
-
-        stc_functions.save(stc, 'pdf')
\ No newline at end of file
+
+        generate_station_figures(station)
+
+#batch generation: the stations are split over a pool of processes
+def _date_range(year, hours):
+
+    #same dates as stationchar.StationChar._setDateRange with the settings of station_settings
+    start_date=dt.datetime(year,1,1,min(hours))
+    end_date=dt.datetime(year,12,31,max(hours))
+    date_range=pd.date_range(start_date,end_date,freq='3H')
+
+    return [date for date in date_range if date.hour in hours]
+
+def _init_worker(reference_values, mmap_dir):
+
+    #figures are only saved to file
+    matplotlib.use('Agg')
+
+    #the stations are already processed in parallel, read the footprints in the worker
+    stc_functions.footprintProcesses = 1
+
+    #values for the multiple variables graph computed before the stations
+    stc_functions.reference_values.update(reference_values)
+
+    #the ancillary grids (land cover, population, point sources) written by the main
+    #process are memory-mapped, the workers share the pages
+    stc_functions.ancillary.enable_memory_mapping(mmap_dir)
+
+def _generate_station(args):
+
+    station, year, output = args
+
+    start = time.perf_counter()
+
+    try:
+        output_folder, tex_filepath, timing = generate_station_figures(station, year, output, compile_tex=False)
+
+    except Exception as e:
+        plt.close('all')
+        return {'station': station, 'status': 'failed', 'step': 'figures',
+                'error': repr(e), 'traceback': traceback.format_exc(),
+                'seconds': {'total': time.perf_counter() - start}}
+
+    timing['total'] = time.perf_counter() - start
+
+    return {'station': station, 'status': 'ok', 'output_folder': output_folder,
+            'tex': tex_filepath, 'seconds': timing}
+
+def _compile(record):
+
+    start = time.perf_counter()
+
+    try:
+        if stc_functions.compile_pdf(record['tex'], record['output_folder']):
+            record['pdf'] = os.path.splitext(record['tex'])[0] + '.pdf'
+        else:
+            record['status'] = 'failed'
+            record['step'] = 'pdflatex'
+            record['error'] = 'see the .log file in ' + record['output_folder']
+
+    except Exception as e:
+        #for example pdflatex not installed
+        record['status'] = 'failed'
+        record['step'] = 'pdflatex'
+        record['error'] = repr(e)
+
+    record['seconds']['pdflatex'] = time.perf_counter() - start
+
+    return record
+
+def batch_generate_PDFs(list_stations, year=2020, output='output', processes=None, latex_processes=4, verbose=False):
+    """
+    Generates the station characterization PDFs of many stations in parallel.
+
+    The values of the reference stations in the multiple variables graph are
+    computed once (in parallel) and handed to all workers, as are the ancillary
+    grids (memory-mapped). Each worker makes the figures and the LaTeX file of
+    one station at a time, while pdflatex runs for the stations already done.
+    A manifest (JSON) with the status and the times of each station is written
+    to the output folder.
+
+    Parameters
+    ----------
+    list_stations : list
+        STILT station ids.
+    year : int, optional
+        Year of the characterization. Defaults to 2020.
+    output : str, optional
+        Folder for the PDFs (one sub-folder per station) and the manifest. Defaults to 'output'.
+    processes : int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+    latex_processes : int, optional
+        Number of pdflatex runs at the same time. Defaults to 4.
+    verbose : bool, optional
+        Print the status of each station when its figures are done. Defaults to False.
+
+    Returns
+    -------
+    Path to the manifest.
+    """
+
+    start = time.perf_counter()
+    started = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    os.makedirs(output, exist_ok=True)
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    #load the ancillary grids once, the workers memory-map them
+    mmap_dir = os.path.join(stc_functions.stcCachePath, 'ancillary')
+    stc_functions.ancillary.enable_memory_mapping(mmap_dir)
+    stc_functions.import_landcover_HILDA(year='2018')
+    stc_functions.import_population_data()
+    stc_functions.import_point_source_data()
+    stc_functions.ancillary.grid_area_km2(path=stc_functions.stcDataPath)
+
+    #reference stations without pre-computed values for the year
+    hours = list(time_of_day)
+    date_range = _date_range(year, hours)
+
+    reference_stations = list(stc_functions.reference_stations)
+    if (len(date_range) == 2920) or (len(date_range) == 2928):
+        var_load = pd.read_csv(stc_functions.stcDataPath + stc_functions.multipleVariablesPrecomputed)
+        reference_stations = [station for station in reference_stations
+                              if f'{station}_{year}' not in var_load['station_year'].values]
+
+    #computed in parallel or read from the cache, see stc_functions.multiple_variable_values
+    stc_functions.multiple_variable_values(reference_stations, date_range, hours, 
+                                           processes=max(1, min(processes, len(reference_stations))))
+    #with the time of the footprints, the workers check them again before using the values
+    keys = [stc_functions.reference_values_key(station, date_range, hours) for station in reference_stations]
+    reference_values = {key: stc_functions.reference_values[key] for key in keys}
+
+    records = []
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(reference_values, mmap_dir)) as ex, \
+         ThreadPoolExecutor(max_workers=latex_processes) as latex:
+
+        futures = {ex.submit(_generate_station, (station, year, output)): station for station in list_stations}
+        latex_futures = []
+
+        for future in as_completed(futures):
+
+            try:
+                record = future.result()
+            except Exception as e:
+                #the worker process died
+                records.append({'station': futures[future], 'status': 'failed', 'step': 'worker',
+                                'error': repr(e), 'seconds': {}})
+                continue
+
+            if record['status'] == 'ok':
+                latex_futures.append(latex.submit(_compile, record))
+            else:
+                records.append(record)
+
+            if verbose:
+                print(record['station'] + ': ' + record['status'])
+
+        records.extend(future.result() for future in latex_futures)
+
+    records.sort(key=lambda record: list_stations.index(record['station']))
+
+    manifest = {'started': started,
+                'year': year,
+                'processes': processes,
+                'seconds': time.perf_counter() - start,
+                'stations': len(list_stations),
+                'failed': [record['station'] for record in records if record['status'] != 'ok'],
+                'records': records}
+
+    manifest_file = os.path.join(output, 'manifest_' + started + '.json')
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    return manifest_file
@@ -0,0 +1,13 @@
+"""
+    This folder contains Python functions to read, aggregate and
+    analyse STILT footprints, shared by the station characterization
+    and the network characterization tools.
+    
+"""
+
+__credits__     = "ICOS Carbon Portal"
+__license__     = "GPL-3.0"
+__version__     = "0.1.0"
+__maintainer__  = "ICOS Carbon Portal, elaborated products team"
+__email__       = ['info@icos-cp.eu']
+__date__        = "2024-06-20"
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+    Description:      Aggregation of 3-hourly STILT footprints over a
+                      date range. The footprint files are read by a pool
+                      of worker processes, every worker sums
+                      its share of the files in place into one float64
+                      grid and only the partial sums are sent back.
+                      Optionally the partial sums are reduced with dask.
+                      The netCDF/HDF5 library is not thread safe, hence
+                      processes and not threads.
+
+    Example:
+
+        from tools.footprint.aggregate import aggregate_footprints
+        result = aggregate_footprints('HTM150', date_range)
+        print(result.stats)
+        average_fp = result.fp
+
+"""
+
+__credits__     = "ICOS Carbon Portal"
+__license__     = "GPL-3.0"
+__version__     = "0.1.0"
+__maintainer__  = "ICOS Carbon Portal, elaborated products team"
+__email__       = ['info@icos-cp.eu']
+__date__        = "2024-06-20"
+
+
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import netCDF4 as cdf
+
+#path to footprints
+pathFP = '/data/stiltweb/stations/'
+
+#below this number of files the files are read in the calling process
+min_files_parallel = 64
+
+
+class AggregationStats(namedtuple('AggregationStats',
+                                  ['nfiles', 'nmissing', 'nbytes', 'seconds', 'workers'])):
+
+    """
+    Timing and I/O of one aggregation: number of footprint files read,
+    number of dates without footprint, bytes read, wall clock seconds
+    and number of workers.
+    """
+
+    __slots__ = ()
+
+    @property
+    def files_per_second(self):
+        return self.nfiles / self.seconds if self.seconds > 0 else float('inf')
+
+    @property
+    def megabytes_per_second(self):
+        return self.nbytes / 1e6 / self.seconds if self.seconds > 0 else float('inf')
+
+    def __str__(self):
+        return ('{} footprints ({} missing), {:.1f} MB in {:.2f} s using {} worker(s): '
+                '{:.0f} files/s, {:.1f} MB/s'.format(self.nfiles, self.nmissing, self.nbytes / 1e6,
+                                                     self.seconds, self.workers,
+                                                     self.files_per_second, self.megabytes_per_second))
+
+
+FootprintAggregate = namedtuple('FootprintAggregate', ['nfp', 'fp', 'lon', 'lat', 'stats'])
+
+
+def footprint_filename(station, date, path=pathFP):
+
+    """
+    Path to the footprint file of a station at a date (the start of
+    a 3-hourly footprint).
+    """
+
+    return os.path.join(path, station, str(date.year), str(date.month).zfill(2),
+                        '{}x{}x{}x{}'.format(date.year, str(date.month).zfill(2),
+                                             str(date.day).zfill(2), str(date.hour).zfill(2)),
+                        'foot')
+
+
+def footprint_dates(station, date_range, path=pathFP):
+
+    """
+    Returns the dates of date_range that have a footprint. Instead of one
+    os.path.isfile() per date, each month directory is listed once.
+    """
+
+    listed = {}
+    dates = []
+
+    for date in date_range:
+
+        month_dir = os.path.join(path, station, str(date.year), str(date.month).zfill(2))
+
+        if month_dir not in listed:
+            try:
+                listed[month_dir] = set(os.listdir(month_dir))
+            except OSError:
+                listed[month_dir] = set()
+
+        filename = footprint_filename(station, date, path)
+
+        #the name of the directory holding the foot file
+        if os.path.basename(os.path.dirname(filename)) in listed[month_dir]:
+            dates.append(date)
+
+    return dates
+
+
+def month_modified(station, year, month, path=pathFP):
+
+    """
+    Latest change (seconds since 1970-01-01) of the footprints of a station
+    in a month: the month directory, the date directories and the files in
+    them. Detects added or removed dates as well as footprints that were
+    computed again. None if there is no month directory.
+    """
+
+    month_dir = os.path.join(path, station, str(year), str(month).zfill(2))
+
+    try:
+        modified = os.stat(month_dir).st_mtime
+        date_dirs = [entry for entry in os.scandir(month_dir) if entry.is_dir()]
+    except OSError:
+        return None
+
+    for date_dir in date_dirs:
+        try:
+            modified = max(modified, date_dir.stat().st_mtime)
+            for entry in os.scandir(date_dir.path):
+                modified = max(modified, entry.stat().st_mtime)
+        except OSError:
+            #removed while listing, the month directory has changed
+            modified = max(modified, time.time())
+
+    return modified
+
+
+def list_footprint_files(station, date_range, path=pathFP):
+
+    """
+    Returns the tuple (filenames, nmissing) with the footprint files of
+    the dates in date_range (see footprint_dates).
+    """
+
+    date_range = list(date_range)
+    dates = footprint_dates(station, date_range, path)
+    filenames = [footprint_filename(station, date, path) for date in dates]
+
+    return filenames, len(date_range) - len(dates)
+
+
+def read_footprint_grid(filename):
+
+    """
+    Returns the tuple (lon, lat) of the STILT grid of a footprint file.
+    """
+
+    with cdf.Dataset(filename) as f_fp:
+        lon = f_fp.variables['lon'][:]
+        lat = f_fp.variables['lat'][:]
+
+    return lon, lat
+
+
+def sum_footprint_files(filenames):
+
+    """
+    Sums the footprints of the files in place into one float64 array.
+    Masked cells count as zero sensitivity. Files that are missing or
+    can not be read are skipped.
+
+    Returns (sum or None, number of files read, bytes read)
+    """
+
+    acc = None
+    nread = 0
+    nbytes = 0
+
+    for filename in filenames:
+        try:
+            with cdf.Dataset(filename) as f_fp:
+                foot = f_fp.variables['foot'][:]
+            nbytes += os.path.getsize(filename)
+        except (OSError, KeyError):
+            continue
+
+        if np.ma.is_masked(foot):
+            foot = foot.filled(0)
+        else:
+            foot = np.ma.getdata(foot)
+
+        if acc is None:
+            acc = np.zeros(foot.shape, dtype=np.float64)
+        np.add(acc, foot, out=acc)
+        nread += 1
+
+    return acc, nread, nbytes
+
+
+def _chunks(filenames, nchunks):
+
+    #consecutive files in one chunk (same directories for a worker)
+    size = -(-len(filenames) // nchunks)
+    return [filenames[i:i + size] for i in range(0, len(filenames), size)]
+
+
+def _reduce_partial_sums(partial_sums):
+
+    acc = None
+    nread = 0
+    nbytes = 0
+
+    for part, n, b in partial_sums:
+        nread += n
+        nbytes += b
+        if part is None:
+            continue
+        if acc is None:
+            acc = part
+        else:
+            np.add(acc, part, out=acc)
+
+    return acc, nread, nbytes
+
+
+def _sum_with_dask(chunks, processes):
+
+    try:
+        import dask
+    except ImportError:
+        raise ImportError('use_dask=True needs the dask package, use the default pool instead')
+
+    tasks = [dask.delayed(sum_footprint_files)(chunk) for chunk in chunks]
+    scheduler = 'processes' if processes != 1 else 'synchronous'
+
+    return _reduce_partial_sums(dask.compute(*tasks, scheduler=scheduler, num_workers=processes))
+
+
+def aggregate_footprints(station, date_range, path=pathFP, processes=None,
+                         chunks_per_worker=4, use_dask=False):
+
+    """
+    Average footprint of a station over the dates in date_range.
+
+    Parameters
+    ----------
+    station : STR :             STILT station id, for example 'HTM150'
+    date_range :                Iterable of dates (datetime or pandas Timestamp)
+                                with the start of the 3-hourly footprints.
+    path : STR :                Directory with the footprints of all stations.
+    processes : INT :           Number of workers. Default is the number of CPUs.
+                                With 1, or less than min_files_parallel files,
+                                the files are read in the calling process.
+    chunks_per_worker : INT :   The files are split in this many chunks per worker
+                                to balance the load.
+    use_dask : BOOL :           If True, the partial sums are computed and reduced
+                                as dask delayed tasks.
+
+    Returns
+    -------
+    FootprintAggregate(nfp, fp, lon, lat, stats), where fp is the average footprint
+    as float64 array (None if no footprints were found) and stats is an
+    AggregationStats with the timing and I/O throughput.
+    """
+
+    start = time.perf_counter()
+
+    filenames, nmissing = list_footprint_files(station, date_range, path)
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(filenames)))
+
+    if processes == 1 or len(filenames) < min_files_parallel:
+        workers = 1
+        acc, nread, nbytes = sum_footprint_files(filenames)
+
+    else:
+        workers = processes
+        chunks = _chunks(filenames, processes * chunks_per_worker)
+
+        if use_dask:
+            acc, nread, nbytes = _sum_with_dask(chunks, processes)
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as ex:
+                acc, nread, nbytes = _reduce_partial_sums(ex.map(sum_footprint_files, chunks))
+
+    nmissing += len(filenames) - nread
+
+    if nread > 0:
+        acc /= nread
+        for filename in filenames:
+            try:
+                lon, lat = read_footprint_grid(filename)
+                break
+            except OSError:
+                continue
+    else:
+        acc, lon, lat = None, None, None
+
+    stats = AggregationStats(nread, nmissing, nbytes, time.perf_counter() - start, workers)
+
+    return FootprintAggregate(nread, acc, lon, lat, stats)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+    Description:      Registry of the ancillary grids on the STILT grid
+                      (HILDA land cover, population, point sources and the
+                      grid cell area) used with the footprints.
+
+                      Each layer is read from its netCDF file once per
+                      process and kept as a read-only array (float32, except
+                      the grid area). The land cover classes are kept as
+                      one stack (class, lat, lon). Optionally the layers are
+                      saved as .npy files and memory-mapped, so that worker
+                      processes share the pages instead of holding copies.
+
+    Example:
+
+        from tools.footprint import ancillary
+        names, landcover = ancillary.landcover_HILDA('2018')
+        fp_pop = ancillary.grid_variable('GPW_population_2020.nc', 'pop_2020')
+        ancillary.clear_cache()      # free the memory
+
+"""
+
+__credits__     = "ICOS Carbon Portal"
+__license__     = "GPL-3.0"
+__version__     = "0.1.0"
+__maintainer__  = "ICOS Carbon Portal, elaborated products team"
+__email__       = ['info@icos-cp.eu']
+__date__        = "2024-07-01"
+
+
+import os
+import threading
+
+import numpy as np
+from netCDF4 import Dataset
+
+#path to data such as population data and land cover data
+stcDataPath = '/data/project/stc/'
+
+#names of the aggregated HILDA land cover classes, in the order of the stack
+hilda_classes = ['Broad leaf forest', 'Coniferous forest', 'Mixed forest', 'Ocean', 'Other',
+                 'Grass/shrubland', 'Cropland', 'Pasture', 'Urban', 'Unknown']
+
+#variables of the HILDA files summed into each aggregated class
+_hilda_variables = [['f_de_br_le', 'f_eg_br_le'],
+                    ['f_de_ne_le', 'f_eg_ne_le'],
+                    ['forest_mix', 'forest_unk'],
+                    ['ocean'],
+                    ['other_land', 'water'],
+                    ['grass_shru'],
+                    ['cropland'],
+                    ['pasture'],
+                    ['urban'],
+                    ['unknown']]
+
+_layers = {}
+_lock = threading.RLock()
+
+#directory for memory-mapped layers, None = layers are kept in memory
+_mmap_dir = None
+
+
+def enable_memory_mapping(directory):
+
+    """
+    Save the layers as .npy files in directory and memory-map them. Layers
+    already in the directory are mapped without reading the netCDF files
+    (remove the directory when the netCDF files are updated).
+    Use None to keep the layers in memory (default).
+    """
+
+    global _mmap_dir
+
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    _mmap_dir = directory
+    clear_cache()
+
+
+def clear_cache():
+
+    """
+    Forget all loaded layers. The arrays are freed once no caller holds a
+    reference to them.
+    """
+
+    with _lock:
+        _layers.clear()
+
+
+def cached_layers():
+
+    return list(_layers.keys())
+
+
+def _get(key, loader):
+
+    layer = _layers.get(key)
+    if layer is not None:
+        return layer
+
+    with _lock:
+        layer = _layers.get(key)
+        if layer is not None:
+            return layer
+
+        filename = None
+        if _mmap_dir is not None:
+            filename = os.path.join(_mmap_dir, key.replace(os.sep, '_') + '.npy')
+
+        if filename is not None and os.path.isfile(filename):
+            layer = np.load(filename, mmap_mode='r')
+        else:
+            layer = loader()
+            if filename is not None:
+                #saved under a temporary name first, other processes never map half a file
+                tmp_filename = '{}.{}.{}.npy'.format(filename[:-4], os.getpid(), threading.get_ident())
+                np.save(tmp_filename, layer)
+                os.replace(tmp_filename, filename)
+                layer = np.load(filename, mmap_mode='r')
+            else:
+                layer.flags.writeable = False
+
+        _layers[key] = layer
+
+    return layer
+
+
+def _read(dataset, variable, dtype=np.float32):
+
+    #masked cells (no data) as 0
+    return np.ma.filled(dataset.variables[variable][:], 0).astype(dtype)
+
+
+def landcover_HILDA(year='2018', path=stcDataPath):
+
+    """
+    Returns (names, stack) where stack[i] is the share of the aggregated
+    land cover class names[i] in the cells of the STILT grid.
+    """
+
+    def loader():
+        with Dataset(os.path.join(path, 'hilda_lulc_' + year + '.nc')) as all_hilda_classes:
+            first = _read(all_hilda_classes, _hilda_variables[0][0])
+            stack = np.empty((len(_hilda_variables),) + first.shape, dtype=np.float32)
+            for i, variables in enumerate(_hilda_variables):
+                stack[i] = 0
+                for variable in variables:
+                    stack[i] += _read(all_hilda_classes, variable)
+        return stack
+
+    return hilda_classes, _get('hilda_{}_{}'.format(year, path), loader)
+
+
+def grid_variable(filename, variable, path=stcDataPath):
+
+    """
+    A variable on the STILT grid, for example the population data.
+    """
+
+    def loader():
+        with Dataset(os.path.join(path, filename)) as data:
+            return _read(data, variable)
+
+    return _get('{}_{}_{}'.format(filename, variable, path), loader)
+
+
+def grid_area_m2(path=stcDataPath):
+
+    """
+    Area (m2) of the cells of the STILT grid (float64).
+    """
+
+    def loader():
+        with Dataset(os.path.join(path, 'gridareaSTILT.nc')) as f_gridarea:
+            return _read(f_gridarea, 'cell_area', np.float64)
+
+    return _get('gridarea_m2_{}'.format(path), loader)
+
+
+def grid_area_km2(path=stcDataPath):
+
+    """
+    Area (km2) of the cells of the STILT grid (float64).
+    """
+
+    return _get('gridarea_km2_{}'.format(path), lambda: grid_area_m2(path) / 1e6)
+
+
+def point_source_emissions(path=stcDataPath):
+
+    """
+    Point source CO2 emissions (E-PRTR 2017) in micro-moles per square meter
+    per second, from the annual emissions in kg/year.
+    """
+
+    def loader():
+        with Dataset(os.path.join(path, 'E_PRTR_pointsource_2017.nc')) as point_source_data:
+            # Emissions in kg/year from the variable "Sum_Tota_1"
+            emissions_kg_year = _read(point_source_data, 'Sum_Tota_1', np.float64)
+
+        # Convert emissions from kg/year to micro-moles per m2 per second
+        molar_mass_C = 44  # g/mol for CO2, or 0.044 kg/mol
+        seconds_per_year = 31536000
+        emissions = (emissions_kg_year / molar_mass_C * 1e6) / grid_area_m2(path) / seconds_per_year
+        return emissions.astype(np.float32)
+
+    return _get('pointsource_{}'.format(path), loader)
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+    Description:      Precomputed monthly footprint sum cubes.
+
+                      For every station and year one compressed netCDF
+                      file holds the sum of the 3-hourly footprints and
+                      the number of footprints per month and hour of day:
+
+                          foot_sum(month, hour, lat, lon)
+                          count(month, hour)
+                          build_time(month)
+
+                      Any date range and selection of hours is then answered
+                      by adding the partial sums of the whole months in the
+                      range. Months that are only partly in the range, months
+                      not (yet) in a cube and months where new footprints
+                      were computed after the cube was built are read from
+                      the footprint files (see aggregate.py).
+
+    Build the cubes (from the icos_jupyter_notebooks folder):
+
+        python -m tools.footprint.cubes HTM150 SMR125 --year 2022 --year 2023
+
+    Read:
+
+        from tools.footprint.cubes import read_footprints
+        result = read_footprints('HTM150', date_range)
+
+"""
+
+__credits__     = "ICOS Carbon Portal"
+__license__     = "GPL-3.0"
+__version__     = "0.1.0"
+__maintainer__  = "ICOS Carbon Portal, elaborated products team"
+__email__       = ['info@icos-cp.eu']
+__date__        = "2024-06-24"
+
+
+import argparse
+import calendar
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import netCDF4 as cdf
+
+from . import aggregate
+
+#path to the footprint cubes
+pathCubes = '/data/project/stc/footprint_cubes/'
+
+#hours of the day with footprints
+cube_hours = [0, 3, 6, 9, 12, 15, 18, 21]
+
+
+def cube_filename(station, year, cube_dir=pathCubes):
+
+    return os.path.join(cube_dir, station, '{}_{}.nc'.format(station, year))
+
+
+def _month_dir(station, year, month, path):
+
+    return os.path.join(path, station, str(year), str(month).zfill(2))
+
+
+def _sum_month_hour(args):
+
+    #sum of the footprints of one month at one hour of the day
+    station, year, month, hour, path = args
+
+    days = calendar.monthrange(year, month)[1]
+    dates = pd.date_range(pd.Timestamp(year, month, 1, hour), periods=days, freq='D')
+    filenames, _ = aggregate.list_footprint_files(station, dates, path)
+
+    return (month, hour) + aggregate.sum_footprint_files(filenames)
+
+
+def build_station_cube(station, year, cube_dir=pathCubes, path=aggregate.pathFP,
+                       months=None, processes=None):
+
+    """
+    Builds (or updates) the cube of a station for one year.
+
+    Parameters
+    ----------
+    station : STR :     STILT station id, for example 'HTM150'
+    year : INT :        Year of the cube.
+    cube_dir : STR :    Directory of the cubes.
+    path : STR :        Directory with the footprints of all stations.
+    months : LIST :     Months (1-12) to (re)build. Default is all months.
+    processes : INT :   Number of worker processes. Default is the number of CPUs.
+
+    Returns
+    -------
+    Path to the cube or None if the station has no footprints for the year.
+    """
+
+    if months is None:
+        months = list(range(1, 13))
+    months = [m for m in months if os.path.isdir(_month_dir(station, year, m, path))]
+
+    if len(months) == 0:
+        return None
+
+    filename = cube_filename(station, year, cube_dir)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+    #the build time is taken before reading: footprints added during the
+    #build make the month directory newer than the cube
+    build_time = time.time()
+
+    tasks = [(station, year, m, h, path) for m in months for h in cube_hours]
+    with ProcessPoolExecutor(max_workers=processes) as ex:
+        partial_sums = list(ex.map(_sum_month_hour, tasks))
+
+    grid = None
+    dates = pd.date_range(pd.Timestamp(year, 1, 1), pd.Timestamp(year, 12, 31, 21), freq='3h')
+    filenames, _ = aggregate.list_footprint_files(station, dates[dates.month.isin(months)], path)
+    for f in filenames:
+        try:
+            grid = aggregate.read_footprint_grid(f)
+            break
+        except OSError:
+            continue
+
+    if grid is None and not os.path.isfile(filename):
+        return None
+
+    mode = 'a' if os.path.isfile(filename) else 'w'
+
+    with cdf.Dataset(filename, mode) as cube:
+
+        if mode == 'w':
+            lon, lat = grid
+            cube.createDimension('month', 12)
+            cube.createDimension('hour', len(cube_hours))
+            cube.createDimension('lat', len(lat))
+            cube.createDimension('lon', len(lon))
+
+            cube.createVariable('month', 'i4', ('month',))[:] = np.arange(1, 13)
+            cube.createVariable('hour', 'i4', ('hour',))[:] = cube_hours
+            cube.createVariable('lat', 'f8', ('lat',))[:] = lat
+            cube.createVariable('lon', 'f8', ('lon',))[:] = lon
+
+            foot_sum = cube.createVariable('foot_sum', 'f4', ('month', 'hour', 'lat', 'lon'),
+                                           zlib=True, complevel=4,
+                                           chunksizes=(1, 1, len(lat), len(lon)))
+            foot_sum.long_name = 'sum of footprints per month and hour of day'
+            count = cube.createVariable('count', 'i4', ('month', 'hour'))
+            count.long_name = 'number of footprints per month and hour of day'
+            count[:] = 0
+            built = cube.createVariable('build_time', 'f8', ('month',))
+            built.long_name = 'seconds since 1970-01-01 when the month was built, 0 if not built'
+            built[:] = 0
+
+            cube.station = station
+            cube.year = year
+
+        shape = (len(cube.dimensions['lat']), len(cube.dimensions['lon']))
+
+        for month, hour, acc, nread, nbytes in partial_sums:
+            ih = cube_hours.index(hour)
+            if acc is None:
+                acc = np.zeros(shape)
+            cube.variables['foot_sum'][month - 1, ih, :, :] = acc.reshape(shape)
+            cube.variables['count'][month - 1, ih] = nread
+
+        for month in months:
+            cube.variables['build_time'][month - 1] = build_time
+
+    return filename
+
+
+def _valid_months(cube, station, year, path):
+
+    #months of the cube built after the last change of the footprints of the month
+    #(dates added or removed, or footprints computed again, see aggregate.month_modified)
+    built = np.ma.getdata(cube.variables['build_time'][:])
+    valid = []
+    for month in range(1, 13):
+        if built[month - 1] <= 0:
+            continue
+        mtime = aggregate.month_modified(station, year, month, path)
+        if mtime is not None and mtime <= built[month - 1]:
+            valid.append(month)
+
+    return valid
+
+
+def read_footprints(station, date_range, path=aggregate.pathFP, cube_dir=pathCubes,
+                    processes=None):
+
+    """
+    Average footprint of a station over the dates in date_range, combined
+    from the monthly sums of the cubes and, for the remaining dates, the
+    footprint files. Without cubes this is aggregate.aggregate_footprints().
+
+    Returns
+    -------
+    aggregate.FootprintAggregate(nfp, fp, lon, lat, stats)
+    """
+
+    start = time.perf_counter()
+
+    dates = pd.DatetimeIndex(date_range).unique()
+
+    acc = None
+    nfp = 0
+    nmissing = 0
+    nbytes = 0
+    lon, lat = None, None
+    rest = []
+
+    for (year, month), month_series in pd.Series(dates, index=dates).groupby([dates.year, dates.month]):
+
+        month_dates = pd.DatetimeIndex(month_series.values)
+        hours = sorted(set(month_dates.hour))
+        days = calendar.monthrange(year, month)[1]
+        whole_month = (len(month_dates) == days * len(hours) and
+                       all(h in cube_hours for h in hours) and
+                       (month_dates.minute == 0).all())
+
+        filename = cube_filename(station, year, cube_dir)
+
+        if not whole_month or not os.path.isfile(filename):
+            rest.extend(month_dates)
+            continue
+
+        with cdf.Dataset(filename) as cube:
+
+            if month not in _valid_months(cube, station, year, path):
+                rest.extend(month_dates)
+                continue
+
+            ih = [cube_hours.index(h) for h in hours]
+            count = int(np.ma.getdata(cube.variables['count'][month - 1, ih]).sum())
+
+            for i in ih:
+                part = np.ma.getdata(cube.variables['foot_sum'][month - 1, i, :, :])
+                nbytes += part.nbytes
+                if acc is None:
+                    acc = part.astype(np.float64)
+                else:
+                    np.add(acc, part, out=acc)
+
+            if lon is None:
+                lon = cube.variables['lon'][:]
+                lat = cube.variables['lat'][:]
+
+        nfp += count
+        nmissing += len(month_dates) - count
+
+    workers = 1
+
+    if rest:
+        result = aggregate.aggregate_footprints(station, rest, path=path, processes=processes)
+        if result.nfp > 0:
+            part = result.fp.reshape(result.fp.shape[-2:]) * result.nfp
+            if acc is None:
+                acc = part
+            else:
+                np.add(acc, part, out=acc)
+            if lon is None:
+                lon, lat = result.lon, result.lat
+        nfp += result.nfp
+        nmissing += result.stats.nmissing
+        nbytes += result.stats.nbytes
+        workers = result.stats.workers
+
+    if nfp > 0:
+        #same shape as the footprint files (time, lat, lon)
+        fp = (acc / nfp).reshape((1,) + acc.shape[-2:])
+    else:
+        fp, lon, lat = None, None, None
+
+    stats = aggregate.AggregationStats(nfp, nmissing, nbytes, time.perf_counter() - start, workers)
+
+    return aggregate.FootprintAggregate(nfp, fp, lon, lat, stats)
+
+
+def has_cube(station, years, cube_dir=pathCubes):
+
+    return all(os.path.isfile(cube_filename(station, year, cube_dir)) for year in years)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Build monthly footprint sum cubes of STILT stations.')
+    parser.add_argument('stations', nargs='+', help='STILT station ids, for example HTM150')
+    parser.add_argument('--year', type=int, action='append', required=True,
+                        help='year of the cube, can be repeated')
+    parser.add_argument('--month', type=int, action='append',
+                        help='month (1-12) to (re)build, can be repeated. Default is all months')
+    parser.add_argument('--cube-dir', default=pathCubes, help='directory of the cubes')
+    parser.add_argument('--footprint-dir', default=aggregate.pathFP, help='directory of the STILT footprints')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    for station in args.stations:
+        for year in args.year:
+            t0 = time.perf_counter()
+            filename = build_station_cube(station, year, cube_dir=args.cube_dir,
+                                          path=args.footprint_dir, months=args.month,
+                                          processes=args.processes)
+            if filename is None:
+                print('{} {}: no footprints'.format(station, year))
+            else:
+                print('{} {}: {} ({:.1f} s)'.format(station, year, filename, time.perf_counter() - t0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+    Description:      Footprint sensitivity thresholds.
+
+                      The cells of a footprint are ranked by sensitivity
+                      (one argsort of the flattened grid) and the cumulative
+                      sum tells how many of the most sensitive cells make up
+                      a given share of the total sensitivity. Several
+                      thresholds (e.g. 50%, 75% and 90%) are answered from the
+                      same ranking.
+
+    Example:
+
+        from tools.footprint import threshold
+        area_50, area_90 = threshold.area_based_on_threshold(fp, [0.5, 0.9])
+
+"""
+
+__credits__     = "ICOS Carbon Portal"
+__license__     = "GPL-3.0"
+__version__     = "0.1.0"
+__maintainer__  = "ICOS Carbon Portal, elaborated products team"
+__email__       = ['info@icos-cp.eu']
+__date__        = "2024-06-27"
+
+
+import numpy as np
+
+from . import ancillary
+
+#path to the grid area of the STILT grid
+stcDataPath = ancillary.stcDataPath
+
+
+def threshold_masks(input_footprint, thresholds):
+
+    """
+    Masks of the most sensitive cells making up a share of the total sensitivity.
+
+    Parameters
+    ----------
+    input_footprint :           Footprint (numpy array or masked array, masked
+                                cells count as zero sensitivity).
+    thresholds :                Share of the total sensitivity (0-1) or a list
+                                of shares. A threshold of 1 selects all cells
+                                with non-zero sensitivity.
+
+    Returns
+    -------
+    Boolean array with the shape of input_footprint, or a list of arrays if
+    thresholds is a list.
+    """
+
+    single = np.isscalar(thresholds)
+    if single:
+        thresholds = [thresholds]
+
+    flattened_fp = np.ma.filled(input_footprint, 0).astype(np.float64, copy=False).ravel()
+
+    # one ranking (most sensitive first) for all thresholds
+    order = np.argsort(-flattened_fp, kind='stable')
+    cumsum_sens = np.cumsum(flattened_fp[order])
+    sum_sensitivity_values = cumsum_sens[-1] if len(cumsum_sens) > 0 else 0.0
+
+    masks = []
+    for threshold in thresholds:
+        mask = np.zeros(flattened_fp.shape, dtype=bool)
+        if threshold == 1:
+            mask[flattened_fp != 0] = True
+        else:
+            # number of ranked cells before the cumulative sum reaches the threshold
+            ncells = np.searchsorted(cumsum_sens, sum_sensitivity_values * threshold, side='left')
+            mask[order[:ncells]] = True
+        masks.append(mask.reshape(np.shape(input_footprint)))
+
+    return masks[0] if single else masks
+
+
+def footprint_based_on_threshold(input_footprint, thresholds):
+
+    """
+    The footprint where cells outside the threshold area are set to 0.
+    Returns an array (or a list of arrays if thresholds is a list).
+    """
+
+    masks = threshold_masks(input_footprint, thresholds)
+    footprint = np.ma.filled(input_footprint, 0)
+
+    if isinstance(masks, list):
+        return [np.where(mask, footprint, 0) for mask in masks]
+
+    return np.where(masks, footprint, 0)
+
+
+def area_based_on_threshold(input_footprint, thresholds, path=stcDataPath):
+
+    """
+    Area (km2) of the most sensitive cells making up the share(s) of the total
+    sensitivity. Returns a float (or a list of floats if thresholds is a list).
+    """
+
+    masks = threshold_masks(input_footprint, thresholds)
+    gridarea_km2 = ancillary.grid_area_km2(path).ravel()
+
+    if isinstance(masks, list):
+        return [gridarea_km2[mask.ravel()].sum() for mask in masks]
+
+    return gridarea_km2[masks.ravel()].sum()
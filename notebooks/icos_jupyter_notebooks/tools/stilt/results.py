@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+    Description:      Client for the STILT results (modelled concentration
+                      time series) of the STILT viewer.
+
+                      Only the requested columns are asked for and the
+                      response is parsed straight into float64 arrays (one
+                      per column). The HTTP connections are kept open in a
+                      pooled requests.Session, and responses can be saved on
+                      disk, one .npz file per (station, dates, columns).
+                      A saved response is only used again if it was saved
+                      with the same version (for example the time of the
+                      last change of the footprints, see fetch).
+
+                      For offline tests and benchmarks, point the client to
+                      a local stand-in server (see standin.py).
+
+    Example:
+
+        from tools.stilt.results import StiltResultClient
+        client = StiltResultClient(cache_dir='~/output/stilt_results')
+        # saved and used again as long as the version is the same
+        df = client.timeseries('HTM150', '2020-01-01', '2020-12-31',
+                               ['co2.bio.gee', 'co2.bio.resp'], version=1)
+
+"""
+
+__credits__     = "ICOS Carbon Portal"
+__license__     = "GPL-3.0"
+__version__     = "0.1.0"
+__maintainer__  = "ICOS Carbon Portal, elaborated products team"
+__email__       = ['info@icos-cp.eu']
+__date__        = "2024-07-08"
+
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+#url of the STILT results
+stiltResultUrl = 'https://stilt.icos-cp.eu/viewer/stiltresult'
+
+#all columns of the STILT results
+all_columns = ['isodate', 'co2.stilt', 'co2.fuel', 'co2.bio', 'co2.bio.gee', 'co2.bio.resp',
+               'co2.fuel.coal', 'co2.fuel.oil', 'co2.fuel.gas', 'co2.fuel.bio', 'co2.fuel.waste',
+               'co2.energy', 'co2.transport', 'co2.industry', 'co2.other_categories',
+               'co2.residential', 'co2.cement', 'co2.background',
+               'co.stilt', 'co.fuel', 'co.bio', 'co.fuel.coal', 'co.fuel.oil', 'co.fuel.gas',
+               'co.fuel.bio', 'co.energy', 'co.transport', 'co.industry', 'co.others',
+               'co.cement', 'co.background',
+               'rn', 'rn.era', 'rn.noah', 'wind.dir', 'wind.u', 'wind.v', 'latstart', 'lonstart']
+
+
+class StiltResultError(Exception):
+
+    """
+    The STILT results could not be read (for example no results for the
+    station and dates, the server answers with status 500).
+    """
+
+
+class StiltResultClient():
+
+    def __init__(self, url=stiltResultUrl, cache_dir=None, timeout=120, pool_size=8):
+
+        """
+        Parameters
+        ----------
+        url : STR :         Url of the STILT results.
+        cache_dir : STR :   Directory for the saved responses. Default is None
+                            (responses are not saved).
+        timeout : FLOAT :   Seconds to wait for the server.
+        pool_size : INT :   Number of connections kept open (use the same
+                            client in several threads).
+        """
+
+        self.url = url
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json', 'Accept-Charset': 'UTF-8'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.cache_hits = 0
+
+    def _cache_file(self, station, from_date, to_date, columns):
+
+        key = json.dumps([self.url, station, from_date, to_date, columns])
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+        return os.path.join(self.cache_dir, station, name + '.npz')
+
+    def fetch(self, station, from_date, to_date, columns, version=None):
+
+        """
+        STILT results of a station from from_date to to_date (strings 'YYYY-MM-DD',
+        both days included).
+
+        version is saved with the response. A saved response with another version
+        (or saved without version) is fetched again, use for example the time of
+        the last change of the footprints of the station and dates. Without
+        version (None) the response is never saved.
+
+        Returns
+        -------
+        Dictionary column: numpy float64 array, always with the column 'isodate'
+        (seconds since 1970-01-01). Missing values are nan.
+        """
+
+        columns = ['isodate'] + [c for c in columns if c != 'isodate']
+
+        filename = None
+        if self.cache_dir is not None and version is not None:
+            filename = self._cache_file(station, from_date, to_date, columns)
+            if os.path.isfile(filename):
+                with np.load(filename) as saved:
+                    if '_version' in saved.files and saved['_version'].item() == repr(version):
+                        with self._lock:
+                            self.cache_hits += 1
+                        return {column: saved[column] for column in columns}
+
+        data = {'columns': columns, 'fromDate': from_date, 'toDate': to_date, 'stationId': station}
+        response = self.session.post(self.url, data=json.dumps(data), timeout=self.timeout)
+        with self._lock:
+            self.requests += 1
+
+        if response.status_code != 200:
+            raise StiltResultError('STILT results of {} ({} - {}): status {}'.format(station, from_date,
+                                                                                    to_date, response.status_code))
+
+        values = parse_rows(response.content, len(columns))
+        result = {column: np.ascontiguousarray(values[:, i]) for i, column in enumerate(columns)}
+
+        if filename is not None:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            #saved under a temporary name first, other processes never read half a file
+            tmp_filename = '{}.{}.{}.npz'.format(filename[:-4], os.getpid(), threading.get_ident())
+            np.savez(tmp_filename, _version=np.array(repr(version)), **result)
+            os.replace(tmp_filename, filename)
+
+        return result
+
+    def timeseries(self, station, from_date, to_date, columns=None, version=None):
+
+        """
+        STILT results as DataFrame with the column 'date' (from isodate) as index.
+        Default is all columns. See fetch for version.
+        """
+
+        if columns is None:
+            columns = all_columns
+
+        result = self.fetch(station, str(from_date)[:10], str(to_date)[:10], columns, version=version)
+
+        df = pd.DataFrame(result)
+        df['date'] = pd.to_datetime(df['isodate'], unit='s')
+        df.set_index(['date'], inplace=True)
+
+        return df
+
+    def clear_cache(self):
+
+        """
+        Removes the saved responses.
+        """
+
+        if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+            return
+
+        for station in os.listdir(self.cache_dir):
+            station_dir = os.path.join(self.cache_dir, station)
+            if not os.path.isdir(station_dir):
+                continue
+            for name in os.listdir(station_dir):
+                if name.endswith('.npz'):
+                    os.remove(os.path.join(station_dir, name))
+
+    def close(self):
+
+        self.session.close()
+
+
+def parse_rows(content, ncolumns):
+
+    """
+    Parses the STILT results (JSON list of rows) into a float64 array
+    (rows, columns). null (or "null") values become nan.
+    """
+
+    rows = json.loads(content)
+
+    if len(rows) == 0:
+        return np.empty((0, ncolumns), dtype=np.float64)
+
+    try:
+        #None (JSON null) becomes nan
+        return np.array(rows, dtype=np.float64)
+    except (TypeError, ValueError):
+        #values given as strings
+        return pd.DataFrame(rows).apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
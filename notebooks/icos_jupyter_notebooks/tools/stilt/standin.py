@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+    Description:      Local stand-in for the STILT results server, for
+                      offline tests and benchmarks of the STILT result
+                      client (results.py).
+
+                      The results of a station are read from the CSV file
+                      <directory>/<station>.csv with the column 'isodate'
+                      (seconds since 1970-01-01) and any of the STILT result
+                      columns. The server answers POST requests like the
+                      STILT viewer: a JSON list of rows with the requested
+                      columns from fromDate to toDate (both days included),
+                      and status 500 for unknown stations.
+
+    Example (from the icos_jupyter_notebooks folder):
+
+        python -m tools.stilt.standin /tmp/stilt_results --synthetic HTM150 --port 8000
+
+    or in Python:
+
+        from tools.stilt import standin
+        from tools.stilt.results import StiltResultClient
+        standin.write_synthetic_results('/tmp/stilt_results', 'HTM150', '2020-01-01', '2020-12-31')
+        with standin.StandinServer('/tmp/stilt_results') as server:
+            client = StiltResultClient(url=server.url)
+            df = client.timeseries('HTM150', '2020-01-01', '2020-01-31', ['co2.bio.gee'])
+
+"""
+
+__credits__     = "ICOS Carbon Portal"
+__license__     = "GPL-3.0"
+__version__     = "0.1.0"
+__maintainer__  = "ICOS Carbon Portal, elaborated products team"
+__email__       = ['info@icos-cp.eu']
+__date__        = "2024-07-08"
+
+
+import argparse
+import json
+import os
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from .results import all_columns
+
+
+def write_synthetic_results(directory, station, start_date, end_date, columns=None, seed=0):
+
+    """
+    Writes random 3-hourly STILT results of a station to <directory>/<station>.csv.
+    Returns the path to the file.
+    """
+
+    if columns is None:
+        columns = all_columns
+
+    dates = pd.date_range(pd.Timestamp(start_date), pd.Timestamp(end_date) + pd.Timedelta(hours=21), freq='3h')
+    rng = np.random.default_rng(seed)
+
+    df = pd.DataFrame(rng.normal(size=(len(dates), len(columns))), columns=columns)
+    df['isodate'] = (dates - pd.Timestamp('1970-01-01')) // pd.Timedelta(seconds=1)
+
+    #some missing values, as in the STILT results
+    df.iloc[::97, 1:] = np.nan
+
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, station + '.csv')
+    df.to_csv(filename, index=False)
+
+    return filename
+
+
+@lru_cache(maxsize=64)
+def _read_station(filename, mtime):
+
+    df = pd.read_csv(filename)
+    return df.sort_values('isodate').reset_index(drop=True)
+
+
+def select_rows(directory, station, from_date, to_date, columns):
+
+    """
+    The rows (list of lists, nan as None) of the station file from from_date
+    to to_date, or None if there is no file for the station.
+    """
+
+    filename = os.path.join(directory, os.path.basename(station) + '.csv')
+    if not os.path.isfile(filename):
+        return None
+
+    df = _read_station(filename, os.path.getmtime(filename))
+
+    start = (pd.Timestamp(from_date) - pd.Timestamp('1970-01-01')).total_seconds()
+    end = (pd.Timestamp(to_date) + pd.Timedelta(days=1) - pd.Timestamp('1970-01-01')).total_seconds()
+    df = df[(df['isodate'] >= start) & (df['isodate'] < end)]
+
+    selected = df.reindex(columns=columns).astype(object)
+
+    return selected.where(selected.notna(), None).values.tolist()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+            rows = select_rows(self.server.directory, request['stationId'], request['fromDate'],
+                               request['toDate'], request['columns'])
+        except (ValueError, KeyError):
+            rows = None
+
+        if rows is None:
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        body = json.dumps(rows).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        #no log line per request
+        pass
+
+
+class StandinServer():
+
+    """
+    Stand-in server running in a background thread. Use as context manager,
+    or call start() and stop().
+    """
+
+    def __init__(self, directory, host='127.0.0.1', port=0):
+
+        self.directory = directory
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}/viewer/stiltresult'.format(self.host, self.port)
+
+    def start(self):
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.directory = self.directory
+        self._server.daemon_threads = True
+        #port 0: the system picks a free port
+        self.port = self._server.server_address[1]
+
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Local stand-in for the STILT results server.')
+    parser.add_argument('directory', help='directory with one <station>.csv file per station')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--synthetic', action='append', default=[],
+                        help='write random results for this station first, can be repeated')
+    parser.add_argument('--start', default='2020-01-01', help='first day of the random results')
+    parser.add_argument('--end', default='2020-12-31', help='last day of the random results')
+    args = parser.parse_args()
+
+    for i, station in enumerate(args.synthetic):
+        write_synthetic_results(args.directory, station, args.start, args.end, seed=i)
+
+    server = ThreadingHTTPServer((args.host, args.port), _Handler)
+    server.directory = args.directory
+    print('STILT results of {} at http://{}:{}/viewer/stiltresult'.format(args.directory, args.host,
+                                                                         server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()